@@ -2,10 +2,21 @@
 
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import UniqueConstraint
-from datetime import datetime, timezone
+from sqlalchemy import UniqueConstraint, event
+from datetime import datetime, timedelta, timezone
+from spatial import tile_key_for
+from db_engine import RoutingSession
 
-db = SQLAlchemy()
+# @read_only のエンドポイントの SELECT は読み込み用エンジンに回す(db_engine.py)
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# expires_at は画面の datetime-local(日本時間)をそのまま保存しているため、期限判定も日本時間で行う
+EXPIRY_TZ = timezone(timedelta(hours=9))
+
+
+def expiry_now():
+    """expires_at と比較するための現在時刻(日本時間・タイムゾーンなし)"""
+    return datetime.now(EXPIRY_TZ).replace(tzinfo=None)
 
 
 # ユーザーモデル
@@ -33,7 +44,8 @@ class Pin(db.Model):
     caution = db.Column(db.Text, nullable=True)  # 注意事項
     image_url = db.Column(db.String(300), nullable=True)  # 写真
     created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))  # 追加時間
-    expires_at = db.Column(db.DateTime(timezone=True), nullable=True)  # 表示期限
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=True, index=True)  # 表示期限
+    tile_key = db.Column(db.String(32), nullable=True)  # 空間検索用のタイルキー(quadkey)
 
     # 投稿したユーザー
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
@@ -41,6 +53,97 @@ class Pin(db.Model):
     # 将来拡張用
     # comments = db.relationship("Comment", backref="pin", lazy=True)
 
+    # bbox検索はtile_keyの範囲検索＋lat/lngの絞り込みをインデックスだけで行う
+    # 分類別一覧は category で絞ってそのまま title 順に読めるようにする
+    __table_args__ = (
+        db.Index("ix_pins_tile_key_lat_lng", "tile_key", "lat", "lng"),
+        db.Index("ix_pins_category_title", "category", "title", "id"),
+    )
+
+    @classmethod
+    def not_expired(cls):
+        """表示期限が切れていないピンの条件(ix_pins_expires_at を使う)"""
+        return db.or_(cls.expires_at.is_(None), cls.expires_at > expiry_now())
+
+
+# ピンごとの掲示板メッセージ
+class PinChat(db.Model):
+    __tablename__ = "pin_chats"
+    id = db.Column(db.Integer, primary_key=True)
+    pin_id = db.Column(db.Integer, db.ForeignKey("pins.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+    # ?after=id のページングを (pin_id, id) のインデックスだけで行う
+    __table_args__ = (db.Index("ix_pin_chats_pin_id_id", "pin_id", "id"),)
+
+
+# 期限切れでアーカイブしたピン(maintenance.py で pins から移す)
+class ArchivedPin(db.Model):
+    __tablename__ = "archived_pins"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # 元の pins.id(SQLite は消したピンの ID を新しいピンに使い回すので、同じ値が何度も入ることがある)
+    original_pin_id = db.Column(db.Integer, nullable=False, index=True)
+    lat = db.Column(db.Float, nullable=False)
+    lng = db.Column(db.Float, nullable=False)
+    title = db.Column(db.String(30), nullable=False)
+    category = db.Column(db.Integer, nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    caution = db.Column(db.Text, nullable=True)
+    image_url = db.Column(db.String(300), nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True))
+    expires_at = db.Column(db.DateTime(timezone=True))
+    user_id = db.Column(db.Integer, nullable=False)
+    archived_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+
+# 座標が決まったらtile_keyを自動で付与する
+@event.listens_for(Pin, "before_insert")
+@event.listens_for(Pin, "before_update")
+def _set_pin_tile_key(mapper, connection, target):
+    if target.lat is not None and target.lng is not None:
+        target.tile_key = tile_key_for(target.lat, target.lng)
+
+
+# ピンの変更履歴。id を差分同期のカーソルとして使う(pin_sync.py)
+class PinChange(db.Model):
+    __tablename__ = "pin_changes"
+    id = db.Column(db.Integer, primary_key=True)
+    pin_id = db.Column(db.Integer, nullable=False)  # 削除後も残すので外部キーにしない
+    op = db.Column(db.String(10), nullable=False)  # "upsert" または "delete"
+    changed_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+
+def _record_pin_change(connection, pin_id, op):
+    connection.execute(
+        PinChange.__table__.insert().values(pin_id=pin_id, op=op, changed_at=datetime.now(timezone.utc))
+    )
+
+
+# ピンの追加・更新・削除を同じトランザクションで変更履歴に書く
+@event.listens_for(Pin, "after_insert")
+@event.listens_for(Pin, "after_update")
+def _log_pin_upsert(mapper, connection, target):
+    _record_pin_change(connection, target.id, "upsert")
+
+
+@event.listens_for(Pin, "after_delete")
+def _log_pin_delete(mapper, connection, target):
+    _record_pin_change(connection, target.id, "delete")
+
+
+# ズームアウト表示用のピン集計(タイル×分類ごと)。clusters.py で更新する
+class PinCluster(db.Model):
+    __tablename__ = "pin_clusters"
+    zoom = db.Column(db.Integer, primary_key=True)  # タイルのズーム
+    quadkey = db.Column(db.String(32), primary_key=True)  # タイル(= tile_key の先頭 zoom 文字)
+    category = db.Column(db.Integer, primary_key=True)  # ピンの分類
+    count = db.Column(db.Integer, nullable=False, default=0)  # ピン数
+    lat_sum = db.Column(db.Float, nullable=False, default=0.0)  # 重心計算用の緯度合計
+    lng_sum = db.Column(db.Float, nullable=False, default=0.0)  # 重心計算用の経度合計
+
 
 # 「旅路をつくる」でルートに登録するデータ
 class Route(db.Model):
@@ -52,9 +155,22 @@ class Route(db.Model):
     created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
 
+    # 一覧用の要約(登録時に route_summary.py で作る)
+    stop_count = db.Column(db.Integer, nullable=True)  # 経由ピン数
+    min_lat = db.Column(db.Float, nullable=True)  # 経由ピンの範囲
+    min_lng = db.Column(db.Float, nullable=True)
+    max_lat = db.Column(db.Float, nullable=True)
+    max_lng = db.Column(db.Float, nullable=True)
+    length_m = db.Column(db.Float, nullable=True)  # 経由ピン間の直線距離の合計(m)
+    category_counts = db.Column(db.JSON, nullable=True)  # 分類ごとの経由ピン数 {"分類": 件数}
+    thumbnail_url = db.Column(db.String(300), nullable=True)  # 表紙のサムネイル(旧形式の画像なら None)
+
     # ルートに紐づくピン
     route_pins = db.relationship("RoutePin", backref="route", lazy=True)
 
+    # 一覧のキーセットページングを (name, id) のインデックスだけで行う
+    __table_args__ = (db.Index("ix_routes_name_id", "name", "id"),)
+
 
 class RoutePin(db.Model):
     __tablename__ = "route_pins"
@@ -65,3 +181,6 @@ class RoutePin(db.Model):
 
     # 追加：RoutePin → Pin のリレーション
     pin = db.relationship("Pin", backref="route_pins", lazy=True)
+
+    # 旅路ごとのピンを order 順にインデックスだけで読む
+    __table_args__ = (db.Index("ix_route_pins_route_id_order", "route_id", "order"),)
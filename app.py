@@ -1,67 +1,117 @@
 # アプリ本体のファイルです。
+# create_app() でアプリを作ります。flask コマンドは FLASK_APP=app.py で create_app を自動で呼び、
+# gunicorn は gunicorn.conf.py の設定(app:create_app() を --preload で読み込み)で起動します。
 
 import os
 from flask import Flask
 from flask_migrate import Migrate
-from flask_session import Session
 from flask_login import LoginManager
 from config import Config, INSTANCE_DIR
-from SQLAlchemy_models import db, User
+from SQLAlchemy_models import db
+from db_engine import init_engines, engine_binds
+from metrics import init_metrics
 from extensions import oauth
+from oidc import oidc_cache, CachedOIDCApp
+from session_store import init_session
+from user_cache import user_cache, load_cached_user
 from google_oauth import auth_bp
-from routes import routes_bp, api_bp
+from images import UploadRequest
+from routes import routes_bp, api_bp, MIN_LAT, MAX_LAT, MIN_LNG, MAX_LNG
+from pin_chat import chat_bp, stream_limiter
+from chat_broker import init_broker
+from pin_search import include_object
+from walking import init_walk_graph
+from geocoding import init_geocoder
+from cli import pins_cli, images_cli, walk_cli
+from maintenance import start_purge_timer
 
 
-# def create_app():
-app = Flask(__name__)
-app.config.from_object(Config)
+def create_app(config_object=Config):
+    app = Flask(__name__)
+    app.config.from_object(config_object)
 
-# instance ディレクトリがなければ必ず作成
-os.makedirs(INSTANCE_DIR, exist_ok=True)
+    # アップロード画像は受信しながら検証・ハッシュ計算する
+    app.request_class = UploadRequest
 
-# DBの初期化
-db.init_app(app)
-# CLIからテーブル管理
-Migrate(app, db)
-"""
-新しいカラムを追加したい場合
-flask db migrate -m "add カラム名 to user"
-flask db upgrade
-"""
+    # instance ディレクトリがなければ必ず作成
+    os.makedirs(INSTANCE_DIR, exist_ok=True)
 
-# OAuthとFlask接続
-oauth.init_app(app)
+    # DBの初期化(READ_DATABASE_URL があれば読み込み用エンジンも作る)
+    app.config["SQLALCHEMY_BINDS"] = engine_binds(app.config)
+    db.init_app(app)
+    # SQLite の WAL などの接続設定と、fork 後の接続の作り直し
+    init_engines(app, db)
+    # エンドポイントごとの処理時間・SQL 数の計測と /metrics(METRICS_ENABLED で切り替え)
+    init_metrics(app, db)
+    # CLIからテーブル管理(全文検索の FTS5 テーブルはモデルにないので比較対象から外す)
+    Migrate(app, db, include_object=include_object)
+    """
+    新しいカラムを追加したい場合
+    flask db migrate -m "add カラム名 to user"
+    flask db upgrade
+    """
 
-# googleクライアント情報登録
-oauth.register(
-    name="google",
-    client_id=app.config["GOOGLE_CLIENT_ID"],
-    client_secret=app.config["GOOGLE_CLIENT_SECRET"],
-    server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
-    client_kwargs={"scope": "openid email profile"},
-)
+    # OAuthとFlask接続
+    oauth.init_app(app)
 
-# Flask-Sessionの初期化
-os.makedirs(app.config["SESSION_FILE_DIR"], exist_ok=True)
-Session(app)
+    # ディスカバリー文書と署名鍵のキャッシュ(OIDC_CACHE_PATH に保存して再起動後も使う)
+    oidc_cache.configure(app.config["OIDC_CACHE_PATH"], app.config["OIDC_METADATA_TTL"])
 
-# Flask-Login 初期化
-login_manager = LoginManager(app)
-login_manager.login_view = "routes.welcome"
+    # googleクライアント情報登録
+    oauth.register(
+        name="google",
+        client_id=app.config["GOOGLE_CLIENT_ID"],
+        client_secret=app.config["GOOGLE_CLIENT_SECRET"],
+        server_metadata_url=app.config["GOOGLE_DISCOVERY_URL"],
+        client_kwargs={"scope": "openid email profile"},
+        client_cls=CachedOIDCApp,
+    )
 
-@login_manager.user_loader
-def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    # セッションの保存先の初期化(SESSION_TYPE で選ぶ)
+    os.makedirs(app.config["SESSION_FILE_DIR"], exist_ok=True)
+    init_session(app)
 
-# Blueprintの登録
-app.register_blueprint(auth_bp)
-app.register_blueprint(routes_bp)
-app.register_blueprint(api_bp, url_prefix="/api")
+    # Flask-Login 初期化
+    login_manager = LoginManager(app)
+    login_manager.login_view = "routes.welcome"
 
-    # return app
+    # ログインユーザーはキャッシュから読む(USER_CACHE_TTL 秒ごとに DB から読み直す)
+    user_cache.configure(app.config["USER_CACHE_SIZE"], app.config["USER_CACHE_TTL"])
+
+    @login_manager.user_loader
+    def load_user(user_id):
+        return load_cached_user(user_id)
+
+    # Blueprintの登録
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(routes_bp)
+    app.register_blueprint(api_bp, url_prefix="/api")
+    app.register_blueprint(chat_bp, url_prefix="/api")
+
+    # 掲示板の新着配信(CHAT_BROKER_CLASS で差し替え可能)と、同時に待てる SSE・ロングポーリングの数
+    init_broker(app)
+    stream_limiter.configure(app.config["CHAT_MAX_STREAMS"])
+
+    # 徒歩経路の地図データを起動時に1回だけ読み込む(--preload ならワーカー間で共有される)
+    init_walk_graph(app)
+
+    # 住所検索・逆ジオコーディング用の住所データ(地域範囲内だけ)とキャッシュ
+    init_geocoder(app, (MIN_LAT, MAX_LAT, MIN_LNG, MAX_LNG))
+
+    # flask pins ... / flask images ... / flask walk ... コマンドの登録
+    app.cli.add_command(pins_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(walk_cli)
+
+    # 期限切れピンの定期アーカイブと古い変更履歴の削除(PIN_PURGE_INTERVAL > 0 のときだけ)
+    # --preload ではスレッドは fork 先に引き継がれないので、親プロセスの1本だけが動く
+    if app.config["PIN_PURGE_INTERVAL"] > 0:
+        start_purge_timer(app, app.config["PIN_PURGE_INTERVAL"])
+
+    return app
 
 
 if __name__ == "__main__":
-    # app = create_app()
+    app = create_app()
     port = int(os.environ.get("PORT", 10000))
     app.run(host="0.0.0.0", port=port)
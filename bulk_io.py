@@ -0,0 +1,373 @@
+# ピン・旅路の一括取り込みと書き出し(flask pins import / flask pins export)用ファイルです。
+# GeoJSON(pyogrio)・CSV(pandas)を chunk_size 件ずつ読み、地域範囲などの検証は列ごとにまとめて判定し、
+# 1チャンク1トランザクションの executemany で登録します。
+# ORM のイベントを通らないので、tile_key・変更履歴(pin_changes)・ピン集計(pin_clusters)もここで書きます
+# (全文検索の pins_fts はトリガーで更新されます)。
+# 書き出しは yield_per で少しずつ読みながら1件ずつ書くので、テーブル全体をメモリに載せません。
+
+import csv
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from SQLAlchemy_models import db, Pin, PinChange, Route, RoutePin, User
+from clusters import add_pins_to_clusters
+from pin_cache import pins_cache, encode_json
+from pin_nearby import pin_index
+from route_summary import update_route_summaries
+from routes import MIN_LAT, MAX_LAT, MIN_LNG, MAX_LNG
+from spatial import tile_keys_for
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# IN 句1回に渡す ID の数(SQLite のバインド変数の上限より小さくする)
+_IN_BATCH = 900
+
+# 書き出す列(GeoJSON では lat・lng を座標に、それ以外を properties にする)
+PIN_EXPORT_COLUMNS = (
+    "id", "lat", "lng", "title", "category", "description", "caution",
+    "image_url", "created_at", "expires_at", "user_id",
+)
+ROUTE_EXPORT_COLUMNS = ("id", "name", "description", "image_url", "created_at", "user_id")
+
+GEOJSON_EXTENSIONS = (".geojson", ".json", ".geojsonl", ".geojsons")
+
+
+def file_format(path):
+    """拡張子から "geojson" または "csv" を決める"""
+    return "geojson" if os.path.splitext(path)[1].lower() in GEOJSON_EXTENSIONS else "csv"
+
+
+def read_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """GeoJSON・CSV を chunk_size 行ずつの DataFrame にして返す(GeoJSON の点の座標は lat・lng 列にする)"""
+    if file_format(path) == "csv":
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False, na_values=[""])
+        return
+
+    import pyogrio
+    import shapely
+
+    # open_arrow はファイルを先頭から1回だけ読み、batch_size 件ずつの Arrow のバッチを返す
+    with pyogrio.open_arrow(path, batch_size=chunk_size, use_pyarrow=True) as (meta, reader):
+        geometry_name = meta["geometry_name"] or "wkb_geometry"
+        for batch in reader:
+            df = batch.to_pandas()
+            geometry = shapely.from_wkb(df.pop(geometry_name)) if geometry_name in df else None
+            if geometry is not None and "lat" not in df and "lng" not in df:
+                # 点以外(旅路の線など)は NaN になる
+                df["lng"] = shapely.get_x(geometry)
+                df["lat"] = shapely.get_y(geometry)
+            yield df
+
+
+def _column(df, name):
+    return df[name] if name in df else pd.Series(None, index=df.index, dtype=object)
+
+
+def _text(df, name):
+    return _column(df, name).fillna("").astype(str).str.strip()
+
+
+def _optional_text(df, name):
+    text = _text(df, name)
+    return text.mask(text == "")
+
+
+def _number(df, name):
+    return pd.to_numeric(_column(df, name), errors="coerce")
+
+
+def _datetime(df, name, tz="Asia/Tokyo"):
+    """日時の列をタイムゾーンなしの tz の時刻にする(不正な値は NaT)。
+    expires_at は日本時間、created_at はモデルの既定値と同じ UTC で持つ"""
+    values = pd.to_datetime(_column(df, name), errors="coerce", format="ISO8601")
+    if getattr(values.dt, "tz", None) is not None:
+        values = values.dt.tz_convert(tz).dt.tz_localize(None)
+    return values
+
+
+def _created_at(df):
+    """created_at 列を UTC にする(タイムゾーンのない値は UTC とみなし、ない値は今)。列ごとないときはモデルの既定値に任せる"""
+    return _datetime(df, "created_at", tz="UTC").fillna(pd.Timestamp(datetime.now(timezone.utc).replace(tzinfo=None)))
+
+
+def _existing_ids(column, ids):
+    """ids のうち DB に存在するものの集合(IN 句を _IN_BATCH 件ずつに分けて問い合わせる)"""
+    ids = sorted({int(i) for i in ids})
+    found = set()
+    for start in range(0, len(ids), _IN_BATCH):
+        batch = ids[start:start + _IN_BATCH]
+        found.update(db.session.execute(db.select(column).where(column.in_(batch))).scalars())
+    return found
+
+
+def _records(df):
+    """DataFrame を executemany 用の dict のリストにする(NaN・NaT は None)"""
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict("records")
+
+
+def _user_ids(df, default_user_id):
+    user_id = _number(df, "user_id")
+    if default_user_id is not None:
+        user_id = user_id.fillna(default_user_id)
+    return user_id
+
+
+def validate_pins(df, default_user_id=None, keep_ids=False):
+    """ピンの行を検証し、(登録する列だけの DataFrame, 除外した行数) を返す"""
+    lat, lng = _number(df, "lat"), _number(df, "lng")
+    title, description = _text(df, "title"), _text(df, "description")
+    category = _number(df, "category")
+    user_id = _user_ids(df, default_user_id)
+
+    valid = (
+        lat.between(MIN_LAT, MAX_LAT)
+        & lng.between(MIN_LNG, MAX_LNG)
+        & title.str.len().between(1, 30)
+        & category.between(1, 12)
+        & (category % 1 == 0)
+        & (description.str.len() > 0)
+        & user_id.notna()
+    )
+    if valid.any():
+        valid &= user_id.isin(_existing_ids(User.id, user_id[valid]))
+
+    out = pd.DataFrame(
+        {
+            "lat": lat,
+            "lng": lng,
+            "title": title,
+            "category": category,
+            "description": description,
+            "caution": _optional_text(df, "caution"),
+            "image_url": _optional_text(df, "image_url"),
+            "expires_at": _datetime(df, "expires_at"),
+            "user_id": user_id,
+        }
+    )
+    # created_at がなければモデルの既定値(登録時刻)にする
+    if "created_at" in df:
+        out["created_at"] = _created_at(df)
+    if keep_ids:
+        pin_id = _number(df, "id")
+        valid &= pin_id.notna()
+        if valid.any():
+            # 既にある ID は上書きしない
+            valid &= ~pin_id.isin(_existing_ids(Pin.id, pin_id[valid]))
+        out.insert(0, "id", pin_id)
+
+    integers = ("category", "user_id") + (("id",) if keep_ids else ())
+    return out[valid].astype({c: np.int64 for c in integers}), int((~valid).sum())
+
+
+def insert_pins(df):
+    """検証済みのピンを1トランザクションで登録し、件数を返す"""
+    if df.empty:
+        return 0
+    df = df.assign(tile_key=tile_keys_for(df["lat"].to_numpy(), df["lng"].to_numpy()))
+    ids = db.session.execute(
+        db.insert(Pin).returning(Pin.id, sort_by_parameter_order=True), _records(df)
+    ).scalars().all()
+
+    changed_at = datetime.now(timezone.utc)
+    db.session.execute(db.insert(PinChange), [{"pin_id": i, "op": "upsert", "changed_at": changed_at} for i in ids])
+    add_pins_to_clusters(list(df.itertuples(index=False)))
+    db.session.commit()
+    return len(ids)
+
+
+def import_pins(path, default_user_id=None, chunk_size=DEFAULT_CHUNK_SIZE, keep_ids=False, progress=None):
+    """ファイルのピンを chunk_size 件ずつ登録し、(登録件数, 除外件数) を返す"""
+    added = skipped = 0
+    try:
+        for chunk in read_chunks(path, chunk_size):
+            rows, invalid = validate_pins(chunk, default_user_id, keep_ids)
+            added += insert_pins(rows)
+            skipped += invalid
+            if progress:
+                progress(added, skipped)
+    finally:
+        if added:
+            pins_cache.invalidate()
+            pin_index.refresh()
+    return added, skipped
+
+
+def _pin_id_list(value):
+    """経由ピンの列("1;2;3"・JSON の配列文字列・配列)を int のリストにする。不正なら None"""
+    try:
+        if isinstance(value, str):
+            value = value.strip()
+            items = json.loads(value) if value.startswith("[") else value.split(";")
+        elif value is None or (isinstance(value, float) and np.isnan(value)):
+            return None
+        else:
+            items = list(value)
+        ids = [int(i) for i in items]
+    except (ValueError, TypeError):
+        return None
+    return ids or None
+
+
+def validate_routes(df, default_user_id=None, keep_ids=False):
+    """旅路の行を検証し、(登録する列だけの DataFrame, 除外した行数) を返す(pin_ids 列は int のリスト)"""
+    name, description, image_url = _text(df, "name"), _text(df, "description"), _text(df, "image_url")
+    user_id = _user_ids(df, default_user_id)
+    pin_ids = _column(df, "pin_ids").map(_pin_id_list)
+
+    valid = (
+        name.str.len().between(1, 100)
+        & (description.str.len() > 0)
+        & (image_url.str.len() > 0)
+        & user_id.notna()
+        & pin_ids.notna()
+    )
+    if valid.any():
+        valid &= user_id.isin(_existing_ids(User.id, user_id[valid]))
+    if valid.any():
+        known = _existing_ids(Pin.id, (i for ids in pin_ids[valid] for i in ids))
+        valid &= pin_ids.map(lambda ids: ids is not None and known.issuperset(ids))
+
+    out = pd.DataFrame(
+        {"name": name, "description": description, "image_url": image_url, "user_id": user_id, "pin_ids": pin_ids}
+    )
+    if "created_at" in df:
+        out["created_at"] = _created_at(df)
+    if keep_ids:
+        route_id = _number(df, "id")
+        valid &= route_id.notna()
+        if valid.any():
+            valid &= ~route_id.isin(_existing_ids(Route.id, route_id[valid]))
+        out.insert(0, "id", route_id)
+
+    integers = ("user_id",) + (("id",) if keep_ids else ())
+    return out[valid].astype({c: np.int64 for c in integers}), int((~valid).sum())
+
+
+def insert_routes(df):
+    """検証済みの旅路と経由ピン・一覧用の要約を1トランザクションで登録し、件数を返す"""
+    if df.empty:
+        return 0
+    ids = db.session.execute(
+        db.insert(Route).returning(Route.id, sort_by_parameter_order=True), _records(df.drop(columns="pin_ids"))
+    ).scalars().all()
+    db.session.execute(
+        db.insert(RoutePin),
+        [
+            {"route_id": route_id, "pin_id": pin_id, "order": order}
+            for route_id, pin_ids in zip(ids, df["pin_ids"])
+            for order, pin_id in enumerate(pin_ids)
+        ],
+    )
+    update_route_summaries(ids)
+    db.session.commit()
+    return len(ids)
+
+
+def import_routes(path, default_user_id=None, chunk_size=DEFAULT_CHUNK_SIZE, keep_ids=False, progress=None):
+    """ファイルの旅路を chunk_size 件ずつ登録し、(登録件数, 除外件数) を返す。経由ピンは先に登録しておく"""
+    added = skipped = 0
+    for chunk in read_chunks(path, chunk_size):
+        rows, invalid = validate_routes(chunk, default_user_id, keep_ids)
+        added += insert_routes(rows)
+        skipped += invalid
+        if progress:
+            progress(added, skipped)
+    return added, skipped
+
+
+class _GeoJSONWriter:
+    """FeatureCollection を1件ずつ書き出す"""
+
+    def __init__(self, out):
+        self.out = out
+        self.count = 0
+
+    def __enter__(self):
+        self.out.write('{"type":"FeatureCollection","features":[\n')
+        return self
+
+    def write(self, geometry, properties):
+        feature = {"type": "Feature", "geometry": geometry, "properties": properties}
+        self.out.write(("," if self.count else "") + encode_json(feature).decode() + "\n")
+        self.count += 1
+
+    def __exit__(self, *exc):
+        self.out.write("]}\n")
+
+
+def export_pins(out, fmt="geojson", chunk_size=DEFAULT_CHUNK_SIZE, include_expired=False):
+    """ピンを id 順に out へ書き出し、件数を返す"""
+    query = db.select(*[getattr(Pin, c) for c in PIN_EXPORT_COLUMNS]).order_by(Pin.id)
+    if not include_expired:
+        query = query.where(Pin.not_expired())
+    rows = db.session.execute(query.execution_options(yield_per=chunk_size))
+
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(PIN_EXPORT_COLUMNS)
+        count = 0
+        for row in rows:
+            writer.writerow(_csv_value(v) for v in row)
+            count += 1
+        return count
+
+    with _GeoJSONWriter(out) as writer:
+        for row in rows:
+            properties = row._asdict()
+            lat, lng = properties.pop("lat"), properties.pop("lng")
+            writer.write({"type": "Point", "coordinates": [lng, lat]}, properties)
+    return writer.count
+
+
+def export_routes(out, fmt="geojson", chunk_size=DEFAULT_CHUNK_SIZE):
+    """旅路を id 順に out へ書き出し、件数を返す。GeoJSON では経由ピンを結んだ線にする"""
+    query = db.select(*[getattr(Route, c) for c in ROUTE_EXPORT_COLUMNS]).order_by(Route.id)
+    partitions = db.session.execute(query.execution_options(yield_per=chunk_size)).partitions()
+
+    def with_stops():
+        # chunk_size 件の旅路ごとに、経由ピンを _IN_BATCH 件ずつの JOIN でまとめて読む
+        for routes in partitions:
+            stops = {}
+            for start in range(0, len(routes), _IN_BATCH):
+                batch = [route.id for route in routes[start:start + _IN_BATCH]]
+                for r in db.session.execute(
+                    db.select(RoutePin.route_id, RoutePin.pin_id, Pin.lat, Pin.lng)
+                    .join(Pin, Pin.id == RoutePin.pin_id)
+                    .where(RoutePin.route_id.in_(batch))
+                    .order_by(RoutePin.route_id, RoutePin.order)
+                ):
+                    stops.setdefault(r.route_id, []).append(r)
+            for route in routes:
+                yield route, stops.get(route.id, [])
+
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(ROUTE_EXPORT_COLUMNS + ("pin_ids",))
+        count = 0
+        for route, stops in with_stops():
+            writer.writerow([_csv_value(v) for v in route] + [_pin_id_text(stops)])
+            count += 1
+        return count
+
+    with _GeoJSONWriter(out) as writer:
+        for route, stops in with_stops():
+            # 配列の properties は読み込み側(pyogrio)で落ちるので CSV と同じ "1;2;3" にする
+            properties = dict(route._asdict(), pin_ids=_pin_id_text(stops))
+            writer.write({"type": "LineString", "coordinates": [[s.lng, s.lat] for s in stops]}, properties)
+    return writer.count
+
+
+def _pin_id_text(stops):
+    return ";".join(str(s.pin_id) for s in stops)
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
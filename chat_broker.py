@@ -0,0 +1,151 @@
+# ピン掲示板の新着メッセージ配信(pub/sub)用ファイルです。
+# 投稿をコミットしたら publish し、SSE・ロングポーリングで待っている閲覧者へ直接届けます。
+# 待っている間は DB を読みません。
+# 既定の LocalBroker は同じプロセス内だけで配信するので、複数ワーカーで動かす場合は
+# CHAT_BROKER_CLASS に chat_broker:RedisBroker(CHAT_REDIS_URL の pub/sub 経由で全ワーカーに配信)か、
+# 同じ publish / subscribe を持つクラスを指定します。
+# 受信キューがあふれた購読は overflowed にして配信を止めます。SSE はそこで切れ、
+# ブラウザが Last-Event-ID 付きで再接続して、取りこぼした分を DB から読み直します。
+
+import json
+import os
+import queue
+import threading
+from importlib import import_module
+
+
+class Subscription:
+    """1人の閲覧者の受信キュー"""
+
+    def __init__(self, broker, channel, maxsize=100):
+        self.broker = broker
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=maxsize)
+        # キューがあふれて配信が止まった(以降のメッセージは届かない)
+        self.overflowed = False
+
+    def get(self, timeout=None):
+        """次のメッセージを返す。timeout 秒来なければ None(overflowed なら待たずに None)"""
+        try:
+            if self.overflowed:
+                return self.queue.get_nowait()
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LocalBroker:
+    """プロセス内の pub/sub"""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls()
+
+    def subscribe(self, channel):
+        sub = Subscription(self, channel)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.channel)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.channel]
+
+    def publish(self, channel, message):
+        with self._lock:
+            subs = list(self._subscribers.get(channel, ()))
+        for sub in subs:
+            try:
+                sub.queue.put_nowait(message)
+            except queue.Full:
+                # 受け取れていない閲覧者への配信を止める。キューに残った分を送った後に
+                # 接続を切り、再接続時に after(Last-Event-ID)から DB で取り直してもらう
+                sub.overflowed = True
+                self.unsubscribe(sub)
+
+
+class RedisBroker:
+    """Redis の pub/sub で全ワーカーに配信する
+
+    プロセスごとに1本の接続で prefix 付きのチャンネルをまとめて購読し、受け取ったメッセージを
+    LocalBroker と同じ受信キューに配る。購読用のスレッドは fork 後のプロセスで最初に購読したときに起動する。
+    """
+
+    def __init__(self, url, prefix="hosomichi:"):
+        import redis
+
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+        self._local = LocalBroker()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["CHAT_REDIS_URL"])
+
+    def _handle(self, message):
+        channel = message["channel"]
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        self._local.publish(channel[len(self.prefix):], json.loads(message["data"]))
+
+    def _ensure_listener(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(**{f"{self.prefix}*": self._handle})
+            self._thread = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+            self._pid = pid
+
+    def subscribe(self, channel):
+        self._ensure_listener()
+        sub = self._local.subscribe(channel)
+        sub.broker = self
+        return sub
+
+    def unsubscribe(self, sub):
+        self._local.unsubscribe(sub)
+
+    def publish(self, channel, message):
+        self._redis.publish(f"{self.prefix}{channel}", json.dumps(message, ensure_ascii=False))
+
+
+broker = LocalBroker()
+
+
+def init_broker(app):
+    """CHAT_BROKER_CLASS("モジュール:クラス名")が設定されていれば差し替える"""
+    global broker
+    path = app.config.get("CHAT_BROKER_CLASS")
+    if path:
+        module, name = path.split(":")
+        cls = getattr(import_module(module), name)
+        broker = cls.from_config(app.config) if hasattr(cls, "from_config") else cls()
+    return broker
+
+
+def get_broker():
+    return broker
@@ -0,0 +1,133 @@
+# flask コマンド(CLI)用ファイルです。
+# 例: flask pins rebuild-clusters / flask pins purge-expired / flask images rehash / flask walk download-graph
+#     flask pins prune-changes --days 7
+#     flask pins rebuild-route-summaries
+#     flask pins import pins.geojson --user-id 1 / flask pins export pins.geojson / flask pins export --kind routes routes.csv
+
+import os
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from SQLAlchemy_models import db, Pin, Route
+from bulk_io import DEFAULT_CHUNK_SIZE, file_format, import_pins, import_routes, export_pins, export_routes
+from clusters import rebuild_clusters
+from route_summary import rebuild_route_summaries, thumbnail_url
+from maintenance import purge_expired_pins, prune_pin_changes
+from images import HASHED_NAME, UPLOAD_FOLDER, rehash_upload
+from pin_cache import pins_cache
+from routes import MIN_LAT, MAX_LAT, MIN_LNG, MAX_LNG
+from walking import DEFAULT_GRAPH_PATH
+
+pins_cli = AppGroup("pins", help="ピンデータの管理コマンド")
+images_cli = AppGroup("images", help="アップロード画像の管理コマンド")
+walk_cli = AppGroup("walk", help="徒歩経路の地図データの管理コマンド")
+
+
+@pins_cli.command("rebuild-clusters")
+def rebuild_clusters_command():
+    """ズームアウト表示用のピン集計を作り直す"""
+    rebuild_clusters()
+    click.echo("ピン集計を再構築しました")
+
+
+@pins_cli.command("rebuild-route-summaries")
+@click.option("--batch-size", default=500, show_default=True, help="1トランザクションで更新する旅路の数")
+def rebuild_route_summaries_command(batch_size):
+    """旅路一覧用の要約(経由ピン数・範囲・長さ・分類・サムネイル)を作り直す"""
+    count = rebuild_route_summaries(batch_size=batch_size)
+    click.echo(f"{count} 件の旅路の要約を再構築しました")
+
+
+@pins_cli.command("purge-expired")
+@click.option("--batch-size", default=500, show_default=True, help="1トランザクションで移す件数")
+def purge_expired_command(batch_size):
+    """表示期限切れのピンと使われなくなった画像をアーカイブへ移す"""
+    pins, images = purge_expired_pins(batch_size=batch_size)
+    click.echo(f"ピン {pins} 件・画像 {images} 件をアーカイブしました")
+
+
+@pins_cli.command("prune-changes")
+@click.option("--days", type=int, default=None, help="残す日数(省略時は PIN_CHANGE_RETENTION_DAYS)")
+def prune_changes_command(days):
+    """保存期間を過ぎたピンの変更履歴(差分同期用)を消す"""
+    if days is None:
+        days = current_app.config["PIN_CHANGE_RETENTION_DAYS"]
+    count = prune_pin_changes(days)
+    click.echo(f"ピンの変更履歴を {count} 件削除しました")
+
+
+@pins_cli.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--kind", type=click.Choice(["pins", "routes"]), default="pins", show_default=True, help="取り込むデータ")
+@click.option("--user-id", type=int, default=None, help="user_id 列が空の行の投稿者")
+@click.option("--chunk-size", default=DEFAULT_CHUNK_SIZE, show_default=True, help="1トランザクションで登録する件数")
+@click.option("--keep-ids", is_flag=True, help="id 列の値をそのまま使う(ピンと旅路をまとめて移行するとき)")
+def import_command(path, kind, user_id, chunk_size, keep_ids):
+    """GeoJSON・CSV のピン(または旅路)をまとめて登録する。範囲外・必須項目なしの行は飛ばす"""
+    importer = import_pins if kind == "pins" else import_routes
+
+    def progress(added, skipped):
+        click.echo(f"{added} 件登録・{skipped} 件除外", err=True)
+
+    added, skipped = importer(path, user_id, chunk_size=chunk_size, keep_ids=keep_ids, progress=progress)
+    label = "ピン" if kind == "pins" else "旅路"
+    click.echo(f"{label}を {added} 件登録しました(不正な行 {skipped} 件は除外)")
+
+
+@pins_cli.command("export")
+@click.argument("path", default="-")
+@click.option("--kind", type=click.Choice(["pins", "routes"]), default="pins", show_default=True, help="書き出すデータ")
+@click.option("--format", "fmt", type=click.Choice(["geojson", "csv"]), default=None, help="省略時は拡張子で決める(標準出力は geojson)")
+@click.option("--chunk-size", default=DEFAULT_CHUNK_SIZE, show_default=True, help="DB から一度に読む件数")
+@click.option("--include-expired", is_flag=True, help="表示期限切れのピンも書き出す")
+def export_command(path, kind, fmt, chunk_size, include_expired):
+    """ピン(または旅路)を GeoJSON・CSV に少しずつ書き出す(PATH が - なら標準出力)"""
+    fmt = fmt or ("geojson" if path == "-" else file_format(path))
+    with click.open_file(path, "w", encoding="utf-8") as out:
+        if kind == "pins":
+            count = export_pins(out, fmt, chunk_size=chunk_size, include_expired=include_expired)
+        else:
+            count = export_routes(out, fmt, chunk_size=chunk_size)
+    click.echo(f"{count} 件を書き出しました", err=True)
+
+
+@images_cli.command("rehash")
+def rehash_images_command():
+    """旧形式の画像をハッシュ名に保存し直して重複をまとめ、縮小版を作る(旅路一覧のサムネイルも付け替える)"""
+    renamed = {}
+    for model in (Pin, Route):
+        for obj in model.query.filter(model.image_url.is_not(None)):
+            prefix, name = obj.image_url.rsplit("/", 1)
+            if HASHED_NAME.match(name) or not os.path.exists(os.path.join(UPLOAD_FOLDER, name)):
+                continue
+            if name not in renamed:
+                try:
+                    renamed[name] = rehash_upload(name)
+                except ValueError:
+                    click.echo(f"画像として読めないため飛ばしました: {name}")
+                    continue
+            obj.image_url = f"{prefix}/{renamed[name]}"
+            if model is Route:
+                # 一覧のサムネイルは image_url から決まるので同じトランザクションで更新する
+                obj.thumbnail_url = thumbnail_url(obj.image_url)
+    db.session.commit()
+    pins_cache.invalidate()
+
+    # 参照を付け替えた旧ファイルを削除する
+    for name in renamed:
+        os.remove(os.path.join(UPLOAD_FOLDER, name))
+    click.echo(f"{len(renamed)} 件の画像を {len(set(renamed.values()))} 件にまとめました")
+
+
+@walk_cli.command("download-graph")
+@click.option("--output", default=None, help="保存先(既定は WALK_GRAPH_PATH または instance/walk_graph.graphml)")
+def download_graph_command(output):
+    """ピンを置ける範囲の歩行者用道路網を OpenStreetMap から取得して GraphML で保存する"""
+    import osmnx
+
+    path = output or current_app.config.get("WALK_GRAPH_PATH") or DEFAULT_GRAPH_PATH
+    graph = osmnx.graph_from_bbox((MIN_LNG, MIN_LAT, MAX_LNG, MAX_LAT), network_type="walk")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    osmnx.save_graphml(graph, path)
+    click.echo(f"ノード {len(graph)} 件の道路網を {path} に保存しました(アプリの再起動で読み込まれます)")
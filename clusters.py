@@ -0,0 +1,151 @@
+# ズームアウト時のピン集約(クラスタ)用ファイルです。
+# pins.tile_key の先頭 z 文字はズーム z のタイルの quadkey になるので、
+# タイル×分類ごとの件数・座標合計を pin_clusters に持っておき、ピン追加時に加算します。
+# 集計は pins に残っている全ピン(期限切れを含む)の値で、期限切れピンはアーカイブ時に減算します。
+# 返すときに bbox 内の期限切れピンを差し引くので、アーカイブ前や旅路・掲示板から参照されて
+# 残る期限切れピンも数えません(定期アーカイブで差し引く件数を小さく保ちます)。
+
+import mercantile
+from sqlalchemy import func, or_
+from SQLAlchemy_models import db, Pin, PinCluster, expiry_now
+from spatial import TILE_ZOOM, tile_key_ranges
+
+# 集計しておくズームの範囲(地図の minZoom 12 以上)
+CLUSTER_MIN_ZOOM = 12
+CLUSTER_ZOOMS = range(CLUSTER_MIN_ZOOM, TILE_ZOOM + 1)
+
+# 地図ズーム z のとき、z+2 のタイル(画面上で約64px四方)を1クラスタにする
+CELL_ZOOM_OFFSET = 2
+
+
+def cell_zoom_for(map_zoom):
+    """地図のズームから集約に使うタイルのズームを決める"""
+    return max(CLUSTER_MIN_ZOOM, min(TILE_ZOOM, map_zoom + CELL_ZOOM_OFFSET))
+
+
+def _insert(bind):
+    # 件数の加算は競合しないよう INSERT ... ON CONFLICT DO UPDATE で行う
+    if bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(PinCluster)
+
+
+def _apply(pins, sign):
+    """ピンの追加(sign=1)・削除(sign=-1)を全ズームの集計に反映する(コミットは呼び出し側)"""
+    rows = {}
+    for pin in pins:
+        if not pin.tile_key:
+            continue
+        for zoom in CLUSTER_ZOOMS:
+            key = (zoom, pin.tile_key[:zoom], pin.category)
+            count, lat_sum, lng_sum = rows.get(key, (0, 0.0, 0.0))
+            rows[key] = (count + sign, lat_sum + sign * pin.lat, lng_sum + sign * pin.lng)
+    if not rows:
+        return
+
+    values = [
+        {"zoom": z, "quadkey": q, "category": c, "count": n, "lat_sum": la, "lng_sum": ln}
+        for (z, q, c), (n, la, ln) in rows.items()
+    ]
+    stmt = _insert(db.session.get_bind())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PinCluster.zoom, PinCluster.quadkey, PinCluster.category],
+        set_={
+            "count": PinCluster.count + stmt.excluded.count,
+            "lat_sum": PinCluster.lat_sum + stmt.excluded.lat_sum,
+            "lng_sum": PinCluster.lng_sum + stmt.excluded.lng_sum,
+        },
+    )
+    db.session.execute(stmt, values)
+    if sign < 0:
+        db.session.execute(db.delete(PinCluster).where(PinCluster.count <= 0))
+
+
+def add_pins_to_clusters(pins):
+    _apply(pins, 1)
+
+
+def remove_pins_from_clusters(pins):
+    _apply(pins, -1)
+
+
+def rebuild_clusters():
+    """pins から集計を作り直す(不整合時用)"""
+    db.session.execute(db.delete(PinCluster))
+    for zoom in CLUSTER_ZOOMS:
+        quadkey = func.substr(Pin.tile_key, 1, zoom)
+        rows = db.session.execute(
+            db.select(quadkey, Pin.category, func.count(), func.sum(Pin.lat), func.sum(Pin.lng))
+            .where(Pin.tile_key.is_not(None))
+            .group_by(quadkey, Pin.category)
+        ).all()
+        if rows:
+            db.session.execute(
+                db.insert(PinCluster),
+                [
+                    {"zoom": zoom, "quadkey": q, "category": c, "count": n, "lat_sum": la, "lng_sum": ln}
+                    for q, c, n, la, ln in rows
+                ],
+            )
+    db.session.commit()
+
+
+def query_clusters(bbox, map_zoom):
+    """bbox 内のクラスタを件数・重心・分類ごとの件数にまとめて返す"""
+    zoom = cell_zoom_for(map_zoom)
+    west, south, east, north = bbox
+    key_ranges = tile_key_ranges(bbox, max_zoom=zoom)
+    ranges = [(PinCluster.quadkey >= start) & (PinCluster.quadkey < stop) for start, stop in key_ranges]
+    rows = db.session.execute(
+        db.select(PinCluster.quadkey, PinCluster.category, PinCluster.count, PinCluster.lat_sum, PinCluster.lng_sum)
+        .where(PinCluster.zoom == zoom, or_(*ranges))
+    ).all()
+
+    # まだ pins に残っている期限切れピン(ix_pins_expires_at で絞る)を差し引く
+    quadkey = func.substr(Pin.tile_key, 1, zoom)
+    expired = db.session.execute(
+        db.select(quadkey, Pin.category, func.count(), func.sum(Pin.lat), func.sum(Pin.lng))
+        .where(
+            Pin.expires_at <= expiry_now(),
+            or_(*[(Pin.tile_key >= start) & (Pin.tile_key < stop) for start, stop in key_ranges]),
+        )
+        .group_by(quadkey, Pin.category)
+    ).all()
+    totals = {(q, c): [n, la, ln] for q, c, n, la, ln in rows}
+    for q, c, n, la, ln in expired:
+        t = totals.get((q, c))
+        if t is not None:
+            t[0] -= n
+            t[1] -= la
+            t[2] -= ln
+
+    clusters = {}
+    for (q, category), (n, lat_sum, lng_sum) in totals.items():
+        if n <= 0:
+            continue
+        c = clusters.setdefault(q, {"count": 0, "lat_sum": 0.0, "lng_sum": 0.0, "categories": {}})
+        c["count"] += n
+        c["lat_sum"] += lat_sum
+        c["lng_sum"] += lng_sum
+        c["categories"][str(category)] = n
+
+    result = []
+    for key, c in clusters.items():
+        # 覆いタイルは bbox からはみ出すので、タイル範囲が重ならないものは除く
+        b = mercantile.bounds(mercantile.quadkey_to_tile(key))
+        if b.east < west or b.west > east or b.north < south or b.south > north:
+            continue
+        result.append(
+            {
+                "key": key,
+                "zoom": zoom,
+                "count": c["count"],
+                "lat": c["lat_sum"] / c["count"],
+                "lng": c["lng_sum"] / c["count"],
+                "categories": c["categories"],
+                "bounds": [b.west, b.south, b.east, b.north],
+            }
+        )
+    return result
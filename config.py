@@ -10,8 +10,8 @@ load_dotenv()
 # プロジェクトの絶対パス
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
-# instance ディレクトリと DB ファイルの絶対パス
-INSTANCE_DIR = os.path.join(BASE_DIR, "instance")
+# instance ディレクトリと DB ファイルの絶対パス(INSTANCE_DIR で差し替え可能。テストは一時ディレクトリにする)
+INSTANCE_DIR = os.getenv("INSTANCE_DIR", os.path.join(BASE_DIR, "instance"))
 DB_PATH = os.path.join(INSTANCE_DIR, "hosomichi.db")
 
 
@@ -21,12 +21,36 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", f"sqlite:///{DB_PATH}")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # 接続プール(ワーカー1つあたり)
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    }
+    # 読み込み専用エンドポイント用の DB(未設定なら書き込みと同じエンジン)。
+    # 同じ SQLite ファイルを使う例: sqlite:///file:/path/to/hosomichi.db?mode=ro&uri=true
+    READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+    READ_ENGINE_OPTIONS = {"pool_size": int(os.getenv("DB_READ_POOL_SIZE", "10"))}
+    # SQLite の接続時の PRAGMA(db_engine.DEFAULT_SQLITE_PRAGMAS を上書き)
+    SQLITE_PRAGMAS = {}
+
+    # リクエスト・SQL の計測と /metrics の公開(既定は無効)、ログに出す遅い SQL の閾値(ms)。
+    # /metrics は METRICS_TOKEN の Bearer トークン付きのときだけ返す。トークンなしでサーバー自身(127.0.0.1・::1)
+    # からだけ返すのは METRICS_ALLOW_LOOPBACK=1 のとき(リバースプロキシの後ろでは外からも loopback に見えるので使わない)
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    METRICS_ALLOW_LOOPBACK = os.getenv("METRICS_ALLOW_LOOPBACK", "0") == "1"
+    SLOW_QUERY_MS = int(os.getenv("SLOW_QUERY_MS", "200"))
+
     # １週間はセッションを保持
     SESSION_PERMANENT = True
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
 
-    # ローカル用セッション保存設定。本番環境ではRadis使うべき。
-    SESSION_TYPE = "filesystem"
+    # セッションの保存先: sqlite(既定)/ memory(開発用)/ redis / filesystem(詳しくは session_store.py)
+    SESSION_TYPE = os.getenv("SESSION_TYPE", "sqlite")
+    SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", os.path.join(INSTANCE_DIR, "sessions.db"))
+    SESSION_CLEANUP_N_REQUESTS = int(os.getenv("SESSION_CLEANUP_N_REQUESTS", "1000"))
+    SESSION_MEMORY_MAX_ENTRIES = int(os.getenv("SESSION_MEMORY_MAX_ENTRIES", "10000"))
+    SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
     SESSION_FILE_DIR = os.path.join(INSTANCE_DIR, "flask_session")
     SESSION_USE_SIGNER = True
 
@@ -42,6 +66,53 @@ class Config:
         SESSION_COOKIE_SECURE = False
         SESSION_COOKIE_SAMESITE = "Lax"
 
+    # アップロード画像の上限(バイト)。フォーム全体はこれに1MBの余裕を持たせる
+    MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+    MAX_CONTENT_LENGTH = MAX_UPLOAD_BYTES + 1024 * 1024
+
+    # 期限切れピンを自動でアーカイブする間隔(秒)。0 なら自動実行しない(flask pins purge-expired を使う)。
+    # ピン集約(/api/pins/clusters)はアーカイブ前の期限切れピンを毎回差し引くので、止めると遅くなっていく
+    PIN_PURGE_INTERVAL = int(os.getenv("PIN_PURGE_INTERVAL", "3600"))
+    # ピンの変更履歴(差分同期用の pin_changes)を残す日数。アーカイブと同じタイマーで古い分を消し、
+    # それより前のカーソルで差分同期してきた画面には全件を取り直してもらう
+    PIN_CHANGE_RETENTION_DAYS = int(os.getenv("PIN_CHANGE_RETENTION_DAYS", "7"))
+
+    # 掲示板の新着配信クラス("モジュール:クラス名")。未設定ならプロセス内配信(ワーカー1つ向け)。
+    # 複数ワーカーでは chat_broker:RedisBroker にする(gunicorn.conf.py は未設定ならワーカー1つが既定で、
+    # WEB_CONCURRENCY を2以上にすると警告を出す)
+    CHAT_BROKER_CLASS = os.getenv("CHAT_BROKER_CLASS")
+    CHAT_REDIS_URL = os.getenv("CHAT_REDIS_URL", os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0"))
+    # SSE・ロングポーリングで同時に待てる接続数(ワーカーごと)。gunicorn のスレッド数より小さくして、
+    # 残りのスレッドで他のリクエストを受ける
+    CHAT_MAX_STREAMS = int(os.getenv("CHAT_MAX_STREAMS", "4"))
+
+    # 徒歩経路の地図データ(osmnx の GraphML)。未設定なら instance/walk_graph.graphml
+    WALK_GRAPH_PATH = os.getenv("WALK_GRAPH_PATH")
+    # 歩く速さ(時速 km)と、区間ごとの経路を覚えておく件数
+    WALK_SPEED_KMH = float(os.getenv("WALK_SPEED_KMH", "4.8"))
+    WALK_PATH_CACHE_SIZE = int(os.getenv("WALK_PATH_CACHE_SIZE", "4096"))
+
+    # 住所検索の住所データ(未設定なら instance/gazetteer.csv)と、外部サービスの結果のキャッシュ(保存先・件数)
+    GAZETTEER_PATH = os.getenv("GAZETTEER_PATH")
+    GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", os.path.join(INSTANCE_DIR, "geocode_cache.db"))
+    GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "100000"))
+    # 見つからなかった問い合わせをキャッシュしておく秒数
+    GEOCODE_MISS_TTL = int(os.getenv("GEOCODE_MISS_TTL", str(24 * 3600)))
+    # 住所データにないときに使う外部サービス("モジュール:クラス名")。既定の空なら使わず、画面がブラウザから問い合わせる。
+    # geocoding:ExternalProvider は Nominatim の利用規約でサイト全体で1秒に1回までになる
+    GEOCODER_FALLBACK_CLASS = os.getenv("GEOCODER_FALLBACK_CLASS", "")
+
+    # ログインユーザーのキャッシュ(件数と、DB から読み直すまでの秒数)
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+    USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+
     # Google OAuth 設定
     GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
     GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
+    # ディスカバリー文書の URL(test_tool/mock_oidc.py などローカルの模擬プロバイダーで試すときは差し替える)
+    GOOGLE_DISCOVERY_URL = os.getenv(
+        "GOOGLE_DISCOVERY_URL", "https://accounts.google.com/.well-known/openid-configuration"
+    )
+    # ディスカバリー文書・署名鍵のキャッシュの保存先(空なら保存しない)と、Cache-Control がないときの有効秒数
+    OIDC_CACHE_PATH = os.getenv("OIDC_CACHE_PATH", os.path.join(INSTANCE_DIR, "oidc_cache.json"))
+    OIDC_METADATA_TTL = int(os.getenv("OIDC_METADATA_TTL", "86400"))
@@ -0,0 +1,96 @@
+# データベース接続(エンジン)の設定用ファイルです。
+# SQLite では接続ごとに WAL・synchronous=NORMAL・mmap・busy_timeout を設定し、
+# 複数ワーカーの書き込み中でも読み込みが待たされず、ロック待ちはエラーにせず待つようにします。
+# READ_DATABASE_URL を設定すると、@read_only を付けたエンドポイントの SELECT を別のエンジン(接続プール)で実行します。
+# 同じ SQLite ファイルを指定してもよく、その場合は書き込み用の接続を読み込みで埋めずに済みます。
+
+import os
+from functools import wraps
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+READ_BIND = "read"
+
+# 接続時に設定する PRAGMA の既定値(Config.SQLITE_PRAGMAS で上書き)
+DEFAULT_SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",  # 書き込み中も読み込みを止めない
+    "synchronous": "NORMAL",  # WAL ではコミットごとの fsync を省いても壊れない
+    "busy_timeout": 5000,  # ロック中は最大5秒待つ(ms)
+    "mmap_size": 256 * 1024 * 1024,  # 読み込みをメモリマップで行う
+    "temp_store": "MEMORY",
+}
+
+
+def _is_sqlite(engine):
+    return engine.dialect.name == "sqlite"
+
+
+def configure_engine(engine, pragmas, read_only=False):
+    """エンジンの接続時に PRAGMA を実行するようにする(SQLite 以外は何もしない)"""
+    if not _is_sqlite(engine):
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        if read_only:
+            # 読み込み用の接続で誤って書き込まないようにする
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+def init_engines(app, db):
+    """db.init_app の後に呼ぶ。全エンジンに PRAGMA を設定し、fork 後に接続を作り直すようにする"""
+    pragmas = dict(DEFAULT_SQLITE_PRAGMAS, **app.config.get("SQLITE_PRAGMAS", {}))
+    with app.app_context():
+        engines = dict(db.engines)
+    for key, engine in engines.items():
+        configure_engine(engine, pragmas, read_only=(key == READ_BIND))
+
+    # gunicorn --preload などで親プロセスが作った接続を子プロセスで使わない
+    def dispose_in_child():
+        for engine in engines.values():
+            engine.dispose(close=False)
+
+    os.register_at_fork(after_in_child=dispose_in_child)
+
+
+def engine_binds(config):
+    """READ_DATABASE_URL があれば SQLALCHEMY_BINDS に読み込み用エンジンを加える"""
+    binds = dict(config.get("SQLALCHEMY_BINDS") or {})
+    url = config.get("READ_DATABASE_URL")
+    if url:
+        binds[READ_BIND] = {"url": url, **config.get("READ_ENGINE_OPTIONS", {})}
+    return binds
+
+
+def read_only(view):
+    """読み込みだけのエンドポイントに付ける。SELECT を読み込み用エンジンで実行する"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_read_engine = True
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+class RoutingSession(Session):
+    """@read_only のリクエスト中の SELECT だけを読み込み用エンジンに回すセッション"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and getattr(clause, "is_select", False)
+            and has_app_context()
+            and g.get("use_read_engine")
+        ):
+            engine = self._db.engines.get(READ_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,393 @@
+# 住所検索(ジオコーディング)と逆ジオコーディング用ファイルです。
+# 地域の住所データ(GAZETTEER_PATH の CSV)を起動時に1回だけ読み込み、
+#   ・住所 → 座標 は正規化した住所文字列の完全一致・前方一致(二分探索)・部分一致
+#   ・座標 → 住所 は格子(グリッド)のセル番号順に並べた配列の二分探索と、まとめた距離計算
+# でプロセス内だけで答えます。見つからないときだけ GEOCODER_FALLBACK_CLASS の外部サービス
+# (ExternalProvider で国土地理院・Nominatim。既定は使わない)に問い合わせ、その結果は GEOCODE_CACHE_PATH の
+# SQLite に LRU で保存して再起動後も使います(見つからなかったことは GEOCODE_MISS_TTL 秒だけ保存します)。
+# 外部サービスを使わない設定では、キャッシュも読み書きしません。
+# サーバーで見つからなければ、画面(map-init.js)がブラウザから国土地理院・Nominatim に問い合わせます。
+# 住所データは国土交通省「位置参照情報」の CSV(都道府県名・市区町村名・大字町丁目名・緯度・経度)か、
+# address・lat・lng の列を持つ CSV を置きます(地域範囲外の行は読み込みません)。
+
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict
+from importlib import import_module
+
+import numpy as np
+import requests
+from config import INSTANCE_DIR
+from spatial import EARTH_RADIUS_M, haversine_m
+
+DEFAULT_GAZETTEER_PATH = os.path.join(INSTANCE_DIR, "gazetteer.csv")
+DEFAULT_CACHE_PATH = os.path.join(INSTANCE_DIR, "geocode_cache.db")
+
+# 格子の一辺(度)。緯度方向で約 110m
+CELL_DEG = 0.001
+_N_COLS = int(round(360 / CELL_DEG))
+
+# 逆ジオコーディングで住所データの点をこれ以上遠くまでは探さない(m)
+MAX_REVERSE_METERS = 300
+
+# 逆ジオコーディングのキャッシュのキーにする座標の桁(小数4桁 ≒ 10m)
+REVERSE_KEY_DIGITS = 4
+
+# 外部サービスの通信のタイムアウト(秒)と、Nominatim の利用規約に合わせた問い合わせ間隔(秒)
+HTTP_TIMEOUT = 5
+NOMINATIM_INTERVAL = 1.0
+
+# 見つからなかった問い合わせをキャッシュしておく秒数の既定値(GEOCODE_MISS_TTL)
+DEFAULT_MISS_TTL = 24 * 3600
+
+# 位置参照情報の住所を組み立てる列
+_MLIT_ADDRESS_COLUMNS = ("都道府県名", "市区町村名", "大字町丁目名", "街区符号・地番")
+
+
+def normalize(text):
+    """住所の表記ゆれ(全角・半角、空白)をそろえる"""
+    return "".join(unicodedata.normalize("NFKC", text).split())
+
+
+class GeocoderBusy(Exception):
+    """外部サービスの問い合わせ間隔の制限で、今は問い合わせられない"""
+
+
+def _cell_keys(lat, lng):
+    rows = np.floor((np.asarray(lat) + 90) / CELL_DEG).astype(np.int64)
+    cols = np.floor((np.asarray(lng) + 180) / CELL_DEG).astype(np.int64)
+    return rows * _N_COLS + cols
+
+
+def _read_rows(path):
+    """CSV を dict の行で返す(UTF-8 で読めなければ位置参照情報の Shift_JIS として読む)"""
+    for encoding in ("utf-8-sig", "cp932"):
+        try:
+            with open(path, encoding=encoding, newline="") as f:
+                return list(csv.DictReader(f))
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"住所データの文字コードを判別できません: {path}")
+
+
+class Gazetteer:
+    """住所データ(住所・緯度・経度)の検索用インデックス"""
+
+    def __init__(self, addresses, lat, lng):
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+
+        # 逆ジオコーディング用: セル番号順
+        keys = _cell_keys(lat, lng)
+        order = np.argsort(keys, kind="stable")
+        self.keys, self.lat, self.lng = keys[order], lat[order], lng[order]
+        self.addresses = [addresses[i] for i in order]
+
+        # 住所検索用: 正規化した住所の昇順(同じ住所は最初の点だけ)
+        by_name = {}
+        for i, address in enumerate(self.addresses):
+            by_name.setdefault(normalize(address), i)
+        self.names = sorted(by_name)
+        self.name_index = [by_name[n] for n in self.names]
+
+    def __len__(self):
+        return len(self.addresses)
+
+    @classmethod
+    def load(cls, path, bounds):
+        """CSV を読み込む。bounds (min_lat, max_lat, min_lng, max_lng) の外の行は捨てる"""
+        min_lat, max_lat, min_lng, max_lng = bounds
+        addresses, lats, lngs = [], [], []
+        for row in _read_rows(path):
+            try:
+                if "緯度" in row:
+                    lat, lng = float(row["緯度"]), float(row["経度"])
+                    address = "".join(row.get(c) or "" for c in _MLIT_ADDRESS_COLUMNS[:3])
+                    if row.get(_MLIT_ADDRESS_COLUMNS[3]):
+                        address += f"{row[_MLIT_ADDRESS_COLUMNS[3]]}番"
+                else:
+                    lat, lng, address = float(row["lat"]), float(row["lng"]), row["address"]
+            except (KeyError, TypeError, ValueError):
+                continue
+            if address and min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+                addresses.append(address.strip())
+                lats.append(lat)
+                lngs.append(lng)
+        return cls(addresses, lats, lngs)
+
+    def _result(self, i, **extra):
+        return dict(address=self.addresses[i], lat=float(self.lat[i]), lng=float(self.lng[i]), source="local", **extra)
+
+    def geocode(self, query, limit=5):
+        """住所の完全一致 → 前方一致 → 部分一致の順に最大 limit 件返す"""
+        q = normalize(query)
+        if not q:
+            return []
+        found = []
+        start = bisect_left(self.names, q)
+        # 前方一致(完全一致は先頭に来る)は昇順に並んだ範囲を読むだけ
+        for j in range(start, len(self.names)):
+            if not self.names[j].startswith(q) or len(found) >= limit:
+                break
+            found.append(self.name_index[j])
+        if not found:
+            # 「平泉町平泉」のような町名途中からの入力は部分一致で探す
+            for j, name in enumerate(self.names):
+                if q in name:
+                    found.append(self.name_index[j])
+                    if len(found) >= limit:
+                        break
+        return [self._result(i) for i in found]
+
+    def reverse(self, lat, lng, max_meters=MAX_REVERSE_METERS):
+        """(lat, lng) に最も近い住所を返す。max_meters 以内になければ None"""
+        if not len(self):
+            return None
+        dlat = np.degrees(max_meters / EARTH_RADIUS_M)
+        dlng = dlat / max(np.cos(np.radians(min(abs(lat) + dlat, 89.9))), 1e-6)
+        row0, row1 = (int((v + 90) // CELL_DEG) for v in (lat - dlat, lat + dlat))
+        col0, col1 = (int((v + 180) // CELL_DEG) for v in (lng - dlng, lng + dlng))
+        rows = np.arange(row0, row1 + 1, dtype=np.int64) * _N_COLS
+        starts = np.searchsorted(self.keys, rows + col0, side="left")
+        stops = np.searchsorted(self.keys, rows + col1, side="right")
+        spans = [(a, b) for a, b in zip(starts.tolist(), stops.tolist()) if b > a]
+        if not spans:
+            return None
+        idx = np.concatenate([np.arange(a, b) for a, b in spans])
+        dist = haversine_m(lat, lng, self.lat[idx], self.lng[idx])
+        best = int(np.argmin(dist))
+        if dist[best] > max_meters:
+            return None
+        return self._result(int(idx[best]), distance_m=round(float(dist[best]), 1))
+
+
+class GeocodeCache:
+    """問い合わせ → 結果の LRU キャッシュ(プロセス内の LRU と、再起動後も残る SQLite の2段)
+
+    見つからなかった問い合わせ(None・空のリスト)は miss_ttl 秒で期限切れにする。
+    """
+
+    def __init__(self, path=None, max_entries=100000, memory_entries=4096, miss_ttl=DEFAULT_MISS_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.miss_ttl = miss_ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        if path:
+            conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+            try:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS geocode_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, used_at REAL NOT NULL, expires_at REAL) WITHOUT ROWID"
+                )
+                # expires_at がない古いキャッシュには列を足す(既存の行は期限なし)
+                if "expires_at" not in {r[1] for r in conn.execute("PRAGMA table_info(geocode_cache)")}:
+                    conn.execute("ALTER TABLE geocode_cache ADD COLUMN expires_at REAL")
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_geocode_cache_used_at ON geocode_cache (used_at)")
+            finally:
+                conn.close()
+            os.register_at_fork(after_in_child=self._forget_connections)
+
+    def _forget_connections(self):
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._memory[key] = (value, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """(見つかったか, 値) を返す。値は見つからなかった問い合わせなら None か空のリスト"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._memory.move_to_end(key)
+                    return True, value
+                del self._memory[key]
+        if not self.path:
+            return False, None
+        conn = self._connect()
+        row = conn.execute("SELECT value, expires_at FROM geocode_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return False, None
+        conn.execute("UPDATE geocode_cache SET used_at = ? WHERE key = ?", (now, key))
+        value = json.loads(row[0])
+        self._remember(key, value, row[1])
+        return True, value
+
+    def put(self, key, value):
+        now = time.time()
+        expires_at = None if value else now + self.miss_ttl
+        self._remember(key, value, expires_at)
+        if not self.path:
+            return
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO geocode_cache (key, value, used_at, expires_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, used_at = excluded.used_at, "
+            "expires_at = excluded.expires_at",
+            (key, json.dumps(value, ensure_ascii=False), now, expires_at),
+        )
+        # 件数の確認は書き込み100回に1回だけ行い、超えた分を古い順に消す
+        self._writes += 1
+        if self._writes % 100 == 0:
+            (count,) = conn.execute("SELECT count(*) FROM geocode_cache").fetchone()
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM geocode_cache WHERE key IN "
+                    "(SELECT key FROM geocode_cache ORDER BY used_at LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+
+class NullProvider:
+    """外部サービスを使わない(オフライン運用・テスト用の差し替え先)"""
+
+    def geocode(self, query, limit=5):
+        return []
+
+    def reverse(self, lat, lng):
+        return None
+
+
+class ExternalProvider:
+    """国土地理院の住所検索と Nominatim(OpenStreetMap)に問い合わせる"""
+
+    GSI_SEARCH_URL = "https://msearch.gsi.go.jp/address-search/AddressSearch"
+    NOMINATIM_URL = "https://nominatim.openstreetmap.org"
+
+    def __init__(self):
+        self.http = requests.Session()
+        # Nominatim の利用規約でアプリの識別が必要
+        self.http.headers["User-Agent"] = "hiraizumi-app geocoder"
+        self._lock = threading.Lock()
+        self._last_nominatim = 0.0
+
+    def _nominatim(self, path, params):
+        # 1秒に1回までにする。間隔が空いていなければ待たずに GeocoderBusy にする
+        # (待つと他のリクエストのスレッドまで順番待ちになる。画面はブラウザからの問い合わせに切り替える)
+        with self._lock:
+            now = time.monotonic()
+            if now < self._last_nominatim + NOMINATIM_INTERVAL:
+                raise GeocoderBusy("Nominatim の問い合わせ間隔の制限中です")
+            self._last_nominatim = now
+        resp = self.http.get(f"{self.NOMINATIM_URL}/{path}", params=params, timeout=HTTP_TIMEOUT)
+        resp.raise_for_status()
+        return resp.json()
+
+    def geocode(self, query, limit=5):
+        resp = self.http.get(self.GSI_SEARCH_URL, params={"q": query}, timeout=HTTP_TIMEOUT)
+        resp.raise_for_status()
+        results = [
+            # 国土地理院の座標は [経度, 緯度]
+            {"address": f["properties"]["title"], "lat": f["geometry"]["coordinates"][1],
+             "lng": f["geometry"]["coordinates"][0], "source": "gsi"}
+            for f in resp.json()[:limit]
+        ]
+        if results:
+            return results
+        return [
+            {"address": r["display_name"], "lat": float(r["lat"]), "lng": float(r["lon"]), "source": "nominatim"}
+            for r in self._nominatim("search", {"format": "json", "q": query, "limit": limit})
+        ]
+
+    def reverse(self, lat, lng):
+        data = self._nominatim("reverse", {"format": "jsonv2", "lat": lat, "lon": lng})
+        if not data or not data.get("display_name"):
+            return None
+        return {"address": data["display_name"], "lat": float(data["lat"]), "lng": float(data["lon"]), "source": "nominatim"}
+
+
+class Geocoder:
+    """住所データ → キャッシュ → 外部サービスの順に引く
+
+    外部サービスがない(None・NullProvider)ときはキャッシュも使わない
+    (問い合わせない結果を保存すると、住所データを入れ替えても見つからないままになる)。
+    """
+
+    def __init__(self, gazetteer=None, cache=None, fallback=None):
+        self.gazetteer = gazetteer
+        self.cache = cache or GeocodeCache()
+        self.fallback = None if isinstance(fallback, NullProvider) else fallback
+
+    def _cached(self, key, fetch):
+        if self.fallback is None:
+            return None
+        hit, value = self.cache.get(key)
+        if hit:
+            return value
+        value = fetch()
+        self.cache.put(key, value)
+        return value
+
+    def geocode(self, query, limit=5):
+        if self.gazetteer is not None:
+            results = self.gazetteer.geocode(query, limit)
+            if results:
+                return results
+        key = f"geocode:{limit}:{normalize(query)}"
+        return self._cached(key, lambda: self.fallback.geocode(query, limit)) or []
+
+    def reverse(self, lat, lng):
+        if self.gazetteer is not None:
+            result = self.gazetteer.reverse(lat, lng)
+            if result is not None:
+                return result
+        key = f"reverse:{round(lat, REVERSE_KEY_DIGITS)},{round(lng, REVERSE_KEY_DIGITS)}"
+        return self._cached(key, lambda: self.fallback.reverse(lat, lng))
+
+
+geocoder = Geocoder()
+
+
+def init_geocoder(app, bounds):
+    """住所データを読み込み、キャッシュと外部サービスを設定する(GEOCODER_FALLBACK_CLASS が空なら外部は使わない)"""
+    global geocoder
+    gazetteer = None
+    path = app.config.get("GAZETTEER_PATH") or DEFAULT_GAZETTEER_PATH
+    if os.path.exists(path):
+        gazetteer = Gazetteer.load(path, bounds)
+        app.logger.info(f"住所データを読み込みました({len(gazetteer)} 件)")
+    else:
+        app.logger.warning(f"住所データがありません: {path}(住所検索は外部サービスか画面からの問い合わせで行います)")
+
+    fallback = None
+    class_path = app.config.get("GEOCODER_FALLBACK_CLASS")
+    if class_path:
+        module, name = class_path.split(":")
+        fallback = getattr(import_module(module), name)()
+
+    cache = GeocodeCache(
+        app.config.get("GEOCODE_CACHE_PATH", DEFAULT_CACHE_PATH) or None,
+        max_entries=app.config.get("GEOCODE_CACHE_SIZE", 100000),
+        miss_ttl=app.config.get("GEOCODE_MISS_TTL", DEFAULT_MISS_TTL),
+    )
+    geocoder = Geocoder(gazetteer, cache, fallback)
+    return geocoder
+
+
+def get_geocoder():
+    return geocoder
@@ -5,6 +5,7 @@ from extensions import oauth
 from flask import Blueprint, flash, redirect, url_for, current_app
 from flask_login import login_user, logout_user, current_user
 from SQLAlchemy_models import db, User
+from user_cache import user_cache
 
 auth_bp = Blueprint("auth", __name__)
 
@@ -21,14 +22,13 @@ def login():
 @auth_bp.route("/auth/callback")
 def callback():
     try:
+        # ID トークンは Authlib が署名(キャッシュ済みの JWKS)・aud・nonce・期限を検証して userinfo に入れる。
+        # sub・email・name・picture はそこに含まれるので、userinfo エンドポイントへは通信しない
         token = oauth.google.authorize_access_token()
-        resp = oauth.google.get(
-            oauth.google.client_kwargs.get(
-                "userinfo_endpoint", "https://openidconnect.googleapis.com/v1/userinfo"
-            ),
-            token=token,
-        )
-        user_info = resp.json()
+        user_info = token.get("userinfo")
+        if user_info is None:
+            # ID トークンが返らなかった場合だけ userinfo エンドポイントから取得する
+            user_info = oauth.google.userinfo(token=token)
 
         if not user_info:
             flash("ユーザー情報を取得できませんでした。\nGoogleアカウントを確認してください。", "error")
@@ -63,6 +63,8 @@ def callback():
 
             if updated:
                 db.session.commit()
+                # キャッシュ済みの古い表示名・アイコンを捨てる
+                user_cache.invalidate(user.id)
 
         # Flask-Login でログイン状態をセット
         login_user(user)
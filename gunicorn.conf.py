@@ -0,0 +1,29 @@
+# gunicorn の設定ファイルです(gunicorn をオプションなしで起動すると読み込まれます)。
+# アプリは親プロセスで1回だけ作り(--preload)、地図データなどをワーカー間で共有します。
+# DB 接続は fork 後にワーカーごとに作り直されます(db_engine.init_engines)。
+# 掲示板の既定の配信(chat_broker.LocalBroker)はプロセス内だけで届くので、CHAT_BROKER_CLASS が
+# 未設定ならワーカーは1つにします。複数ワーカーにするには chat_broker:RedisBroker を指定してください。
+
+import os
+
+wsgi_app = "app:create_app()"
+preload_app = True
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+
+# プロセス内だけで配信するクラス(CHAT_BROKER_CLASS 未設定時の既定)
+LOCAL_BROKERS = ("", "chat_broker:LocalBroker")
+local_broker = os.environ.get("CHAT_BROKER_CLASS", "") in LOCAL_BROKERS
+workers = int(os.environ.get("WEB_CONCURRENCY", "1" if local_broker else "2"))
+# SSE・ロングポーリングの接続でワーカーが埋まらないようスレッドで受ける
+# (待てる接続は CHAT_MAX_STREAMS 本までなので、残りのスレッドで他のリクエストを受けられる)
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+timeout = 120
+
+
+def on_starting(server):
+    if workers > 1 and local_broker:
+        server.log.warning(
+            "CHAT_BROKER_CLASS が未設定(プロセス内配信)のまま WEB_CONCURRENCY=%d で起動します。"
+            "掲示板の新着は同じワーカーの閲覧者にしか届きません(chat_broker:RedisBroker を指定してください)",
+            workers,
+        )
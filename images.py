@@ -0,0 +1,311 @@
+# アップロード画像の保存・縮小版作成用ファイルです。
+# 画像は受信しながら形式確認・サイズ制限・ハッシュ計算を行い、内容のハッシュ値をファイル名にして保存するので、
+# 同じ画像を何度アップロードしても1つになります。
+# EXIF(位置情報など)は保存時に取り除き、マーカー・一覧・ポップアップ用の縮小版を別スレッドで作ります。
+# 受信中・書き込み中のファイルは公開されない instance/upload_tmp に置き、書き終えてから static/uploads に移します。
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Request, current_app
+from PIL import Image, ImageOps
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+from config import INSTANCE_DIR
+
+# 画像ファイルの設定
+UPLOAD_FOLDER = "static/uploads"
+VARIANT_FOLDER = os.path.join(UPLOAD_FOLDER, "variants")
+# 受信中・書き込み中の一時ファイルの置き場所(static の外)
+UPLOAD_TEMP_FOLDER = os.path.join(INSTANCE_DIR, "upload_tmp")
+ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg"}
+os.makedirs(VARIANT_FOLDER, exist_ok=True)
+os.makedirs(UPLOAD_TEMP_FOLDER, exist_ok=True)
+
+# 縮小版: 名前 → (一辺のピクセル数, 正方形に切り抜くか)。表示サイズの2倍で作る
+VARIANT_SIZES = {
+    "marker": (64, True),  # 地図マーカー 32px
+    "list": (112, True),  # 一覧のサムネイル 56px
+    "popup": (400, False),  # ポップアップ・詳細表示
+}
+
+# 縮小版の形式: 名前 → (拡張子, Pillowの形式, 保存オプション)
+VARIANT_FORMATS = {
+    "webp": ("webp", "WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("jpg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+# Pillowの形式 → 保存時の拡張子
+_STORED_FORMATS = {"JPEG": "jpg", "PNG": "png"}
+
+# ハッシュ値で保存した画像のファイル名(これ以外は旧形式で縮小版がない)
+HASHED_NAME = re.compile(r"^([0-9a-f]{64})\.(jpg|png)$")
+
+# 縮小版作成はリクエストを待たせないよう別スレッドで行う
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-variants")
+
+logger = logging.getLogger(__name__)
+
+
+# 先頭バイト(マジックナンバー) → 保存時の拡張子
+_MAGIC_BYTES = {b"\xff\xd8\xff": "jpg", b"\x89PNG\r\n\x1a\n": "png"}
+_MAGIC_LENGTH = max(len(m) for m in _MAGIC_BYTES)
+
+# 既定のアップロード上限(Config.MAX_UPLOAD_BYTES で上書き)
+DEFAULT_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+# ストリームの読み書き単位
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    def __init__(self, max_bytes):
+        if max_bytes >= 1024 * 1024:
+            size = f"{max_bytes // (1024 * 1024)}MB"
+        else:
+            size = f"{max_bytes // 1024}KB"
+        super().__init__(f"画像は{size}以下にしてください")
+
+
+class UnsupportedImage(UnsupportedMediaType):
+    description = "画像は png・jpg・jpeg のいずれかにしてください"
+
+
+def allowed_file(filename):
+    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+class UploadStream:
+    """受信しながら先頭バイトの確認・サイズ制限・ハッシュ計算・一時ファイルへの書き込みを1回で行う
+
+    werkzeug のフォーム解析が書き込み先として使う。不正なファイルは最初のチャンクで、
+    大きすぎるファイルは上限を超えた時点で例外を出して受信を打ち切る。
+    """
+
+    def __init__(self, folder=UPLOAD_TEMP_FOLDER, max_bytes=DEFAULT_MAX_UPLOAD_BYTES):
+        self._file = tempfile.NamedTemporaryFile(dir=folder, prefix=".upload-", suffix=".tmp", delete=False)
+        self.path = self._file.name
+        self.max_bytes = max_bytes
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.kind = None
+        self._head = b""
+        self._claimed = False
+
+    def write(self, data):
+        if self.kind is None:
+            self._head += data[: _MAGIC_LENGTH - len(self._head)]
+            if len(self._head) >= _MAGIC_LENGTH or len(data) == 0:
+                self.kind = next((ext for magic, ext in _MAGIC_BYTES.items() if self._head.startswith(magic)), None)
+                if self.kind is None:
+                    raise UnsupportedImage()
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(self.max_bytes)
+        self.sha256.update(data)
+        return self._file.write(data)
+
+    def claim(self, dest):
+        """一時ファイルを dest にそのまま移す"""
+        self._file.close()
+        _move_into(self.path, dest)
+        self._claimed = True
+
+    def close(self):
+        self._file.close()
+        if not self._claimed:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):
+        # read / seek / tell などは一時ファイルに任せる
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """アップロードファイルを UploadStream で受け取るリクエストクラス"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        max_bytes = current_app.config.get("MAX_UPLOAD_BYTES", DEFAULT_MAX_UPLOAD_BYTES)
+        stream = UploadStream(UPLOAD_TEMP_FOLDER, max_bytes)
+        # 受信途中で打ち切ると request.files に入らないので、ここで控えておいて close で消す
+        self.__dict__.setdefault("_upload_streams", []).append(stream)
+        return stream
+
+    def close(self):
+        super().close()
+        for stream in self.__dict__.pop("_upload_streams", []):
+            stream.close()
+
+
+def upload_error(e):
+    """受信中に打ち切ったアップロードの (エラーメッセージ, ステータス) を返す"""
+    if isinstance(e, RequestEntityTooLarge) and not isinstance(e, UploadTooLarge):
+        # MAX_CONTENT_LENGTH を超えて werkzeug が先に打ち切った場合
+        e = UploadTooLarge(current_app.config.get("MAX_UPLOAD_BYTES", DEFAULT_MAX_UPLOAD_BYTES))
+    return e.description, e.code
+
+
+def _spool(fileobj):
+    """通常のファイル(CLI など)を UploadStream に書き写す"""
+    stream = UploadStream(UPLOAD_TEMP_FOLDER, float("inf"))
+    try:
+        while chunk := fileobj.read(CHUNK_SIZE):
+            stream.write(chunk)
+        if stream.kind is None:
+            stream.write(b"")
+    except Exception:
+        stream.close()
+        raise
+    return stream
+
+
+def _temp_path(path):
+    # 書き込み途中のファイルは公開しない。同じ画像を同時に処理しても衝突しないようにする
+    return os.path.join(UPLOAD_TEMP_FOLDER, f"{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+
+
+def _move_into(src, dest):
+    """書き終えた一時ファイルを公開先に移す(同じファイルシステムなら原子的)"""
+    try:
+        os.replace(src, dest)
+    except OSError:
+        # instance と static が別のファイルシステムのときは、公開先のフォルダ内で名前を変えて移す
+        staging = f"{dest}.{uuid.uuid4().hex}.tmp"
+        shutil.move(src, staging)
+        os.replace(staging, dest)
+
+
+def _open_image(path):
+    """画像として読めなければ ValueError"""
+    try:
+        img = Image.open(path)
+        img.load()
+    except Exception as e:
+        raise ValueError("画像ファイルを読み込めませんでした") from e
+    if img.format not in _STORED_FORMATS:
+        raise ValueError("対応していない画像形式です")
+    return img
+
+
+# 取り除くメタデータ(Pillow の info のキー)
+_METADATA_KEYS = {"exif", "xmp", "XML:com.adobe.xmp", "photoshop", "comment"}
+
+
+def _has_metadata(img):
+    """EXIF・XMP・PNGのテキストなど、取り除くべき情報を持っているか"""
+    if _METADATA_KEYS & img.info.keys():
+        return True
+    return img.format == "PNG" and bool(img.text)
+
+
+def _save_without_metadata(img, path):
+    """向きだけ反映し、EXIF などのメタデータを付けずに保存する(色プロファイルは残す)"""
+    fmt = img.format
+    icc_profile = img.info.get("icc_profile")
+    img = ImageOps.exif_transpose(img)
+    img.info = {}
+    options = {"quality": 90} if fmt == "JPEG" else {"optimize": True}
+    if icc_profile:
+        options["icc_profile"] = icc_profile
+
+    tmp = _temp_path(path)
+    img.save(tmp, fmt, **options)
+    _move_into(tmp, path)
+
+
+def variant_filename(stem, size, fmt):
+    return f"{stem}_{size}.{VARIANT_FORMATS[fmt][0]}"
+
+
+def variant_urls(image_url):
+    """元画像の URL から縮小版の URL を作る。旧形式の画像なら None"""
+    if not image_url:
+        return None
+    prefix, name = image_url.rsplit("/", 1)
+    m = HASHED_NAME.match(name)
+    if not m:
+        return None
+    stem = m.group(1)
+    return {size: {fmt: f"{prefix}/variants/{variant_filename(stem, size, fmt)}" for fmt in VARIANT_FORMATS} for size in VARIANT_SIZES}
+
+
+def generate_variants(path):
+    """保存済みの元画像から全サイズ・全形式の縮小版を作る"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    with Image.open(path) as original:
+        original.load()
+        base = original.convert("RGBA" if original.mode in ("RGBA", "LA", "P") else "RGB")
+
+    for size, (px, square) in VARIANT_SIZES.items():
+        if square:
+            img = ImageOps.fit(base, (px, px), Image.Resampling.LANCZOS)
+        else:
+            img = base.copy()
+            img.thumbnail((px, px), Image.Resampling.LANCZOS)
+        for fmt, (ext, pil_format, options) in VARIANT_FORMATS.items():
+            out = img.convert("RGB") if pil_format == "JPEG" else img
+            dest = os.path.join(VARIANT_FOLDER, variant_filename(stem, size, fmt))
+            tmp = _temp_path(dest)
+            out.save(tmp, pil_format, **options)
+            _move_into(tmp, dest)
+
+
+def _variants_exist(stem):
+    return all(
+        os.path.exists(os.path.join(VARIANT_FOLDER, variant_filename(stem, size, fmt)))
+        for size in VARIANT_SIZES
+        for fmt in VARIANT_FORMATS
+    )
+
+
+def _log_variant_error(future):
+    if future.exception() is not None:
+        logger.error("縮小版の作成に失敗しました", exc_info=future.exception())
+
+
+def save_upload(image_file):
+    """アップロード画像を保存して static/uploads 内のファイル名を返す
+
+    同じ内容の画像が保存済みならそれを使う。メタデータがなければ受信した一時ファイルを
+    そのまま移し、あれば取り除いて保存し直す。画像でなければ ValueError。
+    """
+    stream = getattr(image_file, "stream", None)
+    if not isinstance(stream, UploadStream):
+        stream = _spool(image_file)
+    try:
+        if stream.kind is None:
+            raise ValueError("画像ファイルを読み込めませんでした")
+        digest = stream.sha256.hexdigest()
+        filename = f"{digest}.{stream.kind}"
+        path = os.path.join(UPLOAD_FOLDER, filename)
+
+        # 保存済みなら画像を読み込まずにそのまま使う
+        if not os.path.exists(path):
+            stream.flush()
+            with _open_image(stream.path) as img:
+                if _STORED_FORMATS[img.format] != stream.kind:
+                    raise ValueError("画像ファイルを読み込めませんでした")
+                if _has_metadata(img):
+                    _save_without_metadata(img, path)
+                else:
+                    stream.claim(path)
+    finally:
+        stream.close()
+
+    if not _variants_exist(digest):
+        _executor.submit(generate_variants, path).add_done_callback(_log_variant_error)
+    return filename
+
+
+def rehash_upload(filename):
+    """旧形式(タイムスタンプ名)の画像をハッシュ名で保存し直し、新しいファイル名を返す"""
+    with open(os.path.join(UPLOAD_FOLDER, filename), "rb") as f:
+        return save_upload(f)
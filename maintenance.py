@@ -0,0 +1,159 @@
+# 期限切れピンの整理(アーカイブ)用ファイルです。
+# 表示期限が切れたピンを archived_pins に移し、どこからも参照されなくなった画像を
+# instance/archive/uploads に移動します。flask pins purge-expired または定期実行タイマーから呼びます。
+# 同じタイマーで、保存期間を過ぎたピンの変更履歴(pin_changes)も消します(flask pins prune-changes)。
+
+import glob
+import os
+import shutil
+import threading
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+
+from flask import current_app
+from config import INSTANCE_DIR
+from SQLAlchemy_models import db, Pin, ArchivedPin, PinChange, PinChat, Route, RoutePin, expiry_now
+from clusters import remove_pins_from_clusters
+from pin_cache import pins_cache
+from images import UPLOAD_FOLDER, VARIANT_FOLDER
+
+ARCHIVE_UPLOAD_FOLDER = os.path.join(INSTANCE_DIR, "archive", "uploads")
+
+# アーカイブ時にコピーする列(pins.id は original_pin_id に入れる)
+_PIN_COLUMNS = ("lat", "lng", "title", "category", "description", "caution", "image_url", "created_at", "expires_at", "user_id")
+
+
+def _upload_filename(image_url):
+    """image_url(…/static/uploads/<ファイル名>)からファイル名を取り出す"""
+    path = urlparse(image_url).path
+    if "/uploads/" not in path:
+        return None
+    return path.rsplit("/", 1)[1]
+
+
+def _archive_images(image_urls, upload_folder):
+    """ピン・旅路のどちらからも参照されていない画像をアーカイブ先へ移す"""
+    if not image_urls:
+        return 0
+    still_used = set(db.session.execute(db.select(Pin.image_url).where(Pin.image_url.in_(image_urls))).scalars())
+    still_used.update(db.session.execute(db.select(Route.image_url).where(Route.image_url.in_(image_urls))).scalars())
+
+    moved = 0
+    os.makedirs(ARCHIVE_UPLOAD_FOLDER, exist_ok=True)
+    for url in set(image_urls) - still_used:
+        filename = _upload_filename(url)
+        src = os.path.join(upload_folder, filename) if filename else None
+        if src and os.path.exists(src):
+            shutil.move(src, os.path.join(ARCHIVE_UPLOAD_FOLDER, filename))
+            moved += 1
+            # 縮小版は作り直せるので削除する
+            stem = os.path.splitext(filename)[0]
+            for variant in glob.glob(os.path.join(VARIANT_FOLDER, f"{stem}_*")):
+                os.remove(variant)
+    return moved
+
+
+def purge_expired_pins(batch_size=500, upload_folder=UPLOAD_FOLDER):
+    """期限切れピンを batch_size 件ずつ archived_pins に移す。移した件数と画像数を返す
+
+    旅路(route_pins)・掲示板(pin_chats)から参照されているピンは壊れないよう残す(一覧には表示されない)。
+    """
+    total_pins = total_images = 0
+    referenced = db.select(RoutePin.pin_id).union(db.select(PinChat.pin_id))
+    while True:
+        now = expiry_now()
+        pins = (
+            Pin.query.filter(Pin.expires_at <= now, Pin.id.not_in(referenced))
+            .order_by(Pin.expires_at)
+            .limit(batch_size)
+            .all()
+        )
+        if not pins:
+            break
+
+        ids = [p.id for p in pins]
+        image_urls = [p.image_url for p in pins if p.image_url]
+        archived_at = datetime.now(timezone.utc)
+
+        # 1バッチ1トランザクションで、集計・アーカイブ・変更履歴・削除をまとめて行う
+        remove_pins_from_clusters(pins)
+        db.session.execute(
+            db.insert(ArchivedPin),
+            [
+                dict({c: getattr(p, c) for c in _PIN_COLUMNS}, original_pin_id=p.id, archived_at=archived_at)
+                for p in pins
+            ],
+        )
+        db.session.execute(
+            db.insert(PinChange), [{"pin_id": i, "op": "delete", "changed_at": archived_at} for i in ids]
+        )
+        db.session.execute(db.delete(Pin).where(Pin.id.in_(ids)), execution_options={"synchronize_session": False})
+        db.session.commit()
+        db.session.expunge_all()
+        pins_cache.invalidate()
+
+        total_pins += len(ids)
+        total_images += _archive_images(image_urls, upload_folder)
+
+        if len(ids) < batch_size:
+            break
+
+    if total_pins:
+        current_app.logger.info(f"期限切れピンを {total_pins} 件アーカイブしました(画像 {total_images} 件)")
+    return total_pins, total_images
+
+
+def prune_pin_changes(retention_days, batch_size=5000):
+    """retention_days 日より前のピンの変更履歴を batch_size 件ずつ消し、件数を返す
+
+    最新の1件は latest_change_id(キャッシュの版・カーソル)が戻らないよう残す。
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    latest_id = db.session.execute(db.select(db.func.max(PinChange.id))).scalar()
+    if latest_id is None:
+        return 0
+    total = 0
+    while True:
+        # 履歴は ID 順に古いので、主キーの先頭から読むだけで済む
+        ids = db.session.execute(
+            db.select(PinChange.id)
+            .where(PinChange.id < latest_id, PinChange.changed_at < cutoff)
+            .order_by(PinChange.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        db.session.execute(
+            db.delete(PinChange).where(PinChange.id.in_(ids)), execution_options={"synchronize_session": False}
+        )
+        db.session.commit()
+        total += len(ids)
+        if len(ids) < batch_size:
+            break
+
+    if total:
+        current_app.logger.info(f"{retention_days} 日より前のピンの変更履歴を {total} 件削除しました")
+    return total
+
+
+def start_purge_timer(app, interval):
+    """interval 秒ごとに purge_expired_pins と prune_pin_changes を実行するデーモンスレッドを起動する"""
+
+    def run():
+        while not stop.wait(interval):
+            with app.app_context():
+                try:
+                    purge_expired_pins()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception("期限切れピンの整理中にエラーが発生しました")
+                try:
+                    prune_pin_changes(app.config["PIN_CHANGE_RETENTION_DAYS"])
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception("ピンの変更履歴の整理中にエラーが発生しました")
+
+    stop = threading.Event()
+    thread = threading.Thread(target=run, name="pin-purge", daemon=True)
+    thread.start()
+    return stop
@@ -0,0 +1,237 @@
+# リクエストと SQL の計測、/metrics(Prometheus のテキスト形式)用ファイルです。
+# エンドポイントごとに、処理時間・レスポンスサイズ・ステータス・1リクエストの SQL 数と合計時間を集計し、
+# SLOW_QUERY_MS を超えた SQL は文と一緒にログに出します。
+# 値はプロセス内で持つので、gunicorn の複数ワーカーではスクレイプのたびにどれか1つのワーカーの値になります。
+# 記録はロック1回と dict の更新だけなので、本番で常に有効にしても負荷はほぼありません。
+# ?stream=1 のレスポンスは本体を送る前に記録するので、送信中の SQL とサイズは含みません。
+# /metrics は METRICS_TOKEN を設定して Authorization: Bearer <トークン> のときだけ返します。
+# リバースプロキシの後ろでは外からのアクセスも 127.0.0.1 からに見えるので、接続元だけで許可するのは
+# METRICS_ALLOW_LOOPBACK を明示したとき(プロキシを通さない構成)だけにします。どちらもなければ /metrics は作りません。
+
+import hmac
+import threading
+import time
+from bisect import bisect_left
+
+from flask import abort, g, has_request_context, request
+from sqlalchemy import event
+
+# 処理時間(秒)と1リクエストの SQL 数のヒストグラムの区切り
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# SLOW_QUERY_MS の既定値
+DEFAULT_SLOW_QUERY_MS = 200
+
+# ログに出す SQL 文の最大文字数
+MAX_LOGGED_STATEMENT = 1000
+
+# METRICS_ALLOW_LOOPBACK のとき /metrics を返す接続元
+LOCAL_ADDRESSES = ("127.0.0.1", "::1")
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for le, n in zip(self.buckets, self.counts):
+            total += n
+            yield le, total
+
+
+class EndpointStats:
+    """1エンドポイントの集計"""
+
+    __slots__ = ("latency", "queries", "statuses", "response_bytes", "query_seconds", "slow_queries")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.statuses = {}
+        self.response_bytes = 0
+        self.query_seconds = 0.0
+        self.slow_queries = 0
+
+
+class Metrics:
+    """(blueprint, endpoint, method) → EndpointStats"""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.slow_query_seconds = DEFAULT_SLOW_QUERY_MS / 1000
+
+    def record(self, key, status, seconds, size, queries, query_seconds, slow_queries):
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = EndpointStats()
+            stats.latency.observe(seconds)
+            stats.queries.observe(queries)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.response_bytes += size
+            stats.query_seconds += query_seconds
+            stats.slow_queries += slow_queries
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def render(self):
+        """Prometheus のテキスト形式にする"""
+        with self._lock:
+            items = sorted(self._stats.items())
+            lines = []
+
+            def header(name, kind, text):
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+            def histogram(name, get):
+                for key, stats in items:
+                    labels = _labels(key)
+                    h = get(stats)
+                    for le, n in h.cumulative():
+                        lines.append(f'{name}_bucket{{{labels},le="{le}"}} {n}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+                    lines.append(f"{name}_sum{{{labels}}} {h.sum}")
+                    lines.append(f"{name}_count{{{labels}}} {h.count}")
+
+            header("http_requests_total", "counter", "Requests by endpoint and status.")
+            for key, stats in items:
+                for status, n in sorted(stats.statuses.items()):
+                    lines.append(f'http_requests_total{{{_labels(key)},status="{status}"}} {n}')
+
+            header("http_request_duration_seconds", "histogram", "Handler latency.")
+            histogram("http_request_duration_seconds", lambda s: s.latency)
+
+            header("http_response_size_bytes_total", "counter", "Response body bytes (streamed bodies are not counted).")
+            for key, stats in items:
+                lines.append(f"http_response_size_bytes_total{{{_labels(key)}}} {stats.response_bytes}")
+
+            header("db_queries_per_request", "histogram", "SQL statements executed per request.")
+            histogram("db_queries_per_request", lambda s: s.queries)
+
+            header("db_query_duration_seconds_total", "counter", "Time spent in SQL statements.")
+            for key, stats in items:
+                lines.append(f"db_query_duration_seconds_total{{{_labels(key)}}} {stats.query_seconds}")
+
+            header("db_slow_queries_total", "counter", "SQL statements slower than SLOW_QUERY_MS.")
+            for key, stats in items:
+                lines.append(f"db_slow_queries_total{{{_labels(key)}}} {stats.slow_queries}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key):
+    blueprint, endpoint, method = key
+    return f'blueprint="{blueprint}",endpoint="{endpoint}",method="{method}"'
+
+
+metrics = Metrics()
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_query_seconds = 0.0
+    g.metrics_slow_queries = 0
+
+
+def _after_request(response):
+    started = g.pop("metrics_started", None)
+    if started is None or request.endpoint == "metrics":
+        return response
+    size = 0 if response.is_streamed else (response.content_length or 0)
+    key = (request.blueprint or "none", request.endpoint or "none", request.method)
+    metrics.record(
+        key,
+        response.status_code,
+        time.perf_counter() - started,
+        size,
+        g.metrics_queries,
+        g.metrics_query_seconds,
+        g.metrics_slow_queries,
+    )
+    return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _handle_error(context):
+    # 失敗した SQL の開始時刻を捨てる
+    if context.connection is not None:
+        starts = context.connection.info.get("metrics_query_start")
+        if starts:
+            starts.pop()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany, logger):
+    starts = conn.info.get("metrics_query_start")
+    if not starts:
+        return
+    seconds = time.perf_counter() - starts.pop()
+    slow = seconds >= metrics.slow_query_seconds
+    in_request = has_request_context() and "metrics_queries" in g
+    if in_request:
+        g.metrics_queries += 1
+        g.metrics_query_seconds += seconds
+        g.metrics_slow_queries += slow
+    if slow:
+        endpoint = request.endpoint if in_request else "-"
+        logger.warning(f"遅い SQL ({seconds * 1000:.0f}ms, {endpoint}): {statement[:MAX_LOGGED_STATEMENT]}")
+
+
+def init_metrics(app, db):
+    """db.init_app の後に呼ぶ。リクエストと全エンジンの SQL を計測し、/metrics を登録する(METRICS_ENABLED が偽なら何もしない)
+
+    METRICS_TOKEN も METRICS_ALLOW_LOOPBACK もなければ計測と遅い SQL のログだけ行い、/metrics は登録しない。
+    """
+    if not app.config.get("METRICS_ENABLED"):
+        return
+    token = app.config.get("METRICS_TOKEN")
+    allow_loopback = app.config.get("METRICS_ALLOW_LOOPBACK", False)
+    metrics.slow_query_seconds = app.config.get("SLOW_QUERY_MS", DEFAULT_SLOW_QUERY_MS) / 1000
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    def after_cursor_execute(*args):
+        _after_cursor_execute(*args, logger=app.logger)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", after_cursor_execute)
+            event.listen(engine, "handle_error", _handle_error)
+
+    if not token and not allow_loopback:
+        app.logger.warning("METRICS_TOKEN が未設定なので /metrics は公開しません(計測と遅い SQL のログだけ行います)")
+        return
+
+    def metrics_view():
+        if token:
+            expected = f"Bearer {token}".encode()
+            if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), expected):
+                abort(401)
+        elif request.remote_addr not in LOCAL_ADDRESSES:
+            abort(403)
+        return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule("/metrics", "metrics", metrics_view)
@@ -0,0 +1,30 @@
+"""add pin_changes
+
+Revision ID: 5d8e2f17b6a9
+Revises: e07d4b8a1c35
+Create Date: 2026-10-18 09:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8e2f17b6a9'
+down_revision = 'e07d4b8a1c35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('pin_changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('pin_id', sa.Integer(), nullable=False),
+    sa.Column('op', sa.String(length=10), nullable=False),
+    sa.Column('changed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('pin_changes')
@@ -0,0 +1,66 @@
+"""give archived_pins its own key and keep pins.id in original_pin_id
+
+Revision ID: 7a1d3c5e9b20
+Revises: f3b8d61c0e24
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a1d3c5e9b20'
+down_revision = 'f3b8d61c0e24'
+branch_labels = None
+depends_on = None
+
+_COLUMNS = "lat, lng, title, category, description, caution, image_url, created_at, expires_at, user_id, archived_at"
+
+
+def _create(name, with_original_id):
+    columns = [sa.Column('id', sa.Integer(), nullable=False)]
+    if with_original_id:
+        columns.append(sa.Column('original_pin_id', sa.Integer(), nullable=False))
+    op.create_table(name,
+    *columns,
+    sa.Column('lat', sa.Float(), nullable=False),
+    sa.Column('lng', sa.Float(), nullable=False),
+    sa.Column('title', sa.String(length=30), nullable=False),
+    sa.Column('category', sa.Integer(), nullable=False),
+    sa.Column('description', sa.Text(), nullable=False),
+    sa.Column('caution', sa.Text(), nullable=True),
+    sa.Column('image_url', sa.String(length=300), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def upgrade():
+    # 主キーを差し替えるのでテーブルを作り直す(元の id は original_pin_id に移す)
+    _create('_archived_pins_new', with_original_id=True)
+    op.execute(
+        f"INSERT INTO _archived_pins_new (original_pin_id, {_COLUMNS}) "
+        f"SELECT id, {_COLUMNS} FROM archived_pins ORDER BY archived_at, id"
+    )
+    op.drop_table('archived_pins')
+    op.rename_table('_archived_pins_new', 'archived_pins')
+    with op.batch_alter_table('archived_pins', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_archived_pins_original_pin_id'), ['original_pin_id'], unique=False)
+
+
+def downgrade():
+    # 同じ pins.id が複数回アーカイブされていれば最後の1件だけ残す
+    _create('_archived_pins_old', with_original_id=False)
+    op.execute(
+        f"INSERT INTO _archived_pins_old (id, {_COLUMNS}) "
+        f"SELECT original_pin_id, {_COLUMNS} FROM archived_pins "
+        "WHERE id IN (SELECT max(id) FROM archived_pins GROUP BY original_pin_id)"
+    )
+    with op.batch_alter_table('archived_pins', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_archived_pins_original_pin_id'))
+    op.drop_table('archived_pins')
+    op.rename_table('_archived_pins_old', 'archived_pins')
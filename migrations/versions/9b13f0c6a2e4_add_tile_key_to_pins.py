@@ -0,0 +1,40 @@
+"""add tile_key to pins
+
+Revision ID: 9b13f0c6a2e4
+Revises: 4c2a9e51d7b0
+Create Date: 2026-10-18 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from spatial import tile_key_for
+
+
+# revision identifiers, used by Alembic.
+revision = '9b13f0c6a2e4'
+down_revision = '4c2a9e51d7b0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('pins', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tile_key', sa.String(length=32), nullable=True))
+        batch_op.create_index('ix_pins_tile_key_lat_lng', ['tile_key', 'lat', 'lng'], unique=False)
+
+    # 既存ピンのtile_keyを埋める
+    conn = op.get_bind()
+    pins = sa.table('pins', sa.column('id'), sa.column('lat'), sa.column('lng'), sa.column('tile_key'))
+    rows = conn.execute(sa.select(pins.c.id, pins.c.lat, pins.c.lng)).all()
+    if rows:
+        conn.execute(
+            pins.update().where(pins.c.id == sa.bindparam('pin_id')).values(tile_key=sa.bindparam('key')),
+            [{'pin_id': r.id, 'key': tile_key_for(r.lat, r.lng)} for r in rows],
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('pins', schema=None) as batch_op:
+        batch_op.drop_index('ix_pins_tile_key_lat_lng')
+        batch_op.drop_column('tile_key')
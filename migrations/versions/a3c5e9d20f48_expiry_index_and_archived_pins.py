@@ -0,0 +1,43 @@
+"""add expires_at index and archived_pins
+
+Revision ID: a3c5e9d20f48
+Revises: 5d8e2f17b6a9
+Create Date: 2026-10-18 10:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c5e9d20f48'
+down_revision = '5d8e2f17b6a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('archived_pins',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('lat', sa.Float(), nullable=False),
+    sa.Column('lng', sa.Float(), nullable=False),
+    sa.Column('title', sa.String(length=30), nullable=False),
+    sa.Column('category', sa.Integer(), nullable=False),
+    sa.Column('description', sa.Text(), nullable=False),
+    sa.Column('caution', sa.Text(), nullable=True),
+    sa.Column('image_url', sa.String(length=300), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('pins', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_pins_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('pins', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_pins_expires_at'))
+
+    op.drop_table('archived_pins')
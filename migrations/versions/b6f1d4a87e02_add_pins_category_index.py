@@ -0,0 +1,26 @@
+"""add pins category index
+
+Revision ID: b6f1d4a87e02
+Revises: a3c5e9d20f48
+Create Date: 2026-10-18 10:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6f1d4a87e02'
+down_revision = 'a3c5e9d20f48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('pins', schema=None) as batch_op:
+        batch_op.create_index('ix_pins_category_title', ['category', 'title', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('pins', schema=None) as batch_op:
+        batch_op.drop_index('ix_pins_category_title')
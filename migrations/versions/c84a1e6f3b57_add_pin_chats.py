@@ -0,0 +1,38 @@
+"""add pin_chats
+
+Revision ID: c84a1e6f3b57
+Revises: b6f1d4a87e02
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c84a1e6f3b57'
+down_revision = 'b6f1d4a87e02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('pin_chats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('pin_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('message', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['pin_id'], ['pins.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('pin_chats', schema=None) as batch_op:
+        batch_op.create_index('ix_pin_chats_pin_id_id', ['pin_id', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('pin_chats', schema=None) as batch_op:
+        batch_op.drop_index('ix_pin_chats_pin_id_id')
+
+    op.drop_table('pin_chats')
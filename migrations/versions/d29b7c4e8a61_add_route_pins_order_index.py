@@ -0,0 +1,26 @@
+"""add route_pins (route_id, order) index
+
+Revision ID: d29b7c4e8a61
+Revises: c84a1e6f3b57
+Create Date: 2026-10-18 11:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd29b7c4e8a61'
+down_revision = 'c84a1e6f3b57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('route_pins', schema=None) as batch_op:
+        batch_op.create_index('ix_route_pins_route_id_order', ['route_id', 'order'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('route_pins', schema=None) as batch_op:
+        batch_op.drop_index('ix_route_pins_route_id_order')
@@ -0,0 +1,40 @@
+"""add pin_clusters
+
+Revision ID: e07d4b8a1c35
+Revises: 9b13f0c6a2e4
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e07d4b8a1c35'
+down_revision = '9b13f0c6a2e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('pin_clusters',
+    sa.Column('zoom', sa.Integer(), nullable=False),
+    sa.Column('quadkey', sa.String(length=32), nullable=False),
+    sa.Column('category', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('lat_sum', sa.Float(), nullable=False),
+    sa.Column('lng_sum', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('zoom', 'quadkey', 'category')
+    )
+    # 既存ピンをズーム 12〜18(clusters.CLUSTER_ZOOMS)ごとに集計する
+    for zoom in range(12, 19):
+        op.execute(
+            "INSERT INTO pin_clusters (zoom, quadkey, category, count, lat_sum, lng_sum) "
+            f"SELECT {zoom}, substr(tile_key, 1, {zoom}), category, count(*), sum(lat), sum(lng) "
+            "FROM pins WHERE tile_key IS NOT NULL "
+            f"GROUP BY substr(tile_key, 1, {zoom}), category"
+        )
+
+
+def downgrade():
+    op.drop_table('pin_clusters')
@@ -0,0 +1,54 @@
+"""add pins_fts full-text index
+
+Revision ID: e5a0c3f19d82
+Revises: d29b7c4e8a61
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a0c3f19d82'
+down_revision = 'd29b7c4e8a61'
+branch_labels = None
+depends_on = None
+
+
+# pins のタイトル・説明を trigram(3文字ずつ)で索引する FTS5 テーブルと、pins と同期するトリガー。
+# SQLite 以外では作らない(検索は LIKE になる)。
+# 注意: batch_alter_table で pins を作り直すとトリガーが消えるので、その後にこのトリガーを作り直すこと。
+TRIGGERS = (
+    """CREATE TRIGGER pins_fts_ai AFTER INSERT ON pins BEGIN
+        INSERT INTO pins_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER pins_fts_ad AFTER DELETE ON pins BEGIN
+        INSERT INTO pins_fts(pins_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER pins_fts_au AFTER UPDATE OF title, description ON pins BEGIN
+        INSERT INTO pins_fts(pins_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO pins_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE pins_fts USING fts5("
+        "title, description, content='pins', content_rowid='id', tokenize='trigram')"
+    )
+    for trigger in TRIGGERS:
+        op.execute(trigger)
+    # 既存のピンを索引に入れる
+    op.execute("INSERT INTO pins_fts(pins_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for name in ('pins_fts_ai', 'pins_fts_ad', 'pins_fts_au'):
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE IF EXISTS pins_fts")
@@ -0,0 +1,43 @@
+"""add route summary columns and routes (name, id) index
+
+Revision ID: f3b8d61c0e24
+Revises: e5a0c3f19d82
+Create Date: 2026-10-18 17:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8d61c0e24'
+down_revision = 'e5a0c3f19d82'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('routes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('stop_count', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('min_lat', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('min_lng', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('max_lat', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('max_lng', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('length_m', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('category_counts', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('thumbnail_url', sa.String(length=300), nullable=True))
+        batch_op.create_index('ix_routes_name_id', ['name', 'id'], unique=False)
+    # 既存の旅路の要約は flask pins rebuild-route-summaries で作成する
+
+
+def downgrade():
+    with op.batch_alter_table('routes', schema=None) as batch_op:
+        batch_op.drop_index('ix_routes_name_id')
+        batch_op.drop_column('thumbnail_url')
+        batch_op.drop_column('category_counts')
+        batch_op.drop_column('length_m')
+        batch_op.drop_column('max_lng')
+        batch_op.drop_column('max_lat')
+        batch_op.drop_column('min_lng')
+        batch_op.drop_column('min_lat')
+        batch_op.drop_column('stop_count')
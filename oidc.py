@@ -0,0 +1,143 @@
+# Google ログイン(OpenID Connect)の外部通信用ファイルです。
+# ディスカバリー文書(.well-known/openid-configuration)と署名鍵(JWKS)をプロセス内に期限付きで保存し、
+# OIDC_CACHE_PATH の JSON ファイルにも書き出して、再起動後も期限内なら取得し直しません。
+# 期限はレスポンスの Cache-Control: max-age を優先し、なければ OIDC_METADATA_TTL 秒です。
+# 知らない鍵(kid)で署名された ID トークンが来たときは、鍵の更新に備えて期限前でも取り直します。
+# 取得に失敗したときは、期限切れでも保存済みの値を使います。
+# トークン交換などの通信は共有のコネクションプールを使い、毎回の TCP/TLS 接続を省きます。
+
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+from authlib.integrations.flask_client import FlaskOAuth2App
+from authlib.integrations.requests_client import OAuth2Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 期限前の取り直し(force)の最短間隔(秒)。不正な kid のトークンで何度も取りに行かないようにする
+MIN_REFRESH_INTERVAL = 60
+
+# 外部通信のタイムアウト(秒)
+HTTP_TIMEOUT = 10
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+# 外部 API 用の共有コネクションプール(GET だけ接続失敗・5xx を2回まで再試行。認可コードは1回しか使えない)
+http_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504), allowed_methods=("GET",)),
+)
+http = requests.Session()
+http.mount("https://", http_adapter)
+http.mount("http://", http_adapter)
+
+
+def fetch_json(url):
+    """url を GET して (JSON, max-age 秒 または None) を返す"""
+    resp = http.get(url, timeout=HTTP_TIMEOUT)
+    resp.raise_for_status()
+    match = _MAX_AGE.search(resp.headers.get("Cache-Control", ""))
+    return resp.json(), int(match.group(1)) if match else None
+
+
+class OIDCCache:
+    """URL → JSON の期限付きキャッシュ(ファイルにも保存する)"""
+
+    def __init__(self, path=None, ttl=86400):
+        self.path = path
+        self.ttl = ttl
+        self._entries = {}  # url → (値, 期限, 取得時刻)。再起動をまたぐので time.time() で持つ
+        self._lock = threading.Lock()
+
+    def configure(self, path, ttl):
+        with self._lock:
+            self.path = path or None
+            self.ttl = ttl
+            self._entries = self._load()
+
+    def get(self, url, fetch=fetch_json, force=False):
+        """url の JSON を返す。期限切れ(または force)なら fetch(url) で取り直す"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is not None:
+            value, expires_at, fetched_at = entry
+            if (not force and expires_at > now) or (force and now - fetched_at < MIN_REFRESH_INTERVAL):
+                return value
+
+        try:
+            value, max_age = fetch(url)
+        except (requests.RequestException, ValueError):
+            if entry is None:
+                raise
+            return entry[0]
+
+        with self._lock:
+            self._entries[url] = (value, now + (self.ttl if max_age is None else max_age), now)
+            self._save()
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._save()
+
+    def _load(self):
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return {url: (e["value"], e["expires_at"], e["fetched_at"]) for url, e in json.load(f).items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return {}
+
+    def _save(self):
+        if not self.path:
+            return
+        data = {url: {"value": v, "expires_at": e, "fetched_at": f} for url, (v, e, f) in self._entries.items()}
+        # 別ワーカーが同時に書いても壊れないよう、一時ファイルから置き換える
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+
+oidc_cache = OIDCCache()
+
+
+class PooledOAuth2Session(OAuth2Session):
+    """共有のコネクションプールを使う OAuth2Session"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.mount("https://", http_adapter)
+        self.mount("http://", http_adapter)
+
+    def close(self):
+        # Authlib は with で使うたびに close するが、共有プールの接続は残しておく
+        pass
+
+
+class CachedOIDCApp(FlaskOAuth2App):
+    """ディスカバリー文書と JWKS を oidc_cache から読む OAuth クライアント(oauth.register の client_cls)"""
+
+    client_cls = PooledOAuth2Session
+
+    def load_server_metadata(self):
+        if self._server_metadata_url:
+            self.server_metadata.update(oidc_cache.get(self._server_metadata_url))
+        return self.server_metadata
+
+    def fetch_jwk_set(self, force=False):
+        uri = self.load_server_metadata().get("jwks_uri")
+        if not uri:
+            raise RuntimeError('Missing "jwks_uri" in metadata')
+        return oidc_cache.get(uri, force=force)
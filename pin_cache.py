@@ -0,0 +1,84 @@
+# GET /api/pins のレスポンス(エンコード済みバイト列)のキャッシュ用ファイルです。
+# キャッシュは検索条件ごとに持ち、作成時点の変更履歴ID(pin_changes の最大ID)と一緒に保存します。
+# 別ワーカーで追加されたピンも変更履歴IDが変わるので検知でき、古いレスポンスは返しません。
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import msgspec
+from flask import current_app, request
+from SQLAlchemy_models import expiry_now
+
+_encoder = msgspec.json.Encoder()
+
+
+def encode_json(obj):
+    """dict/list を JSON のバイト列にする(jsonify より高速)"""
+    return _encoder.encode(obj)
+
+
+class CachedResponse:
+    __slots__ = ("version", "body", "etag", "headers", "valid_until")
+
+    def __init__(self, version, body, headers, valid_until):
+        self.version = version
+        self.body = body
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.headers = headers
+        self.valid_until = valid_until
+
+
+class ResponseCache:
+    """検索条件→エンコード済みレスポンスの LRU キャッシュ(プロセス内)"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            # ピンが変更された、または含まれるピンの期限が来たら使わない
+            if entry.version != version or (entry.valid_until and entry.valid_until <= expiry_now()):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, version, body, headers=None, valid_until=None):
+        entry = CachedResponse(version, body, headers or {}, valid_until)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self):
+        """ピンを追加・更新・削除したら呼ぶ"""
+        with self._lock:
+            self._entries.clear()
+
+
+pins_cache = ResponseCache()
+
+
+def cache_key(args):
+    """クエリパラメータを並び順に依存しないキーにする"""
+    return tuple(sorted(args.items(multi=True)))
+
+
+def send_cached(entry):
+    """強い ETag を付けて返す。If-None-Match が一致すれば 304"""
+    if request.if_none_match.contains(entry.etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(entry.body, mimetype="application/json")
+    response.set_etag(entry.etag)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers.update(entry.headers)
+    return response
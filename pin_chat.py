@@ -0,0 +1,223 @@
+# ピンごとの掲示板(チャット)のルーティング用ファイルです。
+# 一覧は ?after=最後に受け取ったID で続きだけを取得し、新着は SSE(/stream)または
+# ロングポーリング(?wait=秒)で受け取ります。新着は chat_broker から配信されるので待機中は DB を読みません。
+# 待っている接続はワーカーのスレッドを使い続けるので、同時に待てる数を CHAT_MAX_STREAMS 本までにします。
+# 超えた分の SSE は 503 で断り(画面はロングポーリングに切り替える)、ロングポーリングは待たずに返します。
+
+import json
+import math
+import threading
+
+from flask import Blueprint, Response, request, jsonify, current_app
+from flask_login import login_required, current_user
+from SQLAlchemy_models import db, Pin, PinChat, User
+from db_engine import read_only
+from chat_broker import get_broker
+
+chat_bp = Blueprint("chat", __name__)
+
+# メッセージの最大文字数・1回に返す件数
+MAX_MESSAGE_LENGTH = 500
+DEFAULT_CHAT_LIMIT = 50
+MAX_CHAT_LIMIT = 200
+
+# ロングポーリングの最大待ち時間・SSE のハートビート間隔と1接続の長さ(秒)
+MAX_WAIT_SECONDS = 25
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_SECONDS = 300
+
+
+class StreamLimiter:
+    """SSE・ロングポーリングで同時に待てる接続数(プロセスごと)"""
+
+    def __init__(self, max_streams=4):
+        self.configure(max_streams)
+
+    def configure(self, max_streams):
+        self.max_streams = max_streams
+        self._slots = threading.BoundedSemaphore(max_streams) if max_streams > 0 else None
+
+    def acquire(self):
+        """空きがあれば確保して True(待たない)"""
+        return self._slots is not None and self._slots.acquire(blocking=False)
+
+    def release(self):
+        self._slots.release()
+
+
+stream_limiter = StreamLimiter()
+
+
+def chat_channel(pin_id):
+    return f"pin-chat:{pin_id}"
+
+
+def chat_to_dict(chat, username):
+    return {
+        "id": chat.id,
+        "pin_id": chat.pin_id,
+        "user_id": chat.user_id,
+        "username": username,
+        "message": chat.message,
+        "created_at": chat.created_at.isoformat(),
+    }
+
+
+def load_chats(pin_id, after=0, limit=DEFAULT_CHAT_LIMIT):
+    """after より後のメッセージを古い順に返す(ユーザー名は JOIN で1回で取得)"""
+    rows = db.session.execute(
+        db.select(PinChat, User.name)
+        .join(User, User.id == PinChat.user_id)
+        .where(PinChat.pin_id == pin_id, PinChat.id > after)
+        .order_by(PinChat.id)
+        .limit(limit)
+    ).all()
+    return [chat_to_dict(chat, name) for chat, name in rows]
+
+
+def load_recent_chats(pin_id, limit=DEFAULT_CHAT_LIMIT):
+    """最新 limit 件を古い順に返す(初回表示用)"""
+    rows = db.session.execute(
+        db.select(PinChat, User.name)
+        .join(User, User.id == PinChat.user_id)
+        .where(PinChat.pin_id == pin_id)
+        .order_by(PinChat.id.desc())
+        .limit(limit)
+    ).all()
+    return [chat_to_dict(chat, name) for chat, name in reversed(rows)]
+
+
+def _drain(sub, after, timeout):
+    """after より新しいメッセージが配信されるまで最大 timeout 秒待ち、届いた分を返す"""
+    messages = []
+    message = sub.get(timeout=timeout)
+    while message is not None:
+        if message["id"] > after:
+            messages.append(message)
+        message = sub.get(timeout=0)
+    return messages
+
+
+@chat_bp.route("/pins/<int:pin_id>/chats", methods=["GET"])
+@read_only
+def get_chats(pin_id):
+    try:
+        after = int(request.args.get("after", 0))
+        limit = max(1, min(int(request.args.get("limit", DEFAULT_CHAT_LIMIT)), MAX_CHAT_LIMIT))
+        wait = min(float(request.args.get("wait", 0)), MAX_WAIT_SECONDS)
+        if not math.isfinite(wait):
+            raise ValueError("wait が不正です")
+    except ValueError:
+        return jsonify({"error": "after・limit・wait の指定が不正です"}), 400
+
+    # 待てる接続数を超えていれば待たずに返す(画面は間隔を空けて取り直す)
+    if wait <= 0 or not stream_limiter.acquire():
+        return jsonify(load_chats(pin_id, after, limit))
+
+    # ロングポーリング: 購読してから読むので、その間の投稿も取りこぼさない
+    try:
+        with get_broker().subscribe(chat_channel(pin_id)) as sub:
+            chats = load_chats(pin_id, after, limit)
+            if chats:
+                return jsonify(chats)
+            # 待っている間は DB 接続を返しておく
+            db.session.remove()
+            return jsonify(_drain(sub, after, wait))
+    finally:
+        stream_limiter.release()
+
+
+@chat_bp.route("/pins/<int:pin_id>/chats/stream", methods=["GET"])
+@read_only
+def stream_chats(pin_id):
+    """Server-Sent Events で新着を送る。再接続時は Last-Event-ID から続きを送る"""
+    try:
+        after = int(request.headers.get("Last-Event-ID") or request.args.get("after", 0))
+    except ValueError:
+        return jsonify({"error": "after の指定が不正です"}), 400
+
+    if not stream_limiter.acquire():
+        # 画面は EventSource をやめてロングポーリングに切り替える
+        return jsonify({"error": "接続が混み合っています", "fallback": "poll"}), 503
+
+    # 購読を先に始めてから取りこぼし分を読むので、その間の投稿も失われない
+    # 初回は最新の MAX_CHAT_LIMIT 件、再接続時は受け取った続きをすべて送る
+    try:
+        sub = get_broker().subscribe(chat_channel(pin_id))
+    except Exception:
+        stream_limiter.release()
+        raise
+
+    def close():
+        sub.close()
+        stream_limiter.release()
+
+    try:
+        if after == 0:
+            backlog = load_recent_chats(pin_id, MAX_CHAT_LIMIT)
+        else:
+            backlog = page = load_chats(pin_id, after, MAX_CHAT_LIMIT)
+            while len(page) == MAX_CHAT_LIMIT:
+                page = load_chats(pin_id, page[-1]["id"], MAX_CHAT_LIMIT)
+                backlog += page
+    except Exception:
+        close()
+        raise
+    db.session.remove()
+
+    def events():
+        last_id = after
+        yield "retry: 3000\n\n"
+        for chat in backlog:
+            last_id = chat["id"]
+            yield f"id: {chat['id']}\ndata: {json.dumps(chat, ensure_ascii=False)}\n\n"
+
+        waited = 0
+        while waited < SSE_MAX_SECONDS:
+            chat = sub.get(timeout=SSE_HEARTBEAT_SECONDS)
+            if chat is None:
+                if sub.overflowed:
+                    # 配信が追いつかず止まったので切る(ブラウザが Last-Event-ID 付きで再接続する)
+                    break
+                waited += SSE_HEARTBEAT_SECONDS
+                yield ": ping\n\n"
+                continue
+            if chat["id"] <= last_id:
+                continue
+            last_id = chat["id"]
+            yield f"id: {chat['id']}\ndata: {json.dumps(chat, ensure_ascii=False)}\n\n"
+
+    response = Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # 送信前に切断されても購読と枠を返す(ジェネレーターの finally は始まっていないと呼ばれない)
+    response.call_on_close(close)
+    return response
+
+
+@chat_bp.route("/pins/<int:pin_id>/chats", methods=["POST"])
+@login_required
+def add_chat(pin_id):
+    try:
+        data = request.get_json(silent=True) or {}
+        message = str(data.get("message", "")).strip()
+
+        if not message or len(message) > MAX_MESSAGE_LENGTH:
+            return jsonify({"error": f"メッセージは1〜{MAX_MESSAGE_LENGTH}文字で入力してください"}), 400
+        if db.session.get(Pin, pin_id) is None:
+            return jsonify({"error": "ピンが見つかりません"}), 404
+
+        chat = PinChat(pin_id=pin_id, user_id=current_user.id, message=message)
+        db.session.add(chat)
+        db.session.commit()
+
+        # コミット後に配信する(閲覧者は DB を読まずに受け取る)
+        payload = chat_to_dict(chat, current_user.name)
+        get_broker().publish(chat_channel(pin_id), payload)
+        return jsonify({"success": True, "chat": payload})
+
+    except Exception:
+        current_app.logger.exception("掲示板の投稿中にエラーが発生しました")
+        return jsonify({"error": "投稿に失敗しました"}), 500
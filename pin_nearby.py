@@ -0,0 +1,155 @@
+# 近くのピン検索(半径・近い順 k 件)用ファイルです。
+# 表示中のピンの座標をメモリ上の NumPy 配列に持ち、格子(グリッド)のセル番号順に並べておきます。
+# 検索時は円を覆うセルの範囲だけを二分探索で切り出し、距離(haversine)はまとめてベクトル計算します。
+# 配列は pin_changes(変更履歴)の新しい分だけを反映して更新するので、別ワーカーの追加・削除にも追従します。
+
+import threading
+
+import numpy as np
+from SQLAlchemy_models import db, Pin, PinChange, expiry_now
+from spatial import EARTH_RADIUS_M, haversine_m
+from pin_sync import latest_change_id
+
+# 格子の一辺(度)。緯度方向で約 550m
+CELL_DEG = 0.005
+_N_COLS = int(round(360 / CELL_DEG))
+
+# 期限なしのピン
+_NO_EXPIRY = np.datetime64("NaT", "s")
+
+_EMPTY_IDS = np.empty(0, dtype=np.int64)
+_EMPTY_FLOATS = np.empty(0, dtype=np.float64)
+_EMPTY_TIMES = np.empty(0, dtype="datetime64[s]")
+
+
+def _cell_keys(lat, lng):
+    rows = np.floor((np.asarray(lat) + 90) / CELL_DEG).astype(np.int64)
+    cols = np.floor((np.asarray(lng) + 180) / CELL_DEG).astype(np.int64)
+    return rows * _N_COLS + cols
+
+
+def _expiry(value):
+    return _NO_EXPIRY if value is None else np.datetime64(value, "s")
+
+
+class _Snapshot:
+    """ある時点の配列一式。検索中に差し替わっても読み終えるまで同じものを使う"""
+
+    __slots__ = ("keys", "ids", "lat", "lng", "expires")
+
+    def __init__(self, keys, ids, lat, lng, expires):
+        self.keys = keys
+        self.ids = ids
+        self.lat = lat
+        self.lng = lng
+        self.expires = expires
+
+
+class PinIndex:
+    """ピン座標の格子インデックス(プロセス内)"""
+
+    def __init__(self):
+        self.version = None  # 反映済みの変更履歴ID
+        self._snapshot = _Snapshot(_EMPTY_IDS, _EMPTY_IDS, _EMPTY_FLOATS, _EMPTY_FLOATS, _EMPTY_TIMES)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._snapshot.ids)
+
+    def sync(self):
+        """変更履歴の新しい分を反映する(初回は全件読み込み)"""
+        latest = latest_change_id()
+        if self.version is not None and latest <= self.version:
+            return
+        with self._lock:
+            if self.version is None:
+                self._load(latest)
+            elif latest > self.version:
+                self._apply_changes(self.version)
+
+    def refresh(self):
+        """ピンを追加・削除したら呼ぶ。まだ読み込んでいなければ初回の検索まで何もしない"""
+        if self.version is not None:
+            self.sync()
+
+    def _load(self, latest):
+        rows = db.session.execute(
+            db.select(Pin.id, Pin.lat, Pin.lng, Pin.expires_at).where(Pin.not_expired())
+        ).all()
+        self._snapshot = self._build(rows)
+        self.version = latest
+
+    def _apply_changes(self, since_id):
+        changes = db.session.execute(
+            db.select(PinChange.id, PinChange.pin_id).where(PinChange.id > since_id).order_by(PinChange.id)
+        ).all()
+        if not changes:
+            return
+        changed = {pin_id for _, pin_id in changes}
+        # 追加・更新されたピンは今の値を読み直す(削除済みなら返らない)
+        rows = db.session.execute(
+            db.select(Pin.id, Pin.lat, Pin.lng, Pin.expires_at).where(Pin.id.in_(changed), Pin.not_expired())
+        ).all()
+
+        snap = self._snapshot
+        keep = ~np.isin(snap.ids, np.fromiter(changed, dtype=np.int64, count=len(changed)))
+        added = self._build(rows)
+        keys = snap.keys[keep]
+        # 既存の並び(セル番号順)を崩さない位置に差し込む
+        pos = np.searchsorted(keys, added.keys)
+        self._snapshot = _Snapshot(
+            np.insert(keys, pos, added.keys),
+            np.insert(snap.ids[keep], pos, added.ids),
+            np.insert(snap.lat[keep], pos, added.lat),
+            np.insert(snap.lng[keep], pos, added.lng),
+            np.insert(snap.expires[keep], pos, added.expires),
+        )
+        self.version = changes[-1].id
+
+    @staticmethod
+    def _build(rows):
+        if not rows:
+            return _Snapshot(_EMPTY_IDS, _EMPTY_IDS, _EMPTY_FLOATS, _EMPTY_FLOATS, _EMPTY_TIMES)
+        ids = np.array([r.id for r in rows], dtype=np.int64)
+        lat = np.array([r.lat for r in rows], dtype=np.float64)
+        lng = np.array([r.lng for r in rows], dtype=np.float64)
+        expires = np.array([_expiry(r.expires_at) for r in rows], dtype="datetime64[s]")
+        keys = _cell_keys(lat, lng)
+        order = np.argsort(keys, kind="stable")
+        return _Snapshot(keys[order], ids[order], lat[order], lng[order], expires[order])
+
+    def nearby(self, lat, lng, radius_m, k=None, exclude=None):
+        """(lat, lng) から radius_m 以内のピンを近い順に [(ピンID, 距離 m), ...] で返す"""
+        snap = self._snapshot
+        if not len(snap.ids):
+            return []
+
+        # 円を覆う格子の行・列の範囲。行ごとにセル番号が連続するので二分探索で切り出せる
+        dlat = np.degrees(radius_m / EARTH_RADIUS_M)
+        dlng = dlat / max(np.cos(np.radians(min(abs(lat) + dlat, 89.9))), 1e-6)
+        row0, row1 = (int((v + 90) // CELL_DEG) for v in (lat - dlat, lat + dlat))
+        col0, col1 = (int((v + 180) // CELL_DEG) for v in (lng - dlng, lng + dlng))
+        rows = np.arange(row0, row1 + 1, dtype=np.int64) * _N_COLS
+        starts = np.searchsorted(snap.keys, rows + col0, side="left")
+        stops = np.searchsorted(snap.keys, rows + col1, side="right")
+        spans = [(a, b) for a, b in zip(starts.tolist(), stops.tolist()) if b > a]
+        if not spans:
+            return []
+        idx = np.concatenate([np.arange(a, b) for a, b in spans])
+
+        dist = haversine_m(lat, lng, snap.lat[idx], snap.lng[idx])
+        # 期限切れ(NaT は期限なし)と半径外を除く
+        mask = (dist <= radius_m) & ~(snap.expires[idx] <= np.datetime64(expiry_now(), "s"))
+        if exclude is not None:
+            mask &= snap.ids[idx] != exclude
+        idx, dist = idx[mask], dist[mask]
+
+        # 近い順の上位 k 件だけ並べる
+        if k is not None and len(dist) > k:
+            top = np.argpartition(dist, k - 1)[:k]
+            idx, dist = idx[top], dist[top]
+        order = np.argsort(dist, kind="stable")
+        return list(zip(snap.ids[idx[order]].tolist(), dist[order].tolist()))
+
+
+pin_index = PinIndex()
@@ -0,0 +1,102 @@
+# ピンのタイトル・説明の全文検索用ファイルです。
+# SQLite では pins_fts(FTS5 の trigram 索引。pins のトリガーで自動更新)を使い、
+# 日本語でも単語区切りなしで部分一致検索し、タイトルの一致を重く見た bm25 の順に返します。
+# 2文字以下の語は trigram 索引で引けないので、LIKE で絞り込みます(ほかに3文字以上の語があれば索引で絞った後)。
+# pins_fts がない(マイグレーション前・FTS5 なしでビルドされた SQLite)ときは LIKE だけで検索します。
+
+import unicodedata
+
+from sqlalchemy import case, func, literal_column, or_
+from SQLAlchemy_models import db, Pin
+
+FTS_TABLE = "pins_fts"
+
+# trigram 索引で引ける最短の文字数
+MIN_MATCH_LENGTH = 3
+
+# bm25 の列ごとの重み(タイトル, 説明)
+TITLE_WEIGHT, DESCRIPTION_WEIGHT = 10.0, 1.0
+
+_fts = db.table(FTS_TABLE, db.column("rowid"), db.column("title"), db.column("description"))
+
+# pins_fts があると確認できたデータベースの URL(ない場合は作られるかもしれないので毎回確認する)
+_fts_ready = set()
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """flask db migrate / check で FTS5 のテーブル(モデルにない)を無視する"""
+    return not (type_ == "table" and reflected and name.startswith(FTS_TABLE))
+
+
+def search_terms(q):
+    """検索文字列を語に分ける(全角英数・半角カナなどは NFKC で揃える)"""
+    return unicodedata.normalize("NFKC", q).split()
+
+
+def _phrase(term):
+    # FTS5 のフレーズ("…")として渡し、記号を演算子として解釈させない
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like(term):
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _contains(column, term):
+    return column.like(_like(term), escape="\\")
+
+
+def _has_fts():
+    bind = db.session.get_bind()
+    if bind.dialect.name != "sqlite":
+        return False
+    url = str(bind.url)
+    if url not in _fts_ready:
+        found = db.session.execute(
+            db.text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+        ).first()
+        if found is None:
+            return False
+        _fts_ready.add(url)
+    return True
+
+
+def search_pins(q, limit=20, category=None):
+    """q のすべての語を含む表示中のピンを関連度順に返す"""
+    terms = search_terms(q)
+    if not terms:
+        return []
+    if not _has_fts():
+        return _search_like(terms, limit, category)
+
+    long_terms = [t for t in terms if len(t) >= MIN_MATCH_LENGTH]
+    short_terms = [t for t in terms if len(t) < MIN_MATCH_LENGTH]
+
+    query = db.select(Pin).where(Pin.not_expired())
+    if long_terms:
+        query = query.join(_fts, _fts.c.rowid == Pin.id).where(
+            literal_column(FTS_TABLE).op("MATCH")(" AND ".join(_phrase(t) for t in long_terms))
+        )
+    for t in short_terms:
+        query = query.where(or_(_contains(Pin.title, t), _contains(Pin.description, t)))
+    if category is not None:
+        query = query.where(Pin.category == category)
+
+    # タイトルに全語を含むものを先に、その中は bm25(小さいほど関連が高い)、新しい順
+    title_hit = case((db.and_(*(_contains(Pin.title, t) for t in terms)), 0), else_=1)
+    order = [title_hit]
+    if long_terms:
+        order.append(func.bm25(literal_column(FTS_TABLE), TITLE_WEIGHT, DESCRIPTION_WEIGHT))
+    order.append(Pin.id.desc())
+    return db.session.execute(query.order_by(*order).limit(limit)).scalars().all()
+
+
+def _search_like(terms, limit, category):
+    """FTS5(pins_fts)がないデータベース用(全件走査になる)"""
+    query = db.select(Pin).where(Pin.not_expired())
+    for t in terms:
+        query = query.where(or_(_contains(Pin.title, t), _contains(Pin.description, t)))
+    if category is not None:
+        query = query.where(Pin.category == category)
+    title_hit = case((db.and_(*(_contains(Pin.title, t) for t in terms)), 0), else_=1)
+    return db.session.execute(query.order_by(title_hit, Pin.id.desc()).limit(limit)).scalars().all()
@@ -0,0 +1,76 @@
+# ピンの差分同期用ファイルです。
+# カーソルは "変更履歴ID.期限判定した時刻(UNIX秒)" の文字列で、
+# 変更履歴ID より後の追加・更新・削除と、その時刻以降に期限切れになったピンを返します。
+# 変更履歴は PIN_CHANGE_RETENTION_DAYS 日分だけ残すので、それより古いカーソルには CursorExpired を返し、
+# 全件を取り直してもらいます。
+
+from datetime import datetime
+from sqlalchemy import func, or_
+from SQLAlchemy_models import db, Pin, PinChange, EXPIRY_TZ, expiry_now
+
+
+class CursorExpired(Exception):
+    """カーソル以降の変更履歴の一部が既に消されている"""
+
+
+def make_cursor(change_id, at):
+    return f"{change_id}.{int(at.replace(tzinfo=EXPIRY_TZ).timestamp())}"
+
+
+def parse_cursor(value):
+    """カーソル文字列を (変更履歴ID, 時刻) にする。不正な値は ValueError"""
+    change_id, ts = value.split(".")
+    return int(change_id), datetime.fromtimestamp(int(ts), EXPIRY_TZ).replace(tzinfo=None)
+
+
+def latest_change_id():
+    """最新の変更履歴ID(主キーの最大値なので1回のインデックス参照で済む)"""
+    return db.session.execute(db.select(func.max(PinChange.id))).scalar() or 0
+
+
+def current_cursor(last_id=None):
+    """全件取得の直前に呼び、その時点のカーソルを返す"""
+    if last_id is None:
+        last_id = latest_change_id()
+    return make_cursor(last_id, expiry_now())
+
+
+def changes_since(cursor, query=None):
+    """カーソル以降の (表示するピン, 消すピンID, 新しいカーソル) を返す
+
+    query を渡すとピンの取得をその条件(bbox など)で絞り込む。
+    """
+    since_id, since_at = parse_cursor(cursor)
+    now = expiry_now()
+
+    # since_id の次の履歴より前が消されていれば差分を作れない
+    oldest_id = db.session.execute(db.select(func.min(PinChange.id))).scalar()
+    if oldest_id is not None and oldest_id > since_id + 1:
+        raise CursorExpired(cursor)
+
+    # 同じピンの変更が複数あれば最後の操作だけを見る
+    rows = db.session.execute(
+        db.select(PinChange.id, PinChange.pin_id, PinChange.op).where(PinChange.id > since_id).order_by(PinChange.id)
+    ).all()
+    last_op = {pin_id: op for _, pin_id, op in rows}
+    last_id = rows[-1].id if rows else since_id
+
+    removed = {pin_id for pin_id, op in last_op.items() if op == "delete"}
+    upserted = [pin_id for pin_id, op in last_op.items() if op == "upsert"]
+
+    pins = []
+    if upserted:
+        query = query if query is not None else Pin.query
+        pins = query.filter(
+            Pin.id.in_(upserted), or_(Pin.expires_at.is_(None), Pin.expires_at > now)
+        ).all()
+        # 期限切れや表示範囲外になったピンは消す側に回す
+        removed.update(set(upserted) - {p.id for p in pins})
+
+    # 前回の同期から今回までの間に期限を迎えたピン
+    expired = db.session.execute(
+        db.select(Pin.id).where(Pin.expires_at > since_at, Pin.expires_at <= now)
+    ).scalars()
+    removed.update(expired)
+
+    return pins, sorted(removed), make_cursor(last_id, now)
@@ -0,0 +1,80 @@
+# 旅路一覧用の要約(経由ピン数・範囲・長さ・分類ごとのピン数・表紙のサムネイル)用ファイルです。
+# 要約は routes テーブルの列に持ち、旅路の登録時(add_route・flask pins import --kind routes)に書きます。
+# 一覧は経由ピンを読まずに routes の (name, id) インデックスだけで返せます。
+# 既存の旅路は flask pins rebuild-route-summaries で作り直します。
+
+import numpy as np
+from SQLAlchemy_models import db, Pin, Route, RoutePin
+from images import variant_urls
+from spatial import haversine_m
+
+# 表紙に使う縮小版(一覧のサムネイル)
+THUMBNAIL_SIZE = "list"
+THUMBNAIL_FORMAT = "webp"
+
+
+def thumbnail_url(image_url):
+    variants = variant_urls(image_url)
+    return variants[THUMBNAIL_SIZE][THUMBNAIL_FORMAT] if variants else None
+
+
+def summarize_route(stops, image_url):
+    """経由順の [(lat, lng, category), ...] から Route の要約列の dict を作る"""
+    summary = {"stop_count": len(stops), "thumbnail_url": thumbnail_url(image_url)}
+    if not stops:
+        return dict(summary, min_lat=None, min_lng=None, max_lat=None, max_lng=None, length_m=0.0, category_counts={})
+
+    lat = np.array([s[0] for s in stops], dtype=np.float64)
+    lng = np.array([s[1] for s in stops], dtype=np.float64)
+    # 長さは経由ピン間の直線距離の合計(道なりの距離は /api/routes/<id>/path)
+    length = float(haversine_m(lat[:-1], lng[:-1], lat[1:], lng[1:]).sum()) if len(stops) > 1 else 0.0
+    counts = {}
+    for s in stops:
+        counts[str(s[2])] = counts.get(str(s[2]), 0) + 1
+    return dict(
+        summary,
+        min_lat=float(lat.min()),
+        min_lng=float(lng.min()),
+        max_lat=float(lat.max()),
+        max_lng=float(lng.max()),
+        length_m=round(length, 1),
+        category_counts=counts,
+    )
+
+
+def update_route_summaries(route_ids):
+    """route_ids の要約を経由ピンの JOIN 1回で作り直す(コミットは呼び出し側)"""
+    route_ids = list(route_ids)
+    if not route_ids:
+        return
+    images = dict(db.session.execute(db.select(Route.id, Route.image_url).where(Route.id.in_(route_ids))).all())
+    stops = {route_id: [] for route_id in images}
+    for r in db.session.execute(
+        db.select(RoutePin.route_id, Pin.lat, Pin.lng, Pin.category)
+        .join(Pin, Pin.id == RoutePin.pin_id)
+        .where(RoutePin.route_id.in_(route_ids))
+        .order_by(RoutePin.route_id, RoutePin.order)
+    ):
+        stops[r.route_id].append((r.lat, r.lng, r.category))
+
+    db.session.execute(
+        db.update(Route),
+        [dict(summarize_route(s, images[route_id]), id=route_id) for route_id, s in stops.items()],
+    )
+
+
+def rebuild_route_summaries(batch_size=500):
+    """全旅路の要約を batch_size 件ずつ作り直し、件数を返す"""
+    total = 0
+    last_id = 0
+    while True:
+        ids = db.session.execute(
+            db.select(Route.id).where(Route.id > last_id).order_by(Route.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        update_route_summaries(ids)
+        db.session.commit()
+        total += len(ids)
+        last_id = ids[-1]
+    return total
@@ -1,11 +1,27 @@
 # ページのルーティング設定ファイルです。
 
-from flask import Blueprint, render_template, request, jsonify, url_for, current_app
+from flask import Blueprint, abort, render_template, request, jsonify, url_for, current_app
 from flask_login import login_required, current_user
-from SQLAlchemy_models import db, Pin, Route, RoutePin
-from datetime import datetime, timezone
-from werkzeug.utils import secure_filename
-import os
+from SQLAlchemy_models import db, Pin, Route, RoutePin, expiry_now
+from db_engine import read_only
+from spatial import parse_bbox, filter_bbox, TILE_ZOOM
+from clusters import add_pins_to_clusters, query_clusters
+from pin_sync import parse_cursor, current_cursor, changes_since, latest_change_id, CursorExpired
+from pin_cache import pins_cache, cache_key, encode_json, send_cached
+from pin_nearby import pin_index
+from pin_search import search_pins
+from streaming import STREAM_YIELD_PER, stream_json_array
+from images import allowed_file, save_upload, upload_error, variant_urls
+from walking import get_walk_graph
+from route_summary import summarize_route
+from geocoding import get_geocoder, GeocoderBusy
+from datetime import datetime
+from sqlalchemy import and_, false, or_
+from sqlalchemy.orm import load_only
+from werkzeug.exceptions import NotFound, RequestEntityTooLarge, UnsupportedMediaType
+import base64
+import binascii
+import json
 
 
 routes_bp = Blueprint("routes", __name__)
@@ -23,49 +39,337 @@ def map_page():
     return render_template("map.html", user=current_user)
 
 
+# ?fields= で指定できる項目(id は常に返す)。image_variants は image_url から作る
+PIN_FIELDS = (
+    "id", "lat", "lng", "title", "category", "description", "caution",
+    "image_url", "image_variants", "created_at", "expires_at", "user_id",
+)
+
+# ?limit= の上限
+MAX_PIN_LIMIT = 1000
+
+
+def pin_to_dict(p, fields=PIN_FIELDS):
+    result = {}
+    for f in fields:
+        if f == "image_variants":
+            result[f] = variant_urls(p.image_url)
+            continue
+        value = getattr(p, f)
+        if f in ("created_at", "expires_at"):
+            value = value.isoformat() if value else None
+        result[f] = value
+    return result
+
+
+def pin_columns(fields):
+    """fields を返すのに必要な Pin の列(image_variants は image_url から作る)"""
+    names = [f for f in fields if f != "image_variants"]
+    if "image_variants" in fields and "image_url" not in names:
+        names.append("image_url")
+    return [getattr(Pin, f) for f in names]
+
+
+def parse_fields(value):
+    """"id,title,lat" を PIN_FIELDS の並びのタプルにする。未知の項目は ValueError"""
+    names = {f.strip() for f in value.split(",") if f.strip()}
+    unknown = names - set(PIN_FIELDS)
+    if unknown:
+        raise ValueError(f"未知の項目です: {', '.join(sorted(unknown))}")
+    return tuple(f for f in PIN_FIELDS if f in names or f == "id")
+
+
+def encode_cursor(key):
+    """キーセットページングの位置(前ページ最後の行のキーのリスト)を URL に使える文字列にする"""
+    return base64.urlsafe_b64encode(encode_json(key)).decode()
+
+
+def decode_cursor(value, types=None):
+    """encode_cursor の逆。types (例: (str, int)) を指定すると、キーの数と型が違えば ValueError"""
+    key = json.loads(base64.urlsafe_b64decode(value.encode()))
+    if types is not None and not (
+        isinstance(key, list)
+        and len(key) == len(types)
+        and all(isinstance(v, t) and not isinstance(v, bool) for v, t in zip(key, types))
+    ):
+        raise ValueError("カーソルの形式が不正です")
+    return key
+
+
+def encode_page_cursor(pin, sort):
+    return encode_cursor([pin.title, pin.id] if sort == "title" else [pin.id])
+
+
+def filter_after(query, after, sort):
+    """キーセットページング: 前ページ最後の (title, id) または id より後ろだけにする
+    キーの数・型が並び順の列と合わなければ ValueError
+    """
+    if sort == "title":
+        title, pin_id = decode_cursor(after, (str, int))
+        return query.filter(or_(Pin.title > title, and_(Pin.title == title, Pin.id > pin_id)))
+    (pin_id,) = decode_cursor(after, (int,))
+    return query.filter(Pin.id > pin_id)
+
+
 @api_bp.route("/pins", methods=["GET"])
+@read_only
 def get_pins():
+    # 表示範囲: ?bbox=西,南,東,北 (省略時は地域全体)、?z=ズームレベル(任意)
+    # 差分同期: ?since=カーソル (X-Pins-Cursor ヘッダーまたは前回の cursor の値)
+    # 絞り込み: ?category=分類&sort=title&fields=id,title,...&limit=件数&after=X-Next-Cursor の値
+    # 大量に取得する場合: ?stream=1 (少しずつ送る)
+    bbox = (MIN_LNG, MIN_LAT, MAX_LNG, MAX_LAT)
+    zoom = TILE_ZOOM
+    since = request.args.get("since")
+    sort = request.args.get("sort", "id")
+    fields = PIN_FIELDS
+    limit = None
+    try:
+        if request.args.get("bbox"):
+            bbox = parse_bbox(request.args["bbox"], (MIN_LAT, MAX_LAT, MIN_LNG, MAX_LNG))
+        if request.args.get("z"):
+            zoom = int(request.args["z"])
+        if since:
+            parse_cursor(since)
+        if sort not in ("id", "title"):
+            raise ValueError("sort は id または title です")
+        if request.args.get("fields"):
+            fields = parse_fields(request.args["fields"])
+        if request.args.get("limit"):
+            limit = int(request.args["limit"])
+            if not (1 <= limit <= MAX_PIN_LIMIT):
+                raise ValueError("limit が範囲外です")
+
+        # 覆うタイルの計算も検証の一部として行う(不正な値は 400)
+        if request.args.get("bbox"):
+            # 地域範囲外の表示範囲にはピンがない
+            query = filter_bbox(Pin.query, Pin, bbox, max_zoom=zoom) if bbox else Pin.query.filter(false())
+        else:
+            # 地域全体ならタイル検索は不要(分類などのインデックスを使わせる)
+            query = Pin.query.filter(Pin.lat.between(MIN_LAT, MAX_LAT), Pin.lng.between(MIN_LNG, MAX_LNG))
+    except ValueError:
+        return jsonify({"error": "bbox・z・since・sort・fields・limit の指定が不正です"}), 400
+    query = query.filter(Pin.not_expired())
+
+    if request.args.get("category"):
+        try:
+            query = query.filter(Pin.category == int(request.args["category"]))
+        except ValueError:
+            return jsonify({"error": "分類の指定が不正です"}), 400
+
+    # ?stream=1 なら列だけを少しずつ読んでチャンク転送で送る(キャッシュ・ETag・X-Next-Cursor は使わない)
+    stream = request.args.get("stream") == "1"
+
+    # 必要な列だけ読む(キャッシュ期限の計算に expires_at、ページングに title も使う)
+    if fields != PIN_FIELDS and not stream:
+        columns = set(fields) - {"image_variants"} | {"expires_at"} | ({"title"} if sort == "title" else set())
+        if "image_variants" in fields:
+            columns.add("image_url")
+        query = query.options(load_only(*[getattr(Pin, c) for c in columns]))
+
     try:
-        pins = Pin.query.filter(Pin.lat.between(MIN_LAT, MAX_LAT), Pin.lng.between(MIN_LNG, MAX_LNG)).all()
-
-        result = [
-            {
-                "id": p.id,
-                "lat": p.lat,
-                "lng": p.lng,
-                "title": p.title,
-                "category": p.category,
-                "description": p.description,
-                "caution": p.caution,
-                "image_url": p.image_url,
-                "created_at": p.created_at.isoformat(),
-                "expires_at": p.expires_at.isoformat() if p.expires_at else None,
-                "user_id": p.user_id,
-            }
-            for p in pins
-        ]
-
-        current_app.logger.info(f"{len(result)} 件のピンを取得しました")
-        return jsonify(result)
+        if since:
+            try:
+                pins, removed, cursor = changes_since(since, query)
+            except CursorExpired:
+                # 変更履歴が残っていないので、since なしで全件を取り直してもらう
+                return jsonify({"error": "カーソルが古すぎます", "reset": True}), 410
+            return jsonify({"cursor": cursor, "pins": [pin_to_dict(p, fields) for p in pins], "removed": removed})
+
+        query = query.order_by(Pin.title, Pin.id) if sort == "title" else query.order_by(Pin.id)
+        if request.args.get("after"):
+            try:
+                query = filter_after(query, request.args["after"], sort)
+            except (ValueError, binascii.Error):
+                return jsonify({"error": "after の指定が不正です"}), 400
+
+        # 全件取得の前に変更履歴IDを決めておき、取得中の変更は次回の差分で拾う
+        version = latest_change_id()
+        if stream:
+            rows = query.with_entities(*pin_columns(fields)).limit(limit).yield_per(STREAM_YIELD_PER)
+            return stream_json_array(
+                rows, lambda r: pin_to_dict(r, fields), headers={"X-Pins-Cursor": current_cursor(version)}
+            )
+
+        key = cache_key(request.args)
+        entry = pins_cache.get(key, version)
+        if entry is None:
+            pins = query.limit(limit).all() if limit else query.all()
+            result = [pin_to_dict(p, fields) for p in pins]
+
+            headers = {"X-Pins-Cursor": current_cursor(version)}
+            if limit and len(pins) == limit:
+                headers["X-Next-Cursor"] = encode_page_cursor(pins[-1], sort)
+
+            # 含まれるピンのうち最も早い表示期限までキャッシュを使う
+            now = expiry_now()
+            valid_until = min((p.expires_at for p in pins if p.expires_at and p.expires_at > now), default=None)
+            entry = pins_cache.put(key, version, encode_json(result), headers=headers, valid_until=valid_until)
+            current_app.logger.info(f"{len(result)} 件のピンを取得しました")
+
+        return send_cached(entry)
 
     except Exception:
         current_app.logger.exception("ピン取得中にエラーが発生しました")
         return jsonify({"error": "ピン取得に失敗しました"}), 500
 
 
-# 一関・平泉の地域範囲設定
-MIN_LAT, MAX_LAT = 38.75, 39.05
-MIN_LNG, MAX_LNG = 140.95, 141.30
+# ズームアウト時の集約表示: ?z=地図のズーム&bbox=西,南,東,北
+@api_bp.route("/pins/clusters", methods=["GET"])
+@read_only
+def get_pin_clusters():
+    bbox = (MIN_LNG, MIN_LAT, MAX_LNG, MAX_LAT)
+    try:
+        zoom = int(request.args["z"])
+        if request.args.get("bbox"):
+            bbox = parse_bbox(request.args["bbox"], (MIN_LAT, MAX_LAT, MIN_LNG, MAX_LNG))
+    except (KeyError, ValueError):
+        return jsonify({"error": "z と bbox を正しく指定してください"}), 400
+
+    if bbox is None:
+        return jsonify([])
+
+    try:
+        return jsonify(query_clusters(bbox, zoom))
+    except Exception:
+        current_app.logger.exception("ピン集約の取得中にエラーが発生しました")
+        return jsonify({"error": "ピン集約の取得に失敗しました"}), 500
+
+
+# 近くのピン検索の半径(m)の既定値・上限と、件数 k の既定値・上限
+DEFAULT_NEARBY_RADIUS = 1000
+MAX_NEARBY_RADIUS = 20000
+DEFAULT_NEARBY_K = 20
+MAX_NEARBY_K = 100
+
+
+# 近くのピン: ?lat=&lng= (または ?pin_id= でそのピンの周り)&radius=半径m&k=件数&fields=...
+@api_bp.route("/pins/nearby", methods=["GET"])
+@read_only
+def get_nearby_pins():
+    try:
+        radius = float(request.args.get("radius", DEFAULT_NEARBY_RADIUS))
+        k = int(request.args.get("k", DEFAULT_NEARBY_K))
+        fields = parse_fields(request.args["fields"]) if request.args.get("fields") else PIN_FIELDS
+        pin_id = request.args.get("pin_id", type=int)
+        if pin_id is None:
+            lat, lng = float(request.args["lat"]), float(request.args["lng"])
+            if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                raise ValueError
+    except (KeyError, ValueError):
+        return jsonify({"error": "lat・lng(または pin_id)・radius・k を正しく指定してください"}), 400
+    if not (0 < radius <= MAX_NEARBY_RADIUS) or not (1 <= k <= MAX_NEARBY_K):
+        return jsonify({"error": f"radius は {MAX_NEARBY_RADIUS}m 以下、k は 1〜{MAX_NEARBY_K} で指定してください"}), 400
+
+    try:
+        if pin_id is not None:
+            center = db.session.get(Pin, pin_id)
+            if center is None:
+                abort(404)
+            lat, lng = center.lat, center.lng
+
+        pin_index.sync()
+        hits = pin_index.nearby(lat, lng, radius, k=k, exclude=pin_id)
+        pins = {p.id: p for p in Pin.query.filter(Pin.id.in_([i for i, _ in hits]))} if hits else {}
+
+        result = []
+        for i, distance in hits:
+            if i in pins:
+                item = pin_to_dict(pins[i], fields)
+                item["distance_m"] = round(distance, 1)
+                result.append(item)
+        return current_app.response_class(encode_json(result), mimetype="application/json")
+
+    except NotFound:
+        raise
+    except Exception:
+        current_app.logger.exception("近くのピンの取得中にエラーが発生しました")
+        return jsonify({"error": "近くのピンの取得に失敗しました"}), 500
+
+
+# 全文検索の件数の既定値・上限
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+
+# ピンの検索: ?q=検索語(空白区切りで AND)&limit=件数&category=分類&fields=...
+@api_bp.route("/pins/search", methods=["GET"])
+@read_only
+def search_pins_api():
+    q = request.args.get("q", "").strip()
+    try:
+        limit = int(request.args.get("limit", DEFAULT_SEARCH_LIMIT))
+        category = request.args.get("category", type=int)
+        fields = parse_fields(request.args["fields"]) if request.args.get("fields") else PIN_FIELDS
+    except ValueError:
+        return jsonify({"error": "limit・category・fields を正しく指定してください"}), 400
+    if not q:
+        return jsonify({"error": "検索語を入力してください"}), 400
+    if not (1 <= limit <= MAX_SEARCH_LIMIT):
+        return jsonify({"error": f"limit は 1〜{MAX_SEARCH_LIMIT} で指定してください"}), 400
+
+    try:
+        pins = search_pins(q, limit=limit, category=category)
+        return current_app.response_class(encode_json([pin_to_dict(p, fields) for p in pins]), mimetype="application/json")
+    except Exception:
+        current_app.logger.exception("ピン検索中にエラーが発生しました")
+        return jsonify({"error": "ピン検索に失敗しました"}), 500
+
+
+# 住所検索の件数の既定値・上限
+DEFAULT_GEOCODE_LIMIT = 5
+MAX_GEOCODE_LIMIT = 20
 
-# 画像ファイルの設定
-UPLOAD_FOLDER = "static/uploads"
-ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg"}
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# 住所 → 座標: ?q=住所&limit=件数(地域の住所データになければ外部サービスに問い合わせる)
+@api_bp.route("/geocode", methods=["GET"])
+@login_required
+def geocode():
+    q = request.args.get("q", "").strip()
+    try:
+        limit = int(request.args.get("limit", DEFAULT_GEOCODE_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit を正しく指定してください"}), 400
+    if not q:
+        return jsonify({"error": "住所を入力してください"}), 400
+    if not (1 <= limit <= MAX_GEOCODE_LIMIT):
+        return jsonify({"error": f"limit は 1〜{MAX_GEOCODE_LIMIT} で指定してください"}), 400
+
+    try:
+        return current_app.response_class(encode_json(get_geocoder().geocode(q, limit)), mimetype="application/json")
+    except GeocoderBusy:
+        return jsonify({"error": "住所検索が混み合っています"}), 503
+    except Exception:
+        current_app.logger.exception("住所検索中にエラーが発生しました")
+        return jsonify({"error": "住所検索に失敗しました"}), 502
 
-def allowed_file(filename):
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# 座標 → 住所: ?lat=&lng=
+@api_bp.route("/reverse-geocode", methods=["GET"])
+@login_required
+def reverse_geocode():
+    try:
+        lat, lng = float(request.args["lat"]), float(request.args["lng"])
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError
+    except (KeyError, ValueError):
+        return jsonify({"error": "lat・lng を正しく指定してください"}), 400
+
+    try:
+        result = get_geocoder().reverse(lat, lng)
+    except GeocoderBusy:
+        return jsonify({"error": "住所の取得が混み合っています"}), 503
+    except Exception:
+        current_app.logger.exception("逆ジオコーディング中にエラーが発生しました")
+        return jsonify({"error": "住所の取得に失敗しました"}), 502
+    if result is None:
+        return jsonify({"error": "住所が見つかりませんでした"}), 404
+    return current_app.response_class(encode_json(result), mimetype="application/json")
+
+
+# 一関・平泉の地域範囲設定
+MIN_LAT, MAX_LAT = 38.75, 39.05
+MIN_LNG, MAX_LNG = 140.95, 141.30
 
 @api_bp.route("/pins", methods=["POST"])
 @login_required
@@ -101,13 +405,14 @@ def add_pin():
         if not description:
             return jsonify({"error": "説明は必須です"}), 400
 
-        # 画像処理
+        # 画像処理(内容のハッシュ名で保存し、縮小版は別スレッドで作成)
         image_url = None
         image_file = request.files.get("image")
         if image_file and allowed_file(image_file.filename):
-            filename = secure_filename(f"{datetime.now(timezone.utc).timestamp()}_{image_file.filename}")
-            save_path = os.path.join(UPLOAD_FOLDER, filename)
-            image_file.save(save_path)
+            try:
+                filename = save_upload(image_file)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
             image_url = url_for("static", filename=f"uploads/{filename}", _external=True)
 
         # DB登録
@@ -123,9 +428,18 @@ def add_pin():
             user_id=current_user.id,
         )
         db.session.add(new_pin)
+        db.session.flush()  # tile_key確定のためflush
+        add_pins_to_clusters([new_pin])
         db.session.commit()
+        pins_cache.invalidate()
+        pin_index.refresh()
         current_app.logger.info(f"新しいピンを追加しました: id={new_pin.id}, user_id={current_user.id}")
-        return jsonify({"success": True, "id": new_pin.id})
+        return jsonify({"success": True, "id": new_pin.id, "image_url": image_url, "image_variants": variant_urls(image_url)})
+
+    except (RequestEntityTooLarge, UnsupportedMediaType) as e:
+        # 画像が大きすぎる・画像でない場合は受信途中で打ち切られる
+        message, status = upload_error(e)
+        return jsonify({"error": message}), status
 
     except Exception:
         current_app.logger.exception("ピン追加中に予期せぬエラーが発生しました")
@@ -146,60 +460,165 @@ def add_route():
         if not name or not description or not route_pins or not image_file:
             return jsonify({"error": "すべての項目が必須です"}), 400
 
+        # 経由ピンの形式チェック
+        try:
+            pins_list = [{"pin_id": int(rp["pin_id"]), "order": int(rp["order"])} for rp in json.loads(route_pins)]
+        except (ValueError, TypeError, KeyError):
+            return jsonify({"error": "経由するピンの指定が不正です"}), 400
+        if not pins_list:
+            return jsonify({"error": "経由するピンを選択してください"}), 400
+
+        # 存在しないピンがないかを IN 1回で確認(座標・分類は一覧用の要約に使う)
+        pin_ids = {rp["pin_id"] for rp in pins_list}
+        found = {
+            r.id: (r.lat, r.lng, r.category)
+            for r in db.session.execute(db.select(Pin.id, Pin.lat, Pin.lng, Pin.category).where(Pin.id.in_(pin_ids)))
+        }
+        if found.keys() != pin_ids:
+            missing = ", ".join(str(i) for i in sorted(pin_ids - found.keys()))
+            return jsonify({"error": f"存在しないピンが含まれています: {missing}"}), 400
+
         # 画像保存
-        filename = secure_filename(f"{datetime.now(timezone.utc).timestamp()}_{image_file.filename}")
-        save_path = os.path.join("static/uploads", filename)
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        image_file.save(save_path)
+        if not allowed_file(image_file.filename):
+            return jsonify({"error": "画像は png・jpg・jpeg のいずれかにしてください"}), 400
+        try:
+            filename = save_upload(image_file)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         image_url = url_for("static", filename=f"uploads/{filename}", _external=True)
 
-        # Route 作成
-        new_route = Route(name=name, description=description, image_url=image_url, user_id=current_user.id)
+        # Route 作成(経由ピン数・範囲・長さなどの要約も一緒に保存する)
+        stops = [found[rp["pin_id"]] for rp in sorted(pins_list, key=lambda rp: rp["order"])]
+        new_route = Route(
+            name=name,
+            description=description,
+            image_url=image_url,
+            user_id=current_user.id,
+            **summarize_route(stops, image_url),
+        )
         db.session.add(new_route)
         db.session.flush()  # ID取得用にコミット前にflush
 
-        import json
-
-        pins_list = json.loads(route_pins)
-        for rp in pins_list:
-            route_pin = RoutePin(route_id=new_route.id, pin_id=rp["pin_id"], order=rp["order"])
-            db.session.add(route_pin)
+        # 経由ピンは executemany でまとめて登録
+        db.session.execute(db.insert(RoutePin), [dict(rp, route_id=new_route.id) for rp in pins_list])
 
         db.session.commit()
-        return jsonify({"success": True, "route_id": new_route.id})
+        return jsonify(
+            {"success": True, "route_id": new_route.id, "image_url": image_url, "image_variants": variant_urls(image_url)}
+        )
+
+    except (RequestEntityTooLarge, UnsupportedMediaType) as e:
+        message, status = upload_error(e)
+        return jsonify({"error": message}), status
 
     except Exception:
         current_app.logger.exception("旅路登録エラー")
         return jsonify({"error": "旅路の登録に失敗しました"}), 500
 
 
-# 全旅路の名前と写真のみ取得
+# 旅路一覧の ?limit= の既定値・上限
+DEFAULT_ROUTE_LIMIT = 50
+MAX_ROUTE_LIMIT = 200
+
+# 一覧で返す列(経由ピンは読まず、routes の要約列だけで作る)
+ROUTE_LIST_COLUMNS = (
+    Route.id, Route.name, Route.image_url, Route.thumbnail_url, Route.stop_count,
+    Route.min_lat, Route.min_lng, Route.max_lat, Route.max_lng, Route.length_m, Route.category_counts,
+)
+
+
+def route_to_dict(route):
+    bbox = [route.min_lng, route.min_lat, route.max_lng, route.max_lat] if route.min_lat is not None else None
+    return {
+        "id": route.id,
+        "name": route.name,
+        "image_url": route.image_url,
+        "image_variants": variant_urls(route.image_url),
+        "thumbnail_url": route.thumbnail_url,
+        "stop_count": route.stop_count,
+        "bbox": bbox,
+        "length_m": route.length_m,
+        "categories": route.category_counts,
+    }
+
+
+# 旅路一覧(名前順): ?limit=件数&after=X-Next-Cursor の値(?stream=1 なら全件を少しずつ送る)
 @routes_bp.route("/api/routes", methods=["GET"])
+@read_only
 def get_routes():
-    routes = Route.query.order_by(Route.name.asc()).all()  # nameの昇順
-    routes_list = []
-    for route in routes:
-        routes_list.append({"id": route.id, "name": route.name, "image_url": route.image_url})
-    return jsonify(routes_list)
+    # ORM のオブジェクトは作らず、(name, id) のインデックス順に要約の列だけを読む
+    query = db.select(*ROUTE_LIST_COLUMNS).order_by(Route.name.asc(), Route.id.asc())  # nameの昇順
+    if request.args.get("stream") == "1":
+        rows = db.session.execute(query.execution_options(yield_per=STREAM_YIELD_PER))
+        return stream_json_array(rows, route_to_dict)
+
+    try:
+        limit = int(request.args.get("limit", DEFAULT_ROUTE_LIMIT))
+        if not (1 <= limit <= MAX_ROUTE_LIMIT):
+            raise ValueError
+        if request.args.get("after"):
+            name, route_id = decode_cursor(request.args["after"], (str, int))
+            query = query.where(or_(Route.name > name, and_(Route.name == name, Route.id > route_id)))
+    except (ValueError, TypeError, binascii.Error):
+        return jsonify({"error": f"limit(1〜{MAX_ROUTE_LIMIT})・after の指定が不正です"}), 400
+
+    rows = db.session.execute(query.limit(limit)).all()
+    response = jsonify([route_to_dict(r) for r in rows])
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor([rows[-1].name, rows[-1].id])
+    return response
 
 
 # 特定旅路のピン一覧取得（RoutePin）
 @routes_bp.route("/api/routes/<int:route_id>/pins", methods=["GET"])
+@read_only
 def get_route_pins(route_id):
-    route = Route.query.get_or_404(route_id)
-    # order順にソートして返す
-    route_pins = RoutePin.query.filter_by(route_id=route.id).order_by(RoutePin.order.asc()).all()
-    pins_list = []
-    for rp in route_pins:
-        pins_list.append(
-            {
-                "id": rp.pin.id,
-                "title": rp.pin.title,
-                "description": rp.pin.description,
-                "lat": rp.pin.lat,
-                "lng": rp.pin.lng,
-                "image_url": rp.pin.image_url,
-                "order": rp.order,
-            }
-        )
+    # route_pins と pins を JOIN して1回で取得(order順は (route_id, order) インデックスで読む)
+    rows = db.session.execute(
+        db.select(RoutePin.order, Pin.id, Pin.title, Pin.description, Pin.lat, Pin.lng, Pin.image_url)
+        .join(Pin, Pin.id == RoutePin.pin_id)
+        .where(RoutePin.route_id == route_id)
+        .order_by(RoutePin.order.asc())
+    ).all()
+
+    # ピンがない場合だけ旅路の有無を確認する
+    if not rows and db.session.get(Route, route_id) is None:
+        abort(404)
+
+    pins_list = [
+        {
+            "id": r.id,
+            "title": r.title,
+            "description": r.description,
+            "lat": r.lat,
+            "lng": r.lng,
+            "image_url": r.image_url,
+            "image_variants": variant_urls(r.image_url),
+            "order": r.order,
+        }
+        for r in rows
+    ]
     return jsonify(pins_list)
+
+
+# 特定旅路の徒歩経路(経由ピン間を道なりに結んだ経路・距離・所要時間)
+@routes_bp.route("/api/routes/<int:route_id>/path", methods=["GET"])
+@read_only
+def get_route_path(route_id):
+    graph = get_walk_graph()
+    if graph is None:
+        return jsonify({"error": "徒歩経路の地図データが読み込まれていません"}), 503
+
+    rows = db.session.execute(
+        db.select(Pin.id, Pin.lat, Pin.lng)
+        .join(RoutePin, RoutePin.pin_id == Pin.id)
+        .where(RoutePin.route_id == route_id)
+        .order_by(RoutePin.order.asc())
+    ).all()
+    if not rows and db.session.get(Route, route_id) is None:
+        abort(404)
+
+    result = graph.route([(r.lat, r.lng) for r in rows])
+    for leg, (a, b) in zip(result["legs"], zip(rows, rows[1:])):
+        leg["from_pin_id"], leg["to_pin_id"] = a.id, b.id
+    return current_app.response_class(encode_json(dict(result, route_id=route_id)), mimetype="application/json")
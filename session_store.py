@@ -0,0 +1,153 @@
+# ログインセッションの保存先用ファイルです。
+# SESSION_TYPE で保存先を選びます。
+#   "sqlite"     … instance/sessions.db(WAL)。主キー1回の参照で読み、期限切れはまとめて削除(既定)
+#   "memory"     … プロセス内の LRU。開発用(ワーカー1つ・再起動で全員ログアウト)
+#   "redis"      … SESSION_REDIS_URL の Redis(互換サーバー)。期限切れは Redis 側で消える
+#   "filesystem" … 従来どおり Flask-Session のファイル保存
+# セッションの中身は Flask-Session と同じ msgpack で保存します。
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask_session import Session
+from flask_session.base import ServerSideSessionInterface
+from flask_session.defaults import Defaults
+
+# 期限切れセッションを1回の DELETE で消す件数
+CLEANUP_BATCH_SIZE = 1000
+
+
+def _common_params(app):
+    config = app.config
+    return {
+        "key_prefix": config.get("SESSION_KEY_PREFIX", Defaults.SESSION_KEY_PREFIX),
+        "use_signer": config.get("SESSION_USE_SIGNER", Defaults.SESSION_USE_SIGNER),
+        "permanent": config.get("SESSION_PERMANENT", Defaults.SESSION_PERMANENT),
+        "sid_length": config.get("SESSION_ID_LENGTH", Defaults.SESSION_ID_LENGTH),
+        "serialization_format": config.get("SESSION_SERIALIZATION_FORMAT", Defaults.SESSION_SERIALIZATION_FORMAT),
+    }
+
+
+class SQLiteSessionInterface(ServerSideSessionInterface):
+    """SQLite(WAL)のテーブルに保存する。アプリの DB とは別ファイルなので、ピン登録の書き込みと競合しない"""
+
+    ttl = False  # 期限切れは SESSION_CLEANUP_N_REQUESTS 回に1回程度、まとめて消す
+
+    def __init__(self, app, path, cleanup_n_requests=None, **params):
+        self.path = path
+        self._local = threading.local()
+        super().__init__(app, cleanup_n_requests=cleanup_n_requests, **params)
+        # テーブル作成の接続は使い回さない(gunicorn --preload で fork 先に持ち越さない)
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id TEXT PRIMARY KEY, data BLOB NOT NULL, expires_at INTEGER NOT NULL) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)")
+        finally:
+            conn.close()
+        os.register_at_fork(after_in_child=self._forget_connections)
+
+    def _forget_connections(self):
+        # fork 元のスレッドの接続は子プロセスでは使わず、必要になったら作り直す
+        self._local = threading.local()
+
+    def _connect(self):
+        # 接続はスレッドごとに1つ作って使い回す
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _retrieve_session_data(self, store_id):
+        row = self._connect().execute(
+            "SELECT data FROM sessions WHERE id = ? AND expires_at > ?", (store_id, int(time.time()))
+        ).fetchone()
+        return self.serializer.decode(row[0]) if row else None
+
+    def _delete_session(self, store_id):
+        self._connect().execute("DELETE FROM sessions WHERE id = ?", (store_id,))
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        self._connect().execute(
+            "INSERT INTO sessions (id, data, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at",
+            (store_id, self.serializer.encode(session), int(time.time() + session_lifetime.total_seconds())),
+        )
+
+    def _delete_expired_sessions(self):
+        # 書き込みロックを長く持たないよう、ix_sessions_expires_at で CLEANUP_BATCH_SIZE 件ずつ消す
+        conn = self._connect()
+        now = int(time.time())
+        while True:
+            deleted = conn.execute(
+                "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions WHERE expires_at <= ? LIMIT ?)",
+                (now, CLEANUP_BATCH_SIZE),
+            ).rowcount
+            if deleted < CLEANUP_BATCH_SIZE:
+                break
+
+
+class MemorySessionInterface(ServerSideSessionInterface):
+    """プロセス内の LRU に保存する(開発用)"""
+
+    def __init__(self, app, max_entries=10000, **params):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        super().__init__(app, **params)
+
+    def _retrieve_session_data(self, store_id):
+        with self._lock:
+            entry = self._entries.get(store_id)
+            if entry is None:
+                return None
+            data, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[store_id]
+                return None
+            self._entries.move_to_end(store_id)
+        return self.serializer.decode(data)
+
+    def _delete_session(self, store_id):
+        with self._lock:
+            self._entries.pop(store_id, None)
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        entry = (self.serializer.encode(session), time.time() + session_lifetime.total_seconds())
+        with self._lock:
+            self._entries[store_id] = entry
+            self._entries.move_to_end(store_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def init_session(app):
+    """SESSION_TYPE に応じてセッションの保存先を設定する"""
+    session_type = app.config["SESSION_TYPE"].lower()
+    if session_type == "sqlite":
+        app.session_interface = SQLiteSessionInterface(
+            app,
+            app.config["SESSION_SQLITE_PATH"],
+            cleanup_n_requests=app.config.get("SESSION_CLEANUP_N_REQUESTS"),
+            **_common_params(app),
+        )
+    elif session_type == "memory":
+        app.session_interface = MemorySessionInterface(
+            app, max_entries=app.config.get("SESSION_MEMORY_MAX_ENTRIES", 10000), **_common_params(app)
+        )
+    else:
+        if session_type == "redis" and app.config.get("SESSION_REDIS") is None:
+            # Redis プロトコルを話すサーバーなら何でもよい(ローカルの redis-server・valkey など)
+            import redis
+
+            app.config["SESSION_REDIS"] = redis.Redis.from_url(app.config["SESSION_REDIS_URL"])
+        Session(app)
+    return app.session_interface
@@ -0,0 +1,109 @@
+# ピンの空間インデックス(タイルキー)用ファイルです。
+# ピンの座標を地図タイルの quadkey に変換して pins.tile_key に保存し、
+# 表示範囲(bbox)を覆うタイルの前方一致検索でインデックスを使った範囲検索を行います。
+
+import math
+
+import mercantile
+import numpy as np
+from sqlalchemy import or_
+
+# tile_key の精度(ズーム18 ≒ 一辺150m弱)
+TILE_ZOOM = 18
+
+# 1回の検索で使うタイル数の上限。超える場合は粗いズームでまとめて覆う
+MAX_COVER_TILES = 16
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def tile_key_for(lat, lng, zoom=TILE_ZOOM):
+    """緯度・経度から quadkey 形式のタイルキーを返す"""
+    return mercantile.quadkey(mercantile.tile(lng, lat, zoom))
+
+
+def tile_keys_for(lat, lng, zoom=TILE_ZOOM):
+    """tile_key_for の配列版。mercantile と同じ式を NumPy でまとめて計算し、文字列の配列を返す"""
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    n = 1 << zoom
+    sinlat = np.sin(np.radians(lat))
+    x = lng / 360.0 + 0.5
+    y = 0.5 - 0.25 * np.log((1.0 + sinlat) / (1.0 - sinlat)) / np.pi
+    xtile = np.clip(np.floor((x + 1e-14) * n), 0, n - 1).astype(np.int64)
+    ytile = np.clip(np.floor((y + 1e-14) * n), 0, n - 1).astype(np.int64)
+
+    # quadkey の各桁は x・y の同じ位のビットを組み合わせた 0〜3
+    shifts = np.arange(zoom - 1, -1, -1)
+    digits = ((xtile[:, None] >> shifts) & 1) + 2 * ((ytile[:, None] >> shifts) & 1)
+    return np.ascontiguousarray(digits + ord("0"), dtype=np.uint8).view(f"S{zoom}").ravel().astype(str)
+
+
+def parse_bbox(value, bounds):
+    """"西,南,東,北" 形式の文字列を地域範囲でクリップした (west, south, east, north) にする
+
+    Leaflet の map.getBounds().toBBoxString() と同じ並び。
+    不正な値(nan・inf を含む)は ValueError、地域範囲と重ならない場合は None を返す。
+    """
+    parts = [float(v) for v in value.split(",")]
+    if len(parts) != 4 or not all(math.isfinite(v) for v in parts):
+        raise ValueError("bbox は 西,南,東,北 の4つの数値で指定してください")
+
+    west, south, east, north = parts
+    if west > east or south > north:
+        raise ValueError("bbox の範囲が不正です")
+
+    min_lat, max_lat, min_lng, max_lng = bounds
+    west, east = max(west, min_lng), min(east, max_lng)
+    south, north = max(south, min_lat), min(north, max_lat)
+    if west > east or south > north:
+        return None
+    return west, south, east, north
+
+
+def covering_tiles(bbox, max_zoom=TILE_ZOOM):
+    """bbox を覆うタイルを、枚数が MAX_COVER_TILES 以下になる最も細かいズームで返す"""
+    west, south, east, north = bbox
+    zoom = max(0, min(max_zoom, TILE_ZOOM))
+    while True:
+        # 北西・南東の角からタイル数だけ先に数える(tiles() を全列挙しない)
+        nw = mercantile.tile(west, north, zoom)
+        se = mercantile.tile(east, south, zoom)
+        count = (se.x - nw.x + 1) * (se.y - nw.y + 1)
+        if count <= MAX_COVER_TILES or zoom == 0:
+            return [
+                mercantile.Tile(x, y, zoom)
+                for x in range(nw.x, se.x + 1)
+                for y in range(nw.y, se.y + 1)
+            ]
+        zoom -= 1
+
+
+def tile_key_ranges(bbox, max_zoom=TILE_ZOOM):
+    """bbox を覆う tile_key の半開区間 [start, stop) のリストを返す
+
+    quadkey の桁は 0〜3 なので、prefix に "4" を付けた文字列が区間の上端になる。
+    """
+    prefixes = sorted(mercantile.quadkey(t) for t in covering_tiles(bbox, max_zoom))
+    return [(p, p + "4") for p in prefixes]
+
+
+def filter_bbox(query, model, bbox, max_zoom=TILE_ZOOM):
+    """tile_key の範囲検索(インデックス使用)で絞り込み、lat/lng で正確に切り出す"""
+    west, south, east, north = bbox
+    ranges = [
+        (model.tile_key >= start) & (model.tile_key < stop)
+        for start, stop in tile_key_ranges(bbox, max_zoom)
+    ]
+    return query.filter(
+        or_(*ranges),
+        model.lat.between(south, north),
+        model.lng.between(west, east),
+    )
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """2点間の距離(m)。NumPy 配列を渡すとまとめて計算する"""
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
@@ -21,6 +21,13 @@
     return c ? c.icon : '📦';
   }
 
+  // サイズ別の縮小版(marker / list / popup)の<img>。縮小版がまだなければ元画像を表示
+  function variantImgHtml(pin, size, style) {
+    const src = pin.image_variants ? pin.image_variants[size].webp : pin.image_url;
+    const fallback = pin.image_variants ? ` onerror="this.onerror=null;this.src='${escapeHtml(pin.image_url)}'"` : '';
+    return `<img src="${escapeHtml(src)}"${fallback} style="${style}">`;
+  }
+
   function escapeHtml(s) {
     return String(s || '')
       .replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;')
@@ -114,125 +121,229 @@
     };
   }
 
+  // このズーム未満ではピン1件ずつではなくサーバー集計のクラスタを表示する
+  const CLUSTER_BELOW_ZOOM = 15;
+
+  function renderClusters(mapObj, pinLayer, clusters) {
+    pinLayer.clearLayers();
+    clusters.forEach(c => {
+      if (c.count === 1) {
+        const only = Object.keys(c.categories)[0];
+        const iconHtml = `<div style="width:32px;height:32px;border-radius:50%;border:3px solid white;background:white;display:flex;align-items:center;justify-content:center;font-size:16px;box-shadow:0 2px 4px rgba(0,0,0,0.3);">${getCategoryIcon(parseInt(only, 10))}</div>`;
+        L.marker([c.lat, c.lng], { icon: L.divIcon({ html: iconHtml, className: '', iconSize: [32, 32], iconAnchor: [16, 16] }) })
+          .on('click', () => mapObj.setView([c.lat, c.lng], CLUSTER_BELOW_ZOOM))
+          .addTo(pinLayer);
+        return;
+      }
+      const size = c.count < 10 ? 32 : c.count < 100 ? 40 : 48;
+      const iconHtml = `<div style="width:${size}px;height:${size}px;border-radius:50%;border:3px solid white;background:#d32f2f;color:white;font-weight:600;display:flex;align-items:center;justify-content:center;box-shadow:0 2px 4px rgba(0,0,0,0.3);">${c.count}</div>`;
+      L.marker([c.lat, c.lng], { icon: L.divIcon({ html: iconHtml, className: '', iconSize: [size, size], iconAnchor: [size / 2, size / 2] }) })
+        .on('click', () => mapObj.fitBounds([[c.bounds[1], c.bounds[0]], [c.bounds[3], c.bounds[2]]]))
+        .addTo(pinLayer);
+    });
+  }
+
   // Create actual fetchPins bound to map/pinLayer
   function createFetchPins(mapObj, pinLayer) {
-    return async function fetchPins() {
+    // 個別表示中のマーカー(ピンID→marker)と、差分同期用のカーソル・表示範囲
+    const markersById = new Map();
+    let cursor = null;
+    let cursorBBox = null;
+
+    function addPinMarker(pin, now) {
+      const lat = parseFloat(pin.lat);
+      const lng = parseFloat(pin.lng);
+      if (!lat || !lng) return;
+
+      if (pin.expires_at) {
+        const expires = new Date(pin.expires_at);
+        if (!isNaN(expires) && expires < now) return;
+      }
+
+      let marker;
+      if (pin.image_url) {
+        const iconHtml = `
+          <div style="width:40px;height:50px;position:relative;">
+            <div style="position:absolute;bottom:0;left:50%;transform:translateX(-50%);width:0;height:0;border-left:8px solid transparent;border-right:8px solid transparent;border-top:20px solid #d32f2f;"></div>
+            <div style="position:absolute;bottom:15px;left:50%;transform:translateX(-50%);width:32px;height:32px;border-radius:50%;border:3px solid white;overflow:hidden;background:white;box-shadow:0 2px 4px rgba(0,0,0,0.3);">${variantImgHtml(pin, 'marker', 'width:100%;height:100%;object-fit:cover;')}</div>
+          </div>
+        `;
+        const icon = L.divIcon({ html: iconHtml, className: '', iconSize: [40, 50], iconAnchor: [20, 50], popupAnchor: [0, -50] });
+        marker = L.marker([lat, lng], { icon: icon });
+      } else {
+        const categoryIcon = getCategoryIcon(pin.category);
+        const iconHtml = `
+          <div style="width:40px;height:50px;position:relative;">
+            <div style="position:absolute;bottom:0;left:50%;transform:translateX(-50%);width:0;height:0;border-left:8px solid transparent;border-right:8px solid transparent;border-top:20px solid #d32f2f;"></div>
+            <div style="position:absolute;bottom:15px;left:50%;transform:translateX(-50%);width:32px;height:32px;border-radius:50%;border:3px solid white;background-color:white;display:flex;align-items:center;justify-content:center;font-size:16px;box-shadow:0 2px 4px rgba(0,0,0,0.3);">${categoryIcon}</div>
+          </div>
+        `;
+        const icon = L.divIcon({ html: iconHtml, className: '', iconSize: [40, 50], iconAnchor: [20, 50], popupAnchor: [0, -50] });
+        marker = L.marker([lat, lng], { icon: icon });
+      }
+
+      marker.addTo(pinLayer);
+      markersById.set(pin.id, marker);
+
+      let popup = `<strong>${escapeHtml(pin.title)}</strong><br>${escapeHtml(pin.description)}<br>`;
+      if (pin.caution) popup += `<em style="color:red">注意: ${escapeHtml(pin.caution)}</em><br>`;
+      if (pin.image_url && !pin.image_url.includes('icon')) popup += `${variantImgHtml(pin, 'popup', 'width:100px;')}<br>`;
+      if (pin.expires_at) popup += `表示期限: ${new Date(pin.expires_at).toLocaleString()}<br>`;
+
+      marker.bindPopup(popup);
+    }
+
+    function removePinMarker(id) {
+      const marker = markersById.get(id);
+      if (marker) {
+        pinLayer.removeLayer(marker);
+        markersById.delete(id);
+      }
+    }
+
+    // options.sync: 表示範囲が変わっていなければ前回からの差分だけ取得する
+    return async function fetchPins(options) {
       if (!mapObj || !pinLayer) {
         console.warn('[map-init] fetchPins: map or pinLayer not ready');
         return;
       }
+      if (mapObj.getZoom() < CLUSTER_BELOW_ZOOM) {
+        markersById.clear();
+        cursor = null;
+        try {
+          const params = new URLSearchParams({ bbox: mapObj.getBounds().toBBoxString(), z: mapObj.getZoom() });
+          const res = await fetch(`/api/pins/clusters?${params}`);
+          renderClusters(mapObj, pinLayer, await res.json());
+        } catch (err) {
+          console.error('[map-init] ピン集約の取得に失敗しました', err);
+        }
+        return;
+      }
       try {
-        const res = await fetch('/api/pins');
-        const pins = await res.json();
-
-        pinLayer.clearLayers();
+        // 表示範囲内のピンだけを取得（サーバー側でタイルキーのインデックス検索）
+        const bbox = mapObj.getBounds().toBBoxString();
+        const params = new URLSearchParams({ bbox: bbox, z: mapObj.getZoom() });
         const now = new Date();
 
-        pins.forEach(pin => {
-          const lat = parseFloat(pin.lat);
-          const lng = parseFloat(pin.lng);
-          if (!lat || !lng) return;
-
-          if (pin.expires_at) {
-            const expires = new Date(pin.expires_at);
-            if (!isNaN(expires) && expires < now) return;
-          }
-
-          let marker;
-          if (pin.image_url) {
-            const iconHtml = `
-              <div style="width:40px;height:50px;position:relative;">
-                <div style="position:absolute;bottom:0;left:50%;transform:translateX(-50%);width:0;height:0;border-left:8px solid transparent;border-right:8px solid transparent;border-top:20px solid #d32f2f;"></div>
-                <div style="position:absolute;bottom:15px;left:50%;transform:translateX(-50%);width:32px;height:32px;border-radius:50%;border:3px solid white;background-image:url(${pin.image_url});background-size:cover;background-position:center;box-shadow:0 2px 4px rgba(0,0,0,0.3);"></div>
-              </div>
-            `;
-            const icon = L.divIcon({ html: iconHtml, className: '', iconSize: [40, 50], iconAnchor: [20, 50], popupAnchor: [0, -50] });
-            marker = L.marker([lat, lng], { icon: icon });
-          } else {
-            const categoryIcon = getCategoryIcon(pin.category);
-            const iconHtml = `
-              <div style="width:40px;height:50px;position:relative;">
-                <div style="position:absolute;bottom:0;left:50%;transform:translateX(-50%);width:0;height:0;border-left:8px solid transparent;border-right:8px solid transparent;border-top:20px solid #d32f2f;"></div>
-                <div style="position:absolute;bottom:15px;left:50%;transform:translateX(-50%);width:32px;height:32px;border-radius:50%;border:3px solid white;background-color:white;display:flex;align-items:center;justify-content:center;font-size:16px;box-shadow:0 2px 4px rgba(0,0,0,0.3);">${categoryIcon}</div>
-              </div>
-            `;
-            const icon = L.divIcon({ html: iconHtml, className: '', iconSize: [40, 50], iconAnchor: [20, 50], popupAnchor: [0, -50] });
-            marker = L.marker([lat, lng], { icon: icon });
+        if (options && options.sync && cursor && cursorBBox === bbox) {
+          params.set('since', cursor);
+          const res = await fetch(`/api/pins?${params}`);
+          // 410 はサーバーに変更履歴が残っていない(カーソルが古い)ので、下で全件を取り直す
+          if (res.status !== 410) {
+            const changes = await res.json();
+            changes.removed.forEach(removePinMarker);
+            changes.pins.forEach(pin => {
+              removePinMarker(pin.id);
+              addPinMarker(pin, now);
+            });
+            cursor = changes.cursor;
+            return;
           }
+          params.delete('since');
+        }
 
-          marker.addTo(pinLayer);
-
-          let popup = `<strong>${escapeHtml(pin.title)}</strong><br>${escapeHtml(pin.description)}<br>`;
-          if (pin.caution) popup += `<em style="color:red">注意: ${escapeHtml(pin.caution)}</em><br>`;
-          if (pin.image_url && !pin.image_url.includes('icon')) popup += `<img src="${pin.image_url}" width="100"><br>`;
-          if (pin.expires_at) popup += `表示期限: ${new Date(pin.expires_at).toLocaleString()}<br>`;
+        const res = await fetch(`/api/pins?${params}`);
+        const pins = await res.json();
+        cursor = res.headers.get('X-Pins-Cursor');
+        cursorBBox = bbox;
 
-          marker.bindPopup(popup);
-        });
+        pinLayer.clearLayers();
+        markersById.clear();
+        pins.forEach(pin => addPinMarker(pin, now));
       } catch (err) {
         console.error('[map-init] ピン取得に失敗しました', err);
       }
     };
   }
 
-  function createShowPinsByCategory(pinLayer) {
-    return async function showPinsByCategory(categoryId, categoryName) {
-      const pinListModal = document.getElementById('pinListModal');
-      const pinList = document.getElementById('pinList');
-      const pinListTitle = document.getElementById('pinListTitle');
-      if (!pinListModal || !pinList || !pinListTitle) {
-        console.warn('[map-init] pin list modal elements not found');
-        return;
-      }
+  // ピン一覧モーダルに pins を並べる(分類別・検索結果で共用)
+  function renderPinList(pinLayer, title, pins, iconFor) {
+    const pinListModal = document.getElementById('pinListModal');
+    const pinList = document.getElementById('pinList');
+    const pinListTitle = document.getElementById('pinListTitle');
+    if (!pinListModal || !pinList || !pinListTitle) {
+      console.warn('[map-init] pin list modal elements not found');
+      return;
+    }
 
-      pinListTitle.textContent = categoryName;
-      pinList.innerHTML = '';
+    pinListTitle.textContent = title;
+    pinList.innerHTML = '';
 
-      try {
-        const res = await fetch('/api/pins');
-        const pins = await res.json();
-        const filtered = pins.filter(p => p.category === categoryId);
-        filtered.sort((a, b) => {
-          const ta = a.title ? String(a.title) : '';
-          const tb = b.title ? String(b.title) : '';
-          return ta.localeCompare(tb, 'ja');
-        });
+    if (!pins.length) {
+      const empty = document.createElement('li');
+      empty.className = 'py-2 text-sm text-gray-500';
+      empty.textContent = '該当するピンがありません';
+      pinList.appendChild(empty);
+    }
 
-        filtered.forEach(p => {
-          const li = document.createElement('li');
-          li.className = 'flex items-center gap-3 cursor-pointer py-2 border-b';
-          li.innerHTML = `
-            <div style="width:56px;height:56px;flex:0 0 56px;border-radius:6px;overflow:hidden;background:#f0f0f0;">
-              ${p.image_url ? `<img src="${p.image_url}" style="width:100%;height:100%;object-fit:cover;">` : `<div style="font-size:20px;display:flex;align-items:center;justify-content:center;height:100%">${getCategoryIcon(categoryId)}</div>`}
-            </div>
-            <div style="min-width:0;">
-              <div style="font-weight:600;white-space:nowrap;overflow:hidden;text-overflow:ellipsis;">${escapeHtml(p.title || '')}</div>
-              <div style="font-size:12px;color:#666;white-space:nowrap;overflow:hidden;text-overflow:ellipsis;">${escapeHtml(p.description || '')}</div>
-            </div>
-          `;
-          li.onclick = () => {
-            const pinListModalLocal = document.getElementById('pinListModal');
-            hideModal(pinListModalLocal, document.getElementById('searchBtn'));
-            if (pinLayer) {
-              const marker = pinLayer.getLayers().find(m => m.getLatLng && m.getLatLng().lat === parseFloat(p.lat) && m.getLatLng().lng === parseFloat(p.lng));
-              if (marker && window.map && typeof window.map.setView === 'function') {
-                try {
-                  window.map.setView([p.lat, p.lng], 16);
-                  marker.openPopup();
-                } catch (e) { /* ignore */ }
-              }
-            }
-          };
-          pinList.appendChild(li);
-        });
+    pins.forEach(p => {
+      const li = document.createElement('li');
+      li.className = 'flex items-center gap-3 cursor-pointer py-2 border-b';
+      li.innerHTML = `
+        <div style="width:56px;height:56px;flex:0 0 56px;border-radius:6px;overflow:hidden;background:#f0f0f0;">
+          ${p.image_url ? variantImgHtml(p, 'list', 'width:100%;height:100%;object-fit:cover;') : `<div style="font-size:20px;display:flex;align-items:center;justify-content:center;height:100%">${iconFor(p)}</div>`}
+        </div>
+        <div style="min-width:0;">
+          <div style="font-weight:600;white-space:nowrap;overflow:hidden;text-overflow:ellipsis;">${escapeHtml(p.title || '')}</div>
+          <div style="font-size:12px;color:#666;white-space:nowrap;overflow:hidden;text-overflow:ellipsis;">${escapeHtml(p.description || '')}</div>
+        </div>
+      `;
+      li.onclick = () => {
+        const pinListModalLocal = document.getElementById('pinListModal');
+        hideModal(pinListModalLocal, document.getElementById('searchBtn'));
+        if (pinLayer) {
+          const marker = pinLayer.getLayers().find(m => m.getLatLng && m.getLatLng().lat === parseFloat(p.lat) && m.getLatLng().lng === parseFloat(p.lng));
+          if (marker && window.map && typeof window.map.setView === 'function') {
+            try {
+              window.map.setView([p.lat, p.lng], 16);
+              marker.openPopup();
+            } catch (e) { /* ignore */ }
+          } else if (window.map && typeof window.map.setView === 'function') {
+            // クラスタ表示中は個別マーカーがないので、ズームインして再取得させる
+            try { window.map.setView([p.lat, p.lng], 16); } catch (e) { /* ignore */ }
+          }
+        }
+      };
+      pinList.appendChild(li);
+    });
+
+    showModal(pinListModal, document.getElementById('searchBtn'));
+  }
+
+  const PIN_LIST_FIELDS = 'id,title,description,category,lat,lng,image_url,image_variants';
 
-        showModal(pinListModal, document.getElementById('searchBtn'));
+  function createShowPinsByCategory(pinLayer) {
+    return async function showPinsByCategory(categoryId, categoryName) {
+      try {
+        // 分類の絞り込み・並べ替え・項目の選択はサーバー側で行う
+        const params = new URLSearchParams({ category: categoryId, sort: 'title', fields: PIN_LIST_FIELDS });
+        const res = await fetch(`/api/pins?${params}`);
+        const filtered = await res.json();
+        renderPinList(pinLayer, categoryName, filtered, () => getCategoryIcon(categoryId));
       } catch (err) {
         console.error('[map-init] カテゴリ別ピン取得失敗', err);
       }
     };
   }
 
+  // タイトル・説明の全文検索(関連度順)
+  function createSearchPins(pinLayer) {
+    return async function searchPins(q) {
+      try {
+        const params = new URLSearchParams({ q, limit: 50, fields: PIN_LIST_FIELDS });
+        const res = await fetch(`/api/pins/search?${params}`);
+        const result = await res.json();
+        if (!res.ok) {
+          alert(result.error || 'ピン検索に失敗しました');
+          return;
+        }
+        renderPinList(pinLayer, `「${q}」の検索結果`, result, p => getCategoryIcon(p.category));
+      } catch (err) {
+        console.error('[map-init] ピン検索失敗', err);
+      }
+    };
+  }
+
   // Address picker banner flow (map remains visible; one handler tracked and removed explicitly)
   function showAddressPickerBanner(addressInputEl) {
     if (!window.map) {
@@ -271,9 +382,18 @@
 
         let address = '';
         try {
-          const res = await fetch(`https://nominatim.openstreetmap.org/reverse?format=jsonv2&lat=${lat}&lon=${lon}`);
-          const data = await res.json();
-          if (data && data.display_name) address = data.display_name;
+          const params = new URLSearchParams({ lat: lat, lng: lon });
+          const res = await fetch(`/api/reverse-geocode?${params}`, { credentials: 'same-origin' });
+          if (res.ok) {
+            const data = await res.json();
+            if (data && data.address) address = data.address;
+          }
+          if (!address) {
+            // サーバーの住所データにないときはブラウザから Nominatim に問い合わせる
+            const ext = await fetch(`https://nominatim.openstreetmap.org/reverse?format=jsonv2&lat=${lat}&lon=${lon}`);
+            const data = await ext.json();
+            if (data && data.display_name) address = data.display_name;
+          }
         } catch (err) {
           console.warn('reverse geocode failed', err);
         }
@@ -308,7 +428,7 @@
     }
   }
 
-  function registerUIHandlers(mapObj, pinLayer, fetchPinsFn, showPinsByCategoryFn) {
+  function registerUIHandlers(mapObj, pinLayer, fetchPinsFn, showPinsByCategoryFn, searchPinsFn) {
     console.log('[map-init] registering UI handlers');
 
     const addLocationBtn = document.getElementById('addLocationBtn');
@@ -363,6 +483,19 @@
         });
         showModal(categoryModal, searchBtn);
 
+        // 名前・説明で探す
+        const pinSearchForm = document.getElementById('pinSearchForm');
+        const pinSearchInput = document.getElementById('pinSearchInput');
+        if (pinSearchForm && pinSearchInput) {
+          pinSearchForm.onsubmit = (evt) => {
+            evt.preventDefault();
+            const q = pinSearchInput.value.trim();
+            if (!q) return;
+            hideModal(categoryModal, searchBtn);
+            if (searchPinsFn) searchPinsFn(q);
+          };
+        }
+
         const cancelCategoryBtn = document.getElementById('cancelCategoryBtn');
         if (cancelCategoryBtn) {
           cancelCategoryBtn.onclick = () => {
@@ -399,21 +532,29 @@
 
         if (!lat && address) {
           try {
-            // 国土地理院APIで検索
-            let res = await fetch(`https://msearch.gsi.go.jp/address-search/AddressSearch?q=${encodeURIComponent(address)}`);
-            data = await res.json();
-
+            // サーバーの住所検索(地域の住所データ → 設定されていれば外部サービス)
+            const res = await fetch(`/api/geocode?${new URLSearchParams({ q: address, limit: 1 })}`, { credentials: 'same-origin' });
+            let data = res.ok ? await res.json() : [];
             if (data.length > 0) {
-              // 国土地理院APIの座標は [経度, 緯度]
-              lng = data[0].geometry.coordinates[0];
-              lat = data[0].geometry.coordinates[1];
+              lat = data[0].lat;
+              lng = data[0].lng;
             } else {
-              // ヒットしなければNominatimで再検索（任意）
-              res = await fetch(`https://nominatim.openstreetmap.org/search?format=json&q=${encodeURIComponent(address)}`);
-              data = await res.json();
+              // 見つからなければブラウザから国土地理院APIで検索
+              let ext = await fetch(`https://msearch.gsi.go.jp/address-search/AddressSearch?q=${encodeURIComponent(address)}`);
+              data = await ext.json();
+
               if (data.length > 0) {
-                lat = parseFloat(data[0].lat);
-                lng = parseFloat(data[0].lon);
+                // 国土地理院APIの座標は [経度, 緯度]
+                lng = data[0].geometry.coordinates[0];
+                lat = data[0].geometry.coordinates[1];
+              } else {
+                // ヒットしなければNominatimで再検索（任意）
+                ext = await fetch(`https://nominatim.openstreetmap.org/search?format=json&q=${encodeURIComponent(address)}`);
+                data = await ext.json();
+                if (data.length > 0) {
+                  lat = parseFloat(data[0].lat);
+                  lng = parseFloat(data[0].lon);
+                }
               }
             }
           } catch (err) {
@@ -453,7 +594,7 @@
             const modal = document.getElementById('pinModal');
             hideModal(modal, document.getElementById('addLocationBtn'));
             form.reset();
-            if (fetchPinsFn) fetchPinsFn();
+            if (fetchPinsFn) fetchPinsFn({ sync: true });
           } else {
             alert(result.error || 'ピン追加に失敗しました');
           }
@@ -592,7 +733,8 @@
     }
 
     // register UI handlers and initial fetch
-    registerUIHandlers(window.map, window.pinLayer, realFetchPins, realShowPinsByCategory);
+    registerUIHandlers(window.map, window.pinLayer, realFetchPins, realShowPinsByCategory, createSearchPins(window.pinLayer));
+    window.map.on('moveend', () => realFetchPins());
     realFetchPins();
   }
 
@@ -8,27 +8,53 @@ window.openPinChat = async function(pinId, pinTitle) {
   let lastPinId = panel.dataset.pinId;
   panel.dataset.pinId = pinId;
 
-  // チャット取得関数
-  async function loadChat() {
-    try {
-      const res = await fetch(`/api/pins/${pinId}/chats`);
-      const chats = await res.json();
-      const list = document.getElementById('pinChatList');
-      list.innerHTML = '';
-      chats.forEach(chat => {
-        const el = document.createElement('div');
-        el.className = "mb-2 p-2 rounded bg-amber-50";
-        el.innerHTML = `<b class="text-amber-700">${escapeHtml(chat.username)}</b>
-          <span class="text-xs text-gray-400 ml-2">${new Date(chat.created_at).toLocaleString()}</span><br>
-          <span>${escapeHtml(chat.message)}</span>`;
-        list.appendChild(el);
-      });
-      list.scrollTop = list.scrollHeight;
-    } catch (e) {
-      document.getElementById('pinChatList').innerHTML = '<div class="text-red-500">読み込み失敗</div>';
+  const list = document.getElementById('pinChatList');
+  let lastChatId = 0;
+
+  // 1件を末尾に追加（受信済みのIDは飛ばす）
+  function appendChat(chat) {
+    if (chat.id <= lastChatId) return;
+    lastChatId = chat.id;
+    const el = document.createElement('div');
+    el.className = "mb-2 p-2 rounded bg-amber-50";
+    el.innerHTML = `<b class="text-amber-700">${escapeHtml(chat.username)}</b>
+      <span class="text-xs text-gray-400 ml-2">${new Date(chat.created_at).toLocaleString()}</span><br>
+      <span>${escapeHtml(chat.message)}</span>`;
+    list.appendChild(el);
+    list.scrollTop = list.scrollHeight;
+  }
+
+  // 前回受け取ったID以降だけ取得（EventSource が使えない・混み合っているときのフォールバック）
+  // サーバーに空きがあれば新着まで最大25秒待って返り、なければすぐ返るので6秒空けて取り直す
+  async function pollChat(token) {
+    while (window._pinChatPoll === token) {
+      const started = Date.now();
+      let received = 0;
+      try {
+        const res = await fetch(`/api/pins/${pinId}/chats?after=${lastChatId}&wait=25`);
+        const chats = await res.json();
+        received = chats.length;
+        chats.forEach(appendChat);
+      } catch (e) {
+        list.innerHTML = '<div class="text-red-500">読み込み失敗</div>';
+      }
+      if (!received && Date.now() - started < 1000) {
+        await new Promise(resolve => setTimeout(resolve, 6000));
+      }
     }
   }
 
+  function startPolling() {
+    const token = {};
+    window._pinChatPoll = token;
+    pollChat(token);
+  }
+
+  function stopChat() {
+    if (window._pinChatSource) { window._pinChatSource.close(); window._pinChatSource = null; }
+    window._pinChatPoll = null;
+  }
+
   // 投稿
   const form = document.getElementById('pinChatForm');
   const input = document.getElementById('pinChatInput');
@@ -46,7 +72,7 @@ window.openPinChat = async function(pinId, pinTitle) {
       const result = await res.json();
       if (result.success) {
         input.value = "";
-        await loadChat();
+        appendChat(result.chat);
       } else {
         alert(result.error || "投稿に失敗しました");
       }
@@ -59,13 +85,27 @@ window.openPinChat = async function(pinId, pinTitle) {
   // 閉じるボタン
   document.getElementById('pinChatCloseBtn').onclick = () => {
     panel.classList.add('hidden');
-    if (window._pinChatTimer) clearInterval(window._pinChatTimer);
+    stopChat();
   };
 
-  // 自動リロード（新しいピンを開いたらタイマー再設定）
-  if (window._pinChatTimer) clearInterval(window._pinChatTimer);
-  await loadChat();
-  window._pinChatTimer = setInterval(loadChat, 6000);
+  // 新着はサーバーから受け取る（新しいピンを開いたら接続し直す）
+  stopChat();
+  list.innerHTML = '';
+  if (window.EventSource) {
+    // 接続時にこれまでの投稿、その後は新着だけが届く。再接続時は最後のIDから続きを受け取る
+    const source = new EventSource(`/api/pins/${pinId}/chats/stream`);
+    source.onmessage = (e) => appendChat(JSON.parse(e.data));
+    // 503(接続数の上限)などで接続を諦めたときはロングポーリングに切り替える
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED && window._pinChatSource === source) {
+        window._pinChatSource = null;
+        startPolling();
+      }
+    };
+    window._pinChatSource = source;
+  } else {
+    startPolling();
+  }
 
   // パネル表示
   panel.classList.remove('hidden');
@@ -85,15 +85,10 @@
       document.getElementById('backToCategoriesBtn').onclick = () => showCategorySelection();
 
       try {
-        const res = await fetch("/api/pins");
-        const pins = await res.json();
-        const filtered = pins.filter(p => p.category === categoryId);
-
-        filtered.sort((a, b) => {
-          const titleA = a.title ? String(a.title) : "";
-          const titleB = b.title ? String(b.title) : "";
-          return titleA.localeCompare(titleB, 'ja');
-        });
+        // 分類の絞り込み・並べ替え・項目の選択はサーバー側で行う
+        const params = new URLSearchParams({ category: categoryId, sort: "title", fields: "id,title,description,lat,lng,image_url,image_variants" });
+        const res = await fetch(`/api/pins?${params}`);
+        const filtered = await res.json();
 
         if (filtered.length === 0) {
           const empty = document.createElement('div');
@@ -111,7 +106,7 @@
           item.style.display = 'flex';
           item.innerHTML = `
             <div style="width:56px;height:56px;flex:0 0 56px;display:flex;align-items:center;justify-content:center;border-radius:6px;overflow:hidden;background:#f0f0f0;">
-              ${p.image_url ? `<img src="${p.image_url}" style="width:100%;height:100%;object-fit:cover;">` : `<div style="font-size:20px;">${getCategoryIcon(categoryId)}</div>`}
+              ${p.image_url ? `<img src="${escapeHtml(p.image_variants ? p.image_variants.list.webp : p.image_url)}" onerror="this.onerror=null;this.src='${escapeHtml(p.image_url)}'" style="width:100%;height:100%;object-fit:cover;">` : `<div style="font-size:20px;">${getCategoryIcon(categoryId)}</div>`}
             </div>
             <div style="flex:1;min-width:0;">
               <div style="font-weight:600;white-space:nowrap;overflow:hidden;text-overflow:ellipsis;">${escapeHtml(p.title || '')}</div>
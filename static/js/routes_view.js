@@ -33,29 +33,80 @@
       console.log('[routes_view] map not ready or invalid — will still show modal but skip drawing on map');
     }
 
+    // 一覧は名前順に1ページずつ読む。続きは「もっと見る」ボタン(画面に入ったら自動で押す)で読む
+    const ROUTE_PAGE_SIZE = 50;
+    let listToken = null;
+    let loadMoreObserver = null;
+
+    function renderRoute(route) {
+      const div = document.createElement('div');
+      div.className = 'border rounded p-2 cursor-pointer flex flex-col items-center';
+      const km = route.length_m != null ? `${(route.length_m / 1000).toFixed(1)}km` : '';
+      const stops = route.stop_count != null ? `${route.stop_count}か所` : '';
+      div.innerHTML = `
+                <img src="${route.thumbnail_url || route.image_url}" class="w-24 h-24 object-cover mb-1 rounded" loading="lazy">
+                <span class="text-sm text-center">${route.name}</span>
+                <span class="text-xs text-gray-500">${[stops, km].filter(Boolean).join('・')}</span>
+            `;
+      div.onclick = () => showRouteOnMap(route.id);
+      routesList.appendChild(div);
+    }
+
+    function removeLoadMoreButton() {
+      if (loadMoreObserver) { loadMoreObserver.disconnect(); loadMoreObserver = null; }
+      const btn = routesList.querySelector('.routes-load-more');
+      if (btn) btn.remove();
+    }
+
+    function addLoadMoreButton(token, after) {
+      const btn = document.createElement('button');
+      btn.type = 'button';
+      btn.className = 'routes-load-more col-span-full p-2 text-sm text-blue-600 hover:underline';
+      btn.textContent = 'もっと見る';
+      btn.onclick = () => {
+        btn.disabled = true;
+        btn.textContent = '読み込み中…';
+        loadRoutesPage(token, after);
+      };
+      routesList.appendChild(btn);
+      if (window.IntersectionObserver) {
+        loadMoreObserver = new IntersectionObserver(entries => {
+          if (entries.some(e => e.isIntersecting) && !btn.disabled) btn.click();
+        });
+        loadMoreObserver.observe(btn);
+      }
+    }
+
+    async function loadRoutesPage(token, after) {
+      try {
+        const params = new URLSearchParams({ limit: ROUTE_PAGE_SIZE });
+        if (after) params.set('after', after);
+        const res = await fetch(`/api/routes?${params}`);
+        if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        const routes = await res.json();
+        // 読み込み中に一覧を閉じて開き直していたら捨てる
+        if (token !== listToken) return;
+        removeLoadMoreButton();
+        routes.forEach(renderRoute);
+        const next = res.headers.get('X-Next-Cursor');
+        if (next) addLoadMoreButton(token, next);
+      } catch (e) {
+        if (token !== listToken) return;
+        console.error('[routes_view] routes fetch error', e);
+        removeLoadMoreButton();
+        const errDiv = document.createElement('div');
+        errDiv.className = 'p-3 text-red-500';
+        errDiv.textContent = '旅路一覧の取得に失敗しました';
+        routesList.appendChild(errDiv);
+      }
+    }
+
     allRoutesBtn.onclick = async () => {
       if (allRoutesModal.classList.contains('hidden')) {
+        removeLoadMoreButton();
         routesList.innerHTML = '';
-        try {
-          const res = await fetch('/api/routes');
-          const routes = await res.json();
-          routes.forEach(route => {
-            const div = document.createElement('div');
-            div.className = 'border rounded p-2 cursor-pointer flex flex-col items-center';
-            div.innerHTML = `
-                      <img src="${route.image_url}" class="w-24 h-24 object-cover mb-1 rounded">
-                      <span class="text-sm text-center">${route.name}</span>
-                  `;
-            div.onclick = () => showRouteOnMap(route.id);
-            routesList.appendChild(div);
-          });
-        } catch (e) {
-          console.error('[routes_view] routes fetch error', e);
-          const errDiv = document.createElement('div');
-          errDiv.className = 'p-3 text-red-500';
-          errDiv.textContent = '旅路一覧の取得に失敗しました';
-          routesList.appendChild(errDiv);
-        }
+        listToken = {};
+        await loadRoutesPage(listToken, null);
         allRoutesModal.classList.remove('hidden');
       } else {
         allRoutesModal.classList.add('hidden');
@@ -86,8 +137,11 @@
             routeMarkersLayer.addLayer(marker);
           });
 
-          // Prefer the enhanced road-like route if drawJourneyRoute is available
-          if (typeof window.drawJourneyRoute === 'function') {
+          // Prefer the walking path along roads when the server has the map data
+          const walk = await fetchWalkingPath(routeId);
+          if (walk) {
+            drawWalkingPath(walk);
+          } else if (typeof window.drawJourneyRoute === 'function') {
             try {
               window.drawJourneyRoute(latlngs);
             } catch (e) {
@@ -122,7 +176,7 @@
             dd.innerHTML = `<strong>${p.title}</strong><br>${p.description}`;
             detailDiv.appendChild(dd);
           });
-          routesList.querySelectorAll('div').forEach(div => div.style.display = 'none');
+          routesList.querySelectorAll('div, .routes-load-more').forEach(el => el.style.display = 'none');
           routesList.appendChild(detailDiv);
         }
 
@@ -132,6 +186,38 @@
       }
     }
 
+    // 経由ピン間の徒歩経路(地図データがない・取得できない場合は null で直線表示に戻す)
+    async function fetchWalkingPath(routeId) {
+      try {
+        const res = await fetch(`/api/routes/${routeId}/path`);
+        if (!res.ok) return null;
+        const walk = await res.json();
+        return walk.legs && walk.legs.length ? walk : null;
+      } catch (e) {
+        console.warn('[routes_view] walking path fetch failed', e);
+        return null;
+      }
+    }
+
+    function formatWalk(distanceM, durationS) {
+      const distance = distanceM >= 1000 ? `${(distanceM / 1000).toFixed(1)}km` : `${Math.round(distanceM)}m`;
+      return `${distance}・徒歩約${Math.max(1, Math.round(durationS / 60))}分`;
+    }
+
+    function drawWalkingPath(walk) {
+      walk.legs.forEach((leg, idx) => {
+        const style = { lineCap: 'round', lineJoin: 'round', dashArray: leg.on_network ? null : '6 8' };
+        const base = L.polyline(leg.path, Object.assign({ color: '#1e3a8a', weight: 8, opacity: 0.9 }, style));
+        const center = L.polyline(leg.path, Object.assign({ color: '#5bb0ff', weight: 3 }, style))
+          .bindPopup(`${idx + 1}→${idx + 2}: ${formatWalk(leg.distance_m, leg.duration_s)}<br>合計: ${formatWalk(walk.distance_m, walk.duration_s)}`);
+        routePolylineLayer.addLayer(base);
+        routePolylineLayer.addLayer(center);
+      });
+      try {
+        window.map.fitBounds(L.latLngBounds(walk.legs.flatMap(leg => leg.path)), { padding: [50, 50] });
+      } catch (e) { /* ignore */ }
+    }
+
     function clearRouteMap() {
       if (routeMarkersLayer) routeMarkersLayer.clearLayers();
       if (routePolylineLayer) routePolylineLayer.clearLayers();
@@ -140,6 +226,8 @@
         if (typeof window.clearJourneyRoute === 'function') window.clearJourneyRoute();
       } catch (e) { console.warn('[routes_view] clearJourneyRoute failed', e); }
       routesList.querySelectorAll('div').forEach(div => div.style.display = 'flex');
+      const loadMore = routesList.querySelector('.routes-load-more');
+      if (loadMore) loadMore.style.display = '';
     }
   }
 
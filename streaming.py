@@ -0,0 +1,50 @@
+# 大きな一覧レスポンスを少しずつ送るためのファイルです。
+# DB の行を yield_per で少しずつ読み、1件ずつ JSON にして STREAM_CHUNK_BYTES ごとにチャンク転送で送ります。
+# 行のリスト・dict のリスト・JSON 全体の3つをメモリに持たないので、件数が増えても
+# 1リクエストのメモリ使用量は一定で、最初のバイトも全件のエンコードを待たずに届きます。
+
+import msgspec
+from flask import current_app, stream_with_context
+
+# DB から一度に読む行数
+STREAM_YIELD_PER = 1000
+
+# 1回に送るバイト数の目安
+STREAM_CHUNK_BYTES = 64 * 1024
+
+_encoder = msgspec.json.Encoder()
+
+
+def iter_json_array(rows, to_item, chunk_bytes=STREAM_CHUNK_BYTES):
+    """rows を to_item で1件ずつ変換し、JSON 配列のバイト列を chunk_bytes 程度ずつ返す"""
+    buffer = bytearray(b"[")
+    first = True
+    for row in rows:
+        if not first:
+            buffer += b","
+        first = False
+        # バッファの末尾に直接エンコードする(中間のバイト列を作らない)
+        _encoder.encode_into(to_item(row), buffer, -1)
+        if len(buffer) >= chunk_bytes:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b"]"
+    yield bytes(buffer)
+
+
+def stream_json_array(rows, to_item, headers=None):
+    """iter_json_array をチャンク転送のレスポンスにする(送り終えるまでリクエストのコンテキストを保つ)"""
+
+    def generate():
+        try:
+            yield from iter_json_array(rows, to_item)
+        except Exception:
+            # ヘッダーは送信済みなのでステータスは変えられない。途中で切れた JSON はクライアント側で失敗になる
+            current_app.logger.exception("一覧の送信中にエラーが発生しました")
+            raise
+
+    response = current_app.response_class(stream_with_context(generate()), mimetype="application/json")
+    response.headers["Cache-Control"] = "no-cache"
+    if headers:
+        response.headers.update(headers)
+    return response
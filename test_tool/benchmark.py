@@ -0,0 +1,349 @@
+# API のベンチマーク・負荷試験用スクリプトです。
+# 一時ディレクトリの SQLite に地域範囲内の合成データ(ユーザー・ピン・旅路・経由ピン)を作り、
+#   1. Flask のテストクライアントで1件ずつ(client)
+#   2. ローカルに起動したサーバーへ複数スレッドから同時に(load)
+# 各エンドポイントを呼んで、スループット・p50/p95/p99 の応答時間・1リクエストあたりの SQL 数を測ります。
+# 結果は JSON で保存するので、--baseline に前回の結果を渡すとコミット間で比較できます。
+#
+# 例(プロジェクトのルートで実行):
+#   PYTHONPATH=. python test_tool/benchmark.py --pins 1000 100000 --requests 200 --concurrency 8 --output bench.json
+#   PYTHONPATH=. python test_tool/benchmark.py --pins 100000 --baseline bench.json
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import requests
+from sqlalchemy import event
+from werkzeug.serving import make_server
+
+from app import create_app
+from config import Config
+from SQLAlchemy_models import db, Pin, User
+from bulk_io import insert_pins, insert_routes
+from pin_cache import pins_cache
+from pin_nearby import pin_index
+from routes import MIN_LAT, MAX_LAT, MIN_LNG, MAX_LNG
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# 合成データを登録する件数の単位
+SEED_CHUNK_SIZE = 5000
+
+# bbox 検索で使う表示範囲の大きさ(度)。スマートフォンでズーム15程度
+BBOX_SPAN = 0.02
+
+
+class Dataset:
+    """合成データの件数と、リクエストの組み立てに使う ID の範囲"""
+
+    def __init__(self, users, pins, routes):
+        self.users = users
+        self.pins = pins
+        self.routes = routes
+
+
+def generate_dataset(n_pins, n_routes=None, n_users=None, seed=0):
+    """地域範囲内にピン・旅路・経由ピンを作る(コミット済みの Dataset を返す)"""
+    rng = np.random.default_rng(seed)
+    n_users = n_users or max(10, n_pins // 1000)
+    n_routes = n_pins // 100 if n_routes is None else n_routes
+
+    db.session.execute(
+        db.insert(User),
+        [{"sub": f"bench-{i}", "email": f"bench{i}@example.com", "name": f"ユーザー{i}"} for i in range(n_users)],
+    )
+    db.session.commit()
+    user_ids = np.array(db.session.execute(db.select(User.id)).scalars().all())
+
+    # 1割のピンに表示期限(1〜30日後)と写真を付ける
+    now = datetime.now(timezone(timedelta(hours=9))).replace(tzinfo=None)
+    for start in range(0, n_pins, SEED_CHUNK_SIZE):
+        n = min(SEED_CHUNK_SIZE, n_pins - start)
+        with_extra = rng.random(n) < 0.1
+        expires = pd.Series(pd.NaT, index=range(n), dtype="datetime64[ns]")
+        expires[with_extra] = pd.Timestamp(now) + pd.to_timedelta(rng.integers(1, 31, with_extra.sum()), unit="D")
+        insert_pins(
+            pd.DataFrame(
+                {
+                    "lat": rng.uniform(MIN_LAT, MAX_LAT, n),
+                    "lng": rng.uniform(MIN_LNG, MAX_LNG, n),
+                    "title": [f"ピン{start + i}" for i in range(n)],
+                    "category": rng.integers(1, 13, n),
+                    "description": "ベンチマーク用の合成データです。" * 3,
+                    "caution": None,
+                    "image_url": np.where(with_extra, "http://localhost/static/uploads/bench.jpg", None),
+                    "expires_at": expires,
+                    "user_id": rng.choice(user_ids, n),
+                }
+            )
+        )
+
+    pin_ids = np.array(db.session.execute(db.select(Pin.id)).scalars().all())
+    for start in range(0, n_routes, SEED_CHUNK_SIZE):
+        n = min(SEED_CHUNK_SIZE, n_routes - start)
+        insert_routes(
+            pd.DataFrame(
+                {
+                    "name": [f"旅路{start + i}" for i in range(n)],
+                    "description": "ベンチマーク用の旅路です。",
+                    "image_url": "http://localhost/static/uploads/bench.jpg",
+                    "user_id": rng.choice(user_ids, n),
+                    "pin_ids": [rng.choice(pin_ids, rng.integers(3, 11), replace=False).tolist() for _ in range(n)],
+                }
+            )
+        )
+
+    pins_cache.invalidate()
+    pin_index.refresh()
+    return Dataset(n_users, n_pins, n_routes)
+
+
+def scenarios(rng, dataset):
+    """シナリオ名 → (メソッド, URL, フォームデータ) を作る関数"""
+
+    def bbox():
+        lat = rng.uniform(MIN_LAT, MAX_LAT - BBOX_SPAN)
+        lng = rng.uniform(MIN_LNG, MAX_LNG - BBOX_SPAN)
+        return f"/api/pins?bbox={lng},{lat},{lng + BBOX_SPAN},{lat + BBOX_SPAN}"
+
+    def new_pin():
+        return {
+            "lat": str(rng.uniform(MIN_LAT, MAX_LAT)),
+            "lng": str(rng.uniform(MIN_LNG, MAX_LNG)),
+            "title": "ベンチマーク",
+            "category": str(rng.integers(1, 13)),
+            "description": "POST /api/pins の計測用",
+        }
+
+    result = {
+        "GET /api/pins": lambda: ("GET", "/api/pins", None),
+        "GET /api/pins?stream=1": lambda: ("GET", "/api/pins?stream=1", None),
+        "GET /api/pins?bbox": lambda: ("GET", bbox(), None),
+        "GET /api/routes": lambda: ("GET", "/api/routes", None),
+        "POST /api/pins": lambda: ("POST", "/api/pins", new_pin()),
+    }
+    if dataset.routes:
+        result["GET /api/routes/<id>/pins"] = lambda: ("GET", f"/api/routes/{rng.integers(1, dataset.routes + 1)}/pins", None)
+    return result
+
+
+class QueryCounter:
+    """全エンジンの SQL 実行回数を数える"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def attach(self, engines):
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        with self._lock:
+            self.count += 1
+
+    def take(self):
+        with self._lock:
+            count, self.count = self.count, 0
+        return count
+
+
+def summarize(latencies, errors, elapsed, queries, size):
+    n = len(latencies)
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": n,
+        "errors": errors,
+        "throughput_rps": round(n / elapsed, 1) if elapsed else None,
+        "mean_ms": round(float(ms.mean()), 2) if n else None,
+        "p50_ms": round(float(np.percentile(ms, 50)), 2) if n else None,
+        "p95_ms": round(float(np.percentile(ms, 95)), 2) if n else None,
+        "p99_ms": round(float(np.percentile(ms, 99)), 2) if n else None,
+        "queries_per_request": round(queries / n, 2) if n else None,
+        "bytes_per_request": round(size / n) if n else None,
+    }
+
+
+def run_client(client, make_request, n_requests, counter):
+    """テストクライアントで1件ずつ呼ぶ"""
+    latencies, errors, size = [], 0, 0
+    counter.take()
+    started = time.perf_counter()
+    for _ in range(n_requests):
+        method, url, form = make_request()
+        t = time.perf_counter()
+        response = client.open(url, method=method, data=form)
+        size += len(response.get_data())  # ストリーミングのレスポンスも最後まで読む
+        latencies.append(time.perf_counter() - t)
+        errors += response.status_code >= 400
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, errors, elapsed, counter.take(), size)
+
+
+def run_load(base_url, cookie, make_request, n_requests, concurrency, counter):
+    """concurrency 本のスレッドから同時に n_requests 件呼ぶ"""
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            local.session.cookies.set(*cookie)
+        return local.session
+
+    def call(request):
+        method, url, form = request
+        t = time.perf_counter()
+        response = session().request(method, base_url + url, data=form)
+        return time.perf_counter() - t, response.status_code >= 400, len(response.content)
+
+    # 乱数は1スレッドで先に作っておく
+    batch = [make_request() for _ in range(n_requests)]
+    counter.take()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(call, batch))
+    elapsed = time.perf_counter() - started
+    return summarize(
+        [r[0] for r in results], sum(r[1] for r in results), elapsed, counter.take(), sum(r[2] for r in results)
+    )
+
+
+def bench_config(db_path):
+    return type(
+        "BenchConfig",
+        (Config,),
+        {
+            "SECRET_KEY": "benchmark",
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+            "READ_DATABASE_URL": None,
+            "SESSION_TYPE": "memory",
+            "PIN_PURGE_INTERVAL": 0,
+        },
+    )
+
+
+def run_size(n_pins, args):
+    """n_pins 件のデータで全シナリオを計測する"""
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(bench_config(os.path.join(tmp, "bench.db")))
+        with app.app_context():
+            from flask_migrate import upgrade
+
+            upgrade(directory=os.path.join(BASE_DIR, "migrations"))
+            started = time.perf_counter()
+            dataset = generate_dataset(n_pins, args.routes, seed=args.seed)
+            seed_seconds = time.perf_counter() - started
+            counter = QueryCounter()
+            counter.attach(db.engines.values())
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["_user_id"] = "1"
+            session["_fresh"] = True
+        cookie = (app.config["SESSION_COOKIE_NAME"], client.get_cookie(app.config["SESSION_COOKIE_NAME"]).value)
+
+        rng = np.random.default_rng(args.seed)
+        selected = {
+            name: make for name, make in scenarios(rng, dataset).items() if not args.only or name in args.only
+        }
+        result = {"pins": n_pins, "routes": dataset.routes, "users": dataset.users, "seed_seconds": round(seed_seconds, 2)}
+
+        result["client"] = {}
+        for name, make in selected.items():
+            result["client"][name] = run_client(client, make, args.requests, counter)
+            print(f"[{n_pins} pins][client] {name}: {_line(result['client'][name])}")
+
+        if args.concurrency > 0:
+            server = make_server("127.0.0.1", 0, app, threaded=True)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            base_url = f"http://127.0.0.1:{server.server_port}"
+            result["load"] = {"concurrency": args.concurrency}
+            try:
+                for name, make in selected.items():
+                    result["load"][name] = run_load(base_url, cookie, make, args.requests, args.concurrency, counter)
+                    print(f"[{n_pins} pins][load x{args.concurrency}] {name}: {_line(result['load'][name])}")
+            finally:
+                server.shutdown()
+
+        # 一時ディレクトリを消す前に接続を閉じる
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+        return result
+
+
+def _line(s):
+    return (
+        f"{s['throughput_rps']} req/s  p50 {s['p50_ms']}ms  p95 {s['p95_ms']}ms  p99 {s['p99_ms']}ms  "
+        f"SQL {s['queries_per_request']}/req  errors {s['errors']}"
+    )
+
+
+def compare(current, baseline):
+    """同じ件数・シナリオの p95 と SQL 数を前回の結果と比べて表示する"""
+    previous = {run["pins"]: run for run in baseline["runs"]}
+    for run in current["runs"]:
+        old = previous.get(run["pins"])
+        if old is None:
+            continue
+        for mode in ("client", "load"):
+            for name, s in run.get(mode, {}).items():
+                o = old.get(mode, {}).get(name)
+                if not isinstance(s, dict) or not o or not o.get("p95_ms") or not s.get("p95_ms"):
+                    continue
+                ratio = s["p95_ms"] / o["p95_ms"]
+                mark = "  <-- 遅くなりました" if ratio > 1.2 else ""
+                print(
+                    f"[{run['pins']} pins][{mode}] {name}: p95 {o['p95_ms']} → {s['p95_ms']}ms (x{ratio:.2f}), "
+                    f"SQL {o['queries_per_request']} → {s['queries_per_request']}/req{mark}"
+                )
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API のベンチマーク・負荷試験")
+    parser.add_argument("--pins", type=int, nargs="+", default=[1000, 10000], help="ピン数(複数指定で順に計測)")
+    parser.add_argument("--routes", type=int, default=None, help="旅路の数(既定はピン数の 1/100)")
+    parser.add_argument("--requests", type=int, default=100, help="シナリオごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=8, help="負荷試験の同時接続数(0 なら負荷試験をしない)")
+    parser.add_argument("--only", nargs="*", help='計測するシナリオ名(例: "GET /api/routes")')
+    parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    parser.add_argument("--output", default="benchmark.json", help="結果の保存先")
+    parser.add_argument("--baseline", help="比較する前回の結果(JSON)")
+    args = parser.parse_args()
+
+    result = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "requests": args.requests,
+        "runs": [run_size(n, args) for n in args.pins],
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"結果を {args.output} に保存しました")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
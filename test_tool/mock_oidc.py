@@ -0,0 +1,95 @@
+# Google ログインの動作確認用の模擬 OpenID Connect プロバイダーです。
+# python test_tool/mock_oidc.py で http://localhost:5001 に起動し、アプリ側は
+#   GOOGLE_DISCOVERY_URL=http://localhost:5001/.well-known/openid-configuration
+#   OIDC_CACHE_PATH=  (空にしてキャッシュをファイルに残さない)
+# で起動すると、Google に通信せずにログインの流れ(認可→トークン交換→ID トークン検証)を試せます。
+# 各エンドポイントの呼び出し回数を /stats で返すので、2回目以降のログインで
+# ディスカバリー文書・JWKS・userinfo を取りに来ていないことを確認できます。
+
+import secrets
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+from authlib.jose import JsonWebKey, jwt
+from flask import Flask, jsonify, redirect, request
+
+ISSUER = "http://localhost:5001"
+KID = "mock-key"
+
+app = Flask(__name__)
+key = JsonWebKey.generate_key("RSA", 2048, is_private=True)
+calls = Counter()
+codes = {}  # 認可コード → (client_id, nonce, ユーザー)
+
+# ログインするユーザー(/login/google へのリダイレクト先の ?sub=&email=&name= で変えられる)
+DEFAULT_USER = {"sub": "mock-user-1", "email": "mock@example.com", "name": "模擬ユーザー", "picture": None}
+
+
+@app.before_request
+def count_call():
+    calls[request.path] += 1
+
+
+@app.route("/.well-known/openid-configuration")
+def discovery():
+    response = jsonify(
+        {
+            "issuer": ISSUER,
+            "authorization_endpoint": f"{ISSUER}/authorize",
+            "token_endpoint": f"{ISSUER}/token",
+            "userinfo_endpoint": f"{ISSUER}/userinfo",
+            "jwks_uri": f"{ISSUER}/jwks",
+            "id_token_signing_alg_values_supported": ["RS256"],
+        }
+    )
+    response.headers["Cache-Control"] = "public, max-age=3600"
+    return response
+
+
+@app.route("/jwks")
+def jwks():
+    public = dict(key.as_dict(is_private=False), kid=KID, use="sig", alg="RS256")
+    response = jsonify({"keys": [public]})
+    response.headers["Cache-Control"] = "public, max-age=3600"
+    return response
+
+
+@app.route("/authorize")
+def authorize():
+    # 同意画面は出さずにすぐ認可コードを返す
+    code = secrets.token_urlsafe(16)
+    user = dict(DEFAULT_USER, **{k: request.args[k] for k in ("sub", "email", "name") if k in request.args})
+    codes[code] = (request.args["client_id"], request.args.get("nonce"), user)
+    query = urlencode({"code": code, "state": request.args.get("state", "")})
+    return redirect(f"{request.args['redirect_uri']}?{query}")
+
+
+@app.route("/token", methods=["POST"])
+def token():
+    entry = codes.pop(request.form.get("code"), None)
+    if entry is None:
+        return jsonify({"error": "invalid_grant"}), 400
+    client_id, nonce, user = entry
+    now = int(time.time())
+    claims = dict(user, iss=ISSUER, aud=client_id, iat=now, exp=now + 3600, email_verified=True)
+    if nonce:
+        claims["nonce"] = nonce
+    id_token = jwt.encode({"alg": "RS256", "kid": KID}, claims, key).decode()
+    return jsonify(
+        {"access_token": secrets.token_urlsafe(16), "token_type": "Bearer", "expires_in": 3600, "id_token": id_token}
+    )
+
+
+@app.route("/userinfo")
+def userinfo():
+    return jsonify(DEFAULT_USER)
+
+
+@app.route("/stats")
+def stats():
+    return jsonify(calls)
+
+
+if __name__ == "__main__":
+    app.run(port=5001)
@@ -0,0 +1,109 @@
+# テスト用の共通設定です。一時ディレクトリの SQLite にマイグレーションを当てたアプリを使います。
+# instance ディレクトリ(セッション・キャッシュ・一時ファイルの置き場所)もリポジトリの外の一時ディレクトリにします。
+# 実行(プロジェクトのルートで): python -m pytest -q
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import Future
+
+import pytest
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+# config を読み込む前に設定する(images などはモジュールの読み込み時にフォルダを作る)
+_instance_dir = tempfile.mkdtemp(prefix="hosomichi-test-")
+atexit.register(shutil.rmtree, _instance_dir, ignore_errors=True)
+os.environ["INSTANCE_DIR"] = _instance_dir
+
+import images  # noqa: E402
+from app import create_app  # noqa: E402
+from config import Config  # noqa: E402
+from SQLAlchemy_models import db, User  # noqa: E402
+from pin_cache import pins_cache  # noqa: E402
+from pin_nearby import pin_index  # noqa: E402
+
+
+def make_config(tmp_path, **overrides):
+    """tmp_path 以下だけに書き込むテスト用の設定クラス"""
+    settings = {
+        "TESTING": True,
+        "SECRET_KEY": "test",
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}",
+        "READ_DATABASE_URL": None,
+        "SESSION_TYPE": "memory",
+        "SESSION_SQLITE_PATH": str(tmp_path / "sessions.db"),
+        "SESSION_FILE_DIR": str(tmp_path / "flask_session"),
+        "OIDC_CACHE_PATH": str(tmp_path / "oidc_cache.json"),
+        "GAZETTEER_PATH": str(tmp_path / "gazetteer.csv"),
+        "GEOCODE_CACHE_PATH": str(tmp_path / "geocode_cache.db"),
+        "WALK_GRAPH_PATH": str(tmp_path / "walk_graph.graphml"),
+        "PIN_PURGE_INTERVAL": 0,
+        "METRICS_ENABLED": False,
+    }
+    settings.update(overrides)
+    return type("TestConfig", (Config,), settings)
+
+
+@pytest.fixture
+def config_overrides():
+    """テストごとに設定を変えるときは、このフィクスチャを上書きする"""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, config_overrides):
+    app = create_app(make_config(tmp_path, **config_overrides))
+    # プロセス内のキャッシュ・インデックスは前のテストの DB の内容を持っているので空にする
+    pins_cache.invalidate()
+    pin_index.__init__()
+    with app.app_context():
+        from flask_migrate import upgrade
+
+        upgrade(directory=os.path.join(BASE_DIR, "migrations"))
+        db.session.add(User(sub="test-user", email="test@example.com", name="テストユーザー"))
+        db.session.commit()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    """ログイン済み(ユーザー ID 1)のテストクライアント"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = "1"
+        session["_fresh"] = True
+    return client
+
+
+@pytest.fixture
+def anonymous_client(app):
+    return app.test_client()
+
+
+class ImmediateExecutor:
+    """縮小版の作成をその場で行う(テストで完了を待たなくてよいように)"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+@pytest.fixture
+def upload_folders(tmp_path, monkeypatch):
+    """アップロード画像・縮小版・一時ファイルの保存先を tmp_path 以下にする"""
+    folders = {
+        "UPLOAD_FOLDER": tmp_path / "uploads",
+        "VARIANT_FOLDER": tmp_path / "uploads" / "variants",
+        "UPLOAD_TEMP_FOLDER": tmp_path / "upload_tmp",
+    }
+    for name, folder in folders.items():
+        folder.mkdir(parents=True, exist_ok=True)
+        monkeypatch.setattr(images, name, str(folder))
+    monkeypatch.setattr(images, "_executor", ImmediateExecutor())
+    return folders
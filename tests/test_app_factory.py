@@ -0,0 +1,65 @@
+import os
+import runpy
+from unittest import mock
+
+import pytest
+from sqlalchemy import event
+
+from SQLAlchemy_models import db
+from db_engine import READ_BIND
+
+GUNICORN_CONF = os.path.join(os.path.dirname(__file__), "..", "gunicorn.conf.py")
+
+
+def test_sqlite_pragmas_are_set_on_connect(app):
+    with db.engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == 5000
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+
+
+@pytest.fixture
+def config_overrides(tmp_path):
+    return {"READ_DATABASE_URL": f"sqlite:///file:{tmp_path / 'test.db'}?mode=ro&uri=true"}
+
+
+def test_read_only_views_use_the_read_engine(app, client):
+    read_engine = db.engines[READ_BIND]
+    statements = []
+    event.listen(read_engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+
+    assert client.get("/api/pins").status_code == 200
+    assert any("FROM pins" in s for s in statements)
+
+    with read_engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA query_only").scalar() == 1
+
+
+def test_writes_stay_on_the_primary_engine(app, client):
+    response = client.post(
+        "/api/pins", data={"lat": 38.99, "lng": 141.11, "title": "ピン", "category": 1, "description": "説明"}
+    )
+
+    assert response.status_code == 200
+    assert client.get("/api/pins").get_json()[0]["id"] == response.get_json()["id"]
+
+
+@pytest.mark.parametrize(
+    "env, workers, warned",
+    [
+        ({}, 1, False),
+        ({"WEB_CONCURRENCY": "3"}, 3, True),
+        ({"CHAT_BROKER_CLASS": "chat_broker:RedisBroker"}, 2, False),
+    ],
+)
+def test_gunicorn_workers_follow_the_chat_broker(env, workers, warned):
+    with mock.patch.dict(os.environ, env):
+        for name in ("WEB_CONCURRENCY", "CHAT_BROKER_CLASS"):
+            if name not in env:
+                os.environ.pop(name, None)
+        settings = runpy.run_path(GUNICORN_CONF)
+
+    server = mock.Mock()
+    settings["on_starting"](server)
+    assert settings["workers"] == workers
+    assert server.log.warning.called is warned
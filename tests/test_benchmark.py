@@ -0,0 +1,32 @@
+import json
+import os
+import subprocess
+import sys
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BENCHMARK = os.path.join(BASE_DIR, "test_tool", "benchmark.py")
+
+
+def _run(tmp_path, *args):
+    env = dict(os.environ, PYTHONPATH=BASE_DIR, INSTANCE_DIR=str(tmp_path / "instance"))
+    return subprocess.run(
+        [sys.executable, BENCHMARK, "--pins", "200", "--routes", "5", "--requests", "2", "--concurrency", "2", *args],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=300,
+    )
+
+
+def test_benchmark_smoke_run_and_baseline(tmp_path):
+    first = _run(tmp_path, "--output", "first.json")
+    assert first.returncode == 0, first.stderr
+
+    result = json.loads((tmp_path / "first.json").read_text(encoding="utf-8"))
+    (run,) = result["runs"]
+    assert (run["pins"], run["routes"]) == (200, 5)
+    for mode in ("client", "load"):
+        scenarios = {name: s for name, s in run[mode].items() if isinstance(s, dict)}
+        assert "GET /api/pins" in scenarios and "POST /api/pins" in scenarios
+        assert all(s["errors"] == 0 for s in scenarios.values()), scenarios
+
+    second = _run(tmp_path, "--output", "second.json", "--baseline", "first.json")
+    assert second.returncode == 0, second.stderr
+    assert "p95" in second.stdout and "→" in second.stdout
@@ -0,0 +1,130 @@
+import io
+import json
+from datetime import datetime
+
+import pandas as pd
+
+from SQLAlchemy_models import db, Pin, Route, RoutePin
+from bulk_io import export_pins, export_routes, import_pins, import_routes, insert_pins, insert_routes
+
+
+def _add_pins(n):
+    insert_pins(
+        pd.DataFrame(
+            {
+                "lat": [38.9 + i * 0.001 for i in range(n)],
+                "lng": [141.1 + i * 0.001 for i in range(n)],
+                "title": [f"ピン{i}" for i in range(n)],
+                "category": [1] * n,
+                "description": ["説明"] * n,
+                "caution": [None] * n,
+                "image_url": [None] * n,
+                "expires_at": [pd.NaT] * n,
+                "user_id": [1] * n,
+            }
+        )
+    )
+    return db.session.execute(db.select(Pin.id).order_by(Pin.id)).scalars().all()
+
+
+def _route_pin_ids():
+    rows = db.session.execute(db.select(RoutePin.route_id, RoutePin.pin_id).order_by(RoutePin.route_id, RoutePin.order))
+    routes = {}
+    for r in rows:
+        routes.setdefault(r.route_id, []).append(r.pin_id)
+    return list(routes.values())
+
+
+def test_routes_geojson_round_trip(app, tmp_path):
+    pin_ids = _add_pins(3)
+    created_at = datetime(2025, 4, 1, 3, 0, 0)
+    insert_routes(
+        pd.DataFrame(
+            {
+                "name": ["旅路"],
+                "description": ["説明"],
+                "image_url": ["http://localhost/static/uploads/route.png"],
+                "user_id": [1],
+                "pin_ids": [[pin_ids[2], pin_ids[0], pin_ids[1]]],
+                "created_at": [created_at],
+            }
+        )
+    )
+
+    out = io.StringIO()
+    assert export_routes(out, "geojson") == 1
+    path = tmp_path / "routes.geojson"
+    path.write_text(out.getvalue(), encoding="utf-8")
+
+    db.session.execute(db.delete(RoutePin))
+    db.session.execute(db.delete(Route))
+    db.session.commit()
+
+    assert import_routes(str(path)) == (1, 0)
+    assert _route_pin_ids() == [[pin_ids[2], pin_ids[0], pin_ids[1]]]
+    route = db.session.execute(db.select(Route)).scalar_one()
+    assert route.created_at.replace(tzinfo=None) == created_at
+    assert route.stop_count == 3
+
+
+PINS_CSV = (
+    "lat,lng,title,category,description,expires_at,user_id\n"
+    "38.99,141.11,中尊寺,1,説明,,1\n"
+    "38.98,141.12,毛越寺,2,説明,2099-01-01T00:00:00+09:00,\n"
+    "35.68,139.76,範囲外,1,説明,,1\n"
+    "38.97,141.13,,1,タイトルなし,,1\n"
+    "38.96,141.14,分類不正,13,説明,,1\n"
+    "38.95,141.15,投稿者不明,1,説明,,999\n"
+)
+
+
+def test_import_csv_command_skips_invalid_rows(app, tmp_path):
+    path = tmp_path / "pins.csv"
+    path.write_text(PINS_CSV, encoding="utf-8")
+
+    result = app.test_cli_runner().invoke(args=["pins", "import", str(path), "--user-id", "1", "--chunk-size", "2"])
+
+    assert result.exit_code == 0, result.output
+    assert "2 件登録しました(不正な行 4 件は除外)" in result.output
+    pins = db.session.execute(db.select(Pin).order_by(Pin.id)).scalars().all()
+    assert [p.title for p in pins] == ["中尊寺", "毛越寺"]
+    assert pins[1].user_id == 1
+    assert pins[1].expires_at.replace(tzinfo=None) == datetime(2099, 1, 1)
+    assert all(p.tile_key and len(p.tile_key) == 18 for p in pins)
+
+
+def test_imported_pins_are_visible_to_sync_clusters_and_search(client, tmp_path):
+    cursor = client.get("/api/pins").headers["X-Pins-Cursor"]
+    path = tmp_path / "pins.csv"
+    path.write_text(PINS_CSV, encoding="utf-8")
+    app = client.application
+    app.test_cli_runner().invoke(args=["pins", "import", str(path), "--user-id", "1"])
+
+    assert len(client.get(f"/api/pins?since={cursor}").get_json()["pins"]) == 2
+    clusters = client.get("/api/pins/clusters?z=10&bbox=140.95,38.75,141.30,39.05").get_json()
+    assert sum(c["count"] for c in clusters) == 2
+    assert len(client.get("/api/pins/search?q=中尊寺").get_json()) == 1
+
+
+def test_pins_csv_export_round_trip(app, tmp_path):
+    _add_pins(3)
+    out = io.StringIO()
+    assert export_pins(out, "csv") == 3
+    path = tmp_path / "pins.csv"
+    path.write_text(out.getvalue(), encoding="utf-8")
+
+    db.session.execute(db.delete(Pin))
+    db.session.commit()
+
+    assert import_pins(str(path)) == (3, 0)
+    assert db.session.execute(db.select(Pin.title).order_by(Pin.id)).scalars().all() == ["ピン0", "ピン1", "ピン2"]
+
+
+def test_pins_geojson_export_uses_point_coordinates(app):
+    _add_pins(1)
+    out = io.StringIO()
+    export_pins(out, "geojson")
+
+    feature = json.loads(out.getvalue())["features"][0]
+    assert feature["geometry"] == {"type": "Point", "coordinates": [141.1, 38.9]}
+    assert feature["properties"]["title"] == "ピン0"
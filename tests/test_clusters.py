@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+from SQLAlchemy_models import db, Pin, PinCluster, expiry_now
+from clusters import add_pins_to_clusters, cell_zoom_for, rebuild_clusters
+from maintenance import purge_expired_pins
+
+
+def _post_pin(client, lat, lng, category=1):
+    response = client.post(
+        "/api/pins", data={"lat": lat, "lng": lng, "title": "ピン", "category": category, "description": "説明"}
+    )
+    assert response.status_code == 200
+    return response.get_json()["id"]
+
+
+def _add_expired_pin(lat, lng):
+    pin = Pin(
+        lat=lat, lng=lng, title="期限切れ", category=1, description="説明", user_id=1,
+        expires_at=expiry_now() - timedelta(hours=1),
+    )
+    db.session.add(pin)
+    db.session.flush()
+    add_pins_to_clusters([pin])
+    db.session.commit()
+    return pin.id
+
+
+def _clusters(client, z=10, bbox="140.95,38.75,141.30,39.05"):
+    response = client.get(f"/api/pins/clusters?z={z}&bbox={bbox}")
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def _cluster_rows():
+    return sorted(
+        (c.zoom, c.quadkey, c.category, c.count, round(c.lat_sum, 6), round(c.lng_sum, 6))
+        for c in db.session.execute(db.select(PinCluster)).scalars()
+    )
+
+
+def test_cell_zoom_is_clamped():
+    assert cell_zoom_for(5) == 12
+    assert cell_zoom_for(12) == 14
+    assert cell_zoom_for(30) == 18
+
+
+def test_clusters_count_pins_by_category(client):
+    _post_pin(client, 38.9900, 141.1100, category=1)
+    _post_pin(client, 38.9901, 141.1101, category=2)
+    _post_pin(client, 38.9300, 141.1300, category=1)
+
+    clusters = _clusters(client)
+
+    assert sum(c["count"] for c in clusters) == 3
+    hiraizumi = next(c for c in clusters if c["categories"] == {"1": 1, "2": 1})
+    assert hiraizumi["count"] == 2
+    assert abs(hiraizumi["lat"] - 38.99005) < 1e-6
+    west, south, east, north = hiraizumi["bounds"]
+    assert west <= 141.11 <= east and south <= 38.99 <= north
+
+
+def test_clusters_outside_bbox_are_left_out(client):
+    _post_pin(client, 38.9900, 141.1100)
+    _post_pin(client, 38.7600, 140.9600)
+
+    clusters = _clusters(client, z=12, bbox="141.05,38.95,141.15,39.02")
+
+    assert [c["count"] for c in clusters] == [1]
+
+
+def test_clusters_leave_out_expired_pins(client):
+    _post_pin(client, 38.9900, 141.1100)
+    _add_expired_pin(38.9901, 141.1101)
+
+    assert sum(c["count"] for c in _clusters(client)) == 1
+
+
+def test_purge_removes_expired_pins_from_clusters(client, tmp_path):
+    _post_pin(client, 38.9900, 141.1100)
+    _add_expired_pin(38.9901, 141.1101)
+
+    purge_expired_pins(upload_folder=str(tmp_path))
+
+    assert sum(c["count"] for c in _clusters(client)) == 1
+    assert {c.count for c in db.session.execute(db.select(PinCluster)).scalars()} == {1}
+
+
+def test_rebuild_matches_incremental_counts(client):
+    _post_pin(client, 38.9900, 141.1100, category=1)
+    _post_pin(client, 38.9901, 141.1101, category=2)
+    _post_pin(client, 38.9300, 141.1300, category=1)
+    incremental = _cluster_rows()
+
+    rebuild_clusters()
+
+    assert _cluster_rows() == incremental
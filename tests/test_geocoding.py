@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from geocoding import Gazetteer, GeocodeCache, Geocoder, GeocoderBusy, NullProvider
+
+BOUNDS = (38.75, 39.05, 140.95, 141.30)
+
+
+class CountingProvider:
+    """問い合わせ回数を数える外部サービスの代わり"""
+
+    def __init__(self, results=None, reverse_result=None):
+        self.results = results or []
+        self.reverse_result = reverse_result
+        self.calls = 0
+
+    def geocode(self, query, limit=5):
+        self.calls += 1
+        return self.results[:limit]
+
+    def reverse(self, lat, lng):
+        self.calls += 1
+        return self.reverse_result
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    path = tmp_path / "gazetteer.csv"
+    path.write_text(
+        "address,lat,lng\n"
+        "岩手県西磐井郡平泉町平泉字衣関,38.9928,141.1010\n"
+        "岩手県西磐井郡平泉町平泉字志羅山,38.9870,141.1130\n"
+        "岩手県一関市大手町,38.9340,141.1270\n"
+        "東京都千代田区丸の内,35.6812,139.7671\n",
+        encoding="utf-8",
+    )
+    return Gazetteer.load(str(path), BOUNDS)
+
+
+def test_gazetteer_drops_rows_outside_bounds(gazetteer):
+    assert len(gazetteer) == 3
+
+
+def test_gazetteer_geocode_prefix_and_partial_match(gazetteer):
+    assert {r["address"] for r in gazetteer.geocode("岩手県西磐井郡平泉町平泉字")} == {
+        "岩手県西磐井郡平泉町平泉字衣関",
+        "岩手県西磐井郡平泉町平泉字志羅山",
+    }
+    # 全角・空白の表記ゆれと、町名途中からの入力
+    assert [r["address"] for r in gazetteer.geocode("平泉町　平泉字衣関")] == ["岩手県西磐井郡平泉町平泉字衣関"]
+    assert gazetteer.geocode("存在しない町") == []
+
+
+def test_gazetteer_reverse_nearest_within_limit(gazetteer):
+    result = gazetteer.reverse(38.9929, 141.1011)
+    assert result["address"] == "岩手県西磐井郡平泉町平泉字衣関"
+    assert result["distance_m"] < 20
+    assert gazetteer.reverse(38.80, 141.00) is None
+
+
+def test_cache_persists_hits_across_instances(tmp_path):
+    path = str(tmp_path / "cache.db")
+    GeocodeCache(path).put("geocode:5:平泉", [{"address": "平泉"}])
+
+    assert GeocodeCache(path).get("geocode:5:平泉") == (True, [{"address": "平泉"}])
+
+
+def test_cache_expires_misses(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.db")
+    GeocodeCache(path, miss_ttl=60).put("geocode:5:なし", [])
+    assert GeocodeCache(path).get("geocode:5:なし") == (True, [])
+
+    later = time.time() + 61
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert GeocodeCache(path).get("geocode:5:なし") == (False, None)
+
+
+def test_geocoder_caches_fallback_results(tmp_path):
+    provider = CountingProvider(results=[{"address": "外部", "lat": 38.9, "lng": 141.1, "source": "gsi"}])
+    geocoder = Geocoder(cache=GeocodeCache(str(tmp_path / "cache.db")), fallback=provider)
+
+    assert geocoder.geocode("外部") == provider.results
+    assert geocoder.geocode("外部") == provider.results
+    assert provider.calls == 1
+
+
+def test_geocoder_prefers_gazetteer(gazetteer, tmp_path):
+    provider = CountingProvider()
+    geocoder = Geocoder(gazetteer, GeocodeCache(str(tmp_path / "cache.db")), provider)
+
+    assert geocoder.geocode("一関市大手町")[0]["source"] == "local"
+    assert geocoder.reverse(38.9340, 141.1270)["source"] == "local"
+    assert provider.calls == 0
+
+
+@pytest.mark.parametrize("fallback", [None, NullProvider()])
+def test_geocoder_without_fallback_does_not_cache(tmp_path, fallback):
+    cache = GeocodeCache(str(tmp_path / "cache.db"))
+    geocoder = Geocoder(cache=cache, fallback=fallback)
+
+    assert geocoder.geocode("どこか") == []
+    assert geocoder.reverse(38.9, 141.1) is None
+    assert cache.get("geocode:5:どこか") == (False, None)
+    assert cache.get("reverse:38.9,141.1") == (False, None)
+
+
+def test_geocode_endpoint_maps_busy_to_503(client, monkeypatch):
+    class BusyGeocoder:
+        def geocode(self, query, limit=5):
+            raise GeocoderBusy()
+
+    monkeypatch.setattr("routes.get_geocoder", lambda: BusyGeocoder())
+
+    assert client.get("/api/geocode?q=平泉").status_code == 503
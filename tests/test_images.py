@@ -0,0 +1,115 @@
+import hashlib
+import io
+import os
+
+import pytest
+from PIL import Image
+
+import images
+from SQLAlchemy_models import db, Pin
+
+
+pytestmark = pytest.mark.usefixtures("upload_folders")
+
+
+def _image_bytes(fmt="JPEG", exif=None, size=(32, 24)):
+    buffer = io.BytesIO()
+    options = {"exif": exif} if exif is not None else {}
+    Image.new("RGB", size, (200, 80, 40)).save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def _exif_with_location():
+    exif = Image.Exif()
+    exif[0x010F] = "TestCamera"  # Make
+    exif[0x8825] = {1: "N", 2: (38.0, 59.0, 0.0)}  # GPSInfo
+    return exif
+
+
+def _post_pin(client, data, filename="photo.jpg"):
+    return client.post(
+        "/api/pins",
+        data={
+            "lat": 38.99, "lng": 141.11, "title": "ピン", "category": 1, "description": "説明",
+            "image": (io.BytesIO(data), filename),
+        },
+        content_type="multipart/form-data",
+    )
+
+
+def _listing(folder):
+    return sorted(os.listdir(folder))
+
+
+def test_upload_is_stored_by_content_hash_with_variants(client, upload_folders):
+    data = _image_bytes()
+
+    response = _post_pin(client, data)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    digest = hashlib.sha256(data).hexdigest()
+    assert body["image_url"].endswith(f"/static/uploads/{digest}.jpg")
+    assert (upload_folders["UPLOAD_FOLDER"] / f"{digest}.jpg").read_bytes() == data
+    assert body["image_variants"]["marker"]["webp"].endswith(f"/variants/{digest}_marker.webp")
+    with Image.open(upload_folders["VARIANT_FOLDER"] / f"{digest}_marker.webp") as marker:
+        assert marker.size == (64, 64)
+    assert _listing(upload_folders["UPLOAD_TEMP_FOLDER"]) == []
+
+
+def test_same_image_is_stored_once(client, upload_folders):
+    data = _image_bytes()
+
+    first = _post_pin(client, data).get_json()
+    second = _post_pin(client, data).get_json()
+
+    assert first["image_url"] == second["image_url"]
+    assert [n for n in _listing(upload_folders["UPLOAD_FOLDER"]) if n != "variants"] == [
+        f"{hashlib.sha256(data).hexdigest()}.jpg"
+    ]
+
+
+def test_exif_is_stripped(client, upload_folders):
+    data = _image_bytes(exif=_exif_with_location())
+
+    filename = _post_pin(client, data).get_json()["image_url"].rsplit("/", 1)[1]
+
+    with Image.open(upload_folders["UPLOAD_FOLDER"] / filename) as stored:
+        assert "exif" not in stored.info
+        assert not stored.getexif()
+
+
+def test_non_image_is_rejected_with_415(client, upload_folders):
+    response = _post_pin(client, b"GIF89a not really an image")
+
+    assert response.status_code == 415
+    assert db.session.execute(db.select(db.func.count()).select_from(Pin)).scalar() == 0
+    assert _listing(upload_folders["UPLOAD_TEMP_FOLDER"]) == []
+
+
+def test_truncated_image_is_rejected_with_400(client, upload_folders):
+    response = _post_pin(client, _image_bytes()[:40])
+
+    assert response.status_code == 400
+    assert _listing(upload_folders["UPLOAD_TEMP_FOLDER"]) == []
+
+
+@pytest.mark.parametrize("config_overrides", [{"MAX_UPLOAD_BYTES": 2048}])
+def test_oversized_upload_is_rejected_with_413(client, upload_folders):
+    data = _image_bytes(fmt="PNG", size=(400, 400))
+    data += b"\0" * max(0, 4096 - len(data))
+
+    response = _post_pin(client, data, filename="big.png")
+
+    assert response.status_code == 413
+    assert "2KB" in response.get_json()["error"]
+    assert _listing(upload_folders["UPLOAD_TEMP_FOLDER"]) == []
+    assert db.session.execute(db.select(db.func.count()).select_from(Pin)).scalar() == 0
+
+
+def test_variant_urls_only_for_hashed_names():
+    assert images.variant_urls(None) is None
+    assert images.variant_urls("http://localhost/static/uploads/20240101_photo.jpg") is None
+    urls = images.variant_urls(f"http://localhost/static/uploads/{'a' * 64}.png")
+    assert set(urls) == set(images.VARIANT_SIZES)
+    assert urls["popup"]["jpeg"] == f"http://localhost/static/uploads/variants/{'a' * 64}_popup.jpg"
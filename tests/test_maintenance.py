@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from SQLAlchemy_models import db, ArchivedPin, Pin, PinChange, Route, RoutePin, expiry_now
+from maintenance import purge_expired_pins
+
+
+def _add_pin(expires_at=None, **values):
+    pin = Pin(
+        lat=38.99, lng=141.11, title="ピン", category=1, description="説明", user_id=1, expires_at=expires_at, **values
+    )
+    db.session.add(pin)
+    db.session.commit()
+    return pin.id
+
+
+def _expired():
+    return expiry_now() - timedelta(hours=1)
+
+
+def test_purge_archives_reused_pin_ids(app, tmp_path):
+    first = _add_pin(_expired())
+    assert purge_expired_pins(upload_folder=str(tmp_path)) == (1, 0)
+
+    # SQLite は消したピンの ID を次のピンに使い回す
+    second = _add_pin(_expired())
+    assert second == first
+    assert purge_expired_pins(upload_folder=str(tmp_path)) == (1, 0)
+
+    archived = db.session.execute(db.select(ArchivedPin.original_pin_id)).scalars().all()
+    assert archived == [first, first]
+    assert db.session.get(Pin, first) is None
+
+
+def test_purge_keeps_live_and_referenced_pins(app, tmp_path):
+    live = _add_pin(expiry_now() + timedelta(days=1))
+    forever = _add_pin()
+    on_route = _add_pin(_expired())
+    route = Route(name="旅路", description="説明", image_url="http://localhost/static/uploads/a.png", user_id=1)
+    db.session.add(route)
+    db.session.flush()
+    db.session.add(RoutePin(route_id=route.id, pin_id=on_route, order=0))
+    db.session.commit()
+
+    assert purge_expired_pins(upload_folder=str(tmp_path)) == (0, 0)
+    assert {p.id for p in Pin.query} == {live, forever, on_route}
+
+
+def test_purge_moves_unused_image(app, tmp_path, monkeypatch):
+    import maintenance
+
+    archive = tmp_path / "archive"
+    monkeypatch.setattr(maintenance, "ARCHIVE_UPLOAD_FOLDER", str(archive))
+    (tmp_path / "old.png").write_bytes(b"png")
+    _add_pin(_expired(), image_url="http://localhost/static/uploads/old.png")
+
+    assert purge_expired_pins(upload_folder=str(tmp_path)) == (1, 1)
+    assert (archive / "old.png").exists()
+    assert not (tmp_path / "old.png").exists()
+
+
+def test_purge_records_delete_changes(app, tmp_path):
+    pin_id = _add_pin(_expired())
+    purge_expired_pins(upload_folder=str(tmp_path))
+    ops = db.session.execute(db.select(PinChange.op).where(PinChange.pin_id == pin_id).order_by(PinChange.id))
+    assert ops.scalars().all() == ["upsert", "delete"]
+
+
+
+def test_expired_pins_are_hidden_before_purge(client):
+    live = _add_pin(expiry_now() + timedelta(days=1))
+    forever = _add_pin()
+    _add_pin(_expired())
+
+    assert sorted(p["id"] for p in client.get("/api/pins?fields=id").get_json()) == [live, forever]
+    assert sorted(p["id"] for p in client.get("/api/pins?fields=id&bbox=141.0,38.9,141.2,39.0").get_json()) == [
+        live, forever,
+    ]
@@ -0,0 +1,43 @@
+import pytest
+
+from metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.mark.parametrize("config_overrides", [{"METRICS_ENABLED": True, "METRICS_TOKEN": "secret"}])
+def test_metrics_requires_bearer_token(anonymous_client):
+    anonymous_client.get("/api/pins")
+
+    assert anonymous_client.get("/metrics").status_code == 401
+    assert anonymous_client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+    response = anonymous_client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert 'http_requests_total{blueprint="api",endpoint="api.get_pins",method="GET",status="200"} 1' in body
+    assert "db_queries_per_request_bucket" in body
+
+
+@pytest.mark.parametrize("config_overrides", [{"METRICS_ENABLED": True, "METRICS_TOKEN": None}])
+def test_metrics_without_token_is_not_served_even_from_loopback(anonymous_client):
+    response = anonymous_client.get("/metrics", environ_base={"REMOTE_ADDR": "127.0.0.1"})
+
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize(
+    "config_overrides", [{"METRICS_ENABLED": True, "METRICS_TOKEN": None, "METRICS_ALLOW_LOOPBACK": True}]
+)
+def test_metrics_loopback_only_when_allowed(anonymous_client):
+    assert anonymous_client.get("/metrics", environ_base={"REMOTE_ADDR": "127.0.0.1"}).status_code == 200
+    assert anonymous_client.get("/metrics", environ_base={"REMOTE_ADDR": "203.0.113.5"}).status_code == 403
+
+
+def test_metrics_disabled_by_default(anonymous_client):
+    assert anonymous_client.get("/metrics").status_code == 404
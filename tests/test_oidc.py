@@ -0,0 +1,110 @@
+import time
+
+import pytest
+import requests
+
+import google_oauth
+from oidc import MIN_REFRESH_INTERVAL, OIDCCache
+from SQLAlchemy_models import User
+
+METADATA_URL = "https://accounts.example.com/.well-known/openid-configuration"
+
+
+class FakeFetch:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def __call__(self, url):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+def test_cached_until_max_age(clock):
+    cache = OIDCCache(ttl=86400)
+    fetch = FakeFetch(({"v": 1}, 300), ({"v": 2}, 300))
+
+    assert cache.get(METADATA_URL, fetch) == {"v": 1}
+    clock[0] += 299
+    assert cache.get(METADATA_URL, fetch) == {"v": 1}
+    clock[0] += 2
+    assert cache.get(METADATA_URL, fetch) == {"v": 2}
+    assert fetch.calls == 2
+
+
+def test_ttl_is_used_without_max_age(clock):
+    cache = OIDCCache(ttl=60)
+    fetch = FakeFetch(({"v": 1}, None), ({"v": 2}, None))
+
+    cache.get(METADATA_URL, fetch)
+    clock[0] += 61
+    assert cache.get(METADATA_URL, fetch) == {"v": 2}
+
+
+def test_forced_refresh_is_rate_limited(clock):
+    cache = OIDCCache()
+    fetch = FakeFetch(({"keys": [1]}, 3600), ({"keys": [2]}, 3600))
+    cache.get(METADATA_URL, fetch)
+
+    assert cache.get(METADATA_URL, fetch, force=True) == {"keys": [1]}
+    clock[0] += MIN_REFRESH_INTERVAL
+    assert cache.get(METADATA_URL, fetch, force=True) == {"keys": [2]}
+    assert fetch.calls == 2
+
+
+def test_stale_value_is_served_when_fetch_fails(clock):
+    cache = OIDCCache(ttl=60)
+    cache.get(METADATA_URL, FakeFetch(({"v": 1}, None)))
+    clock[0] += 61
+
+    assert cache.get(METADATA_URL, FakeFetch(requests.ConnectionError())) == {"v": 1}
+    with pytest.raises(requests.ConnectionError):
+        OIDCCache().get(METADATA_URL, FakeFetch(requests.ConnectionError()))
+
+
+def test_entries_survive_restart(tmp_path, clock):
+    path = str(tmp_path / "oidc_cache.json")
+    first = OIDCCache()
+    first.configure(path, 86400)
+    first.get(METADATA_URL, FakeFetch(({"v": 1}, 300)))
+
+    second = OIDCCache()
+    second.configure(path, 86400)
+    fetch = FakeFetch()
+    assert second.get(METADATA_URL, fetch) == {"v": 1}
+    assert fetch.calls == 0
+
+
+def test_corrupt_cache_file_is_ignored(tmp_path):
+    path = tmp_path / "oidc_cache.json"
+    path.write_text("{not json", encoding="utf-8")
+    cache = OIDCCache()
+    cache.configure(str(path), 86400)
+
+    assert cache.get(METADATA_URL, FakeFetch(({"v": 1}, None))) == {"v": 1}
+
+
+def test_callback_uses_id_token_claims(anonymous_client, monkeypatch):
+    token = {"userinfo": {"sub": "google-1", "email": "a@example.com", "name": "旅人", "picture": None}}
+    monkeypatch.setattr(google_oauth.oauth.google, "authorize_access_token", lambda: token)
+
+    def no_userinfo(**kwargs):
+        raise AssertionError("userinfo エンドポイントは呼ばない")
+
+    monkeypatch.setattr(google_oauth.oauth.google, "userinfo", no_userinfo)
+
+    response = anonymous_client.get("/auth/callback")
+
+    assert response.status_code == 302
+    assert response.headers["Location"].endswith("/map")
+    assert User.query.filter_by(sub="google-1").one().name == "旅人"
@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+from flask import request
+
+from SQLAlchemy_models import db, Pin, expiry_now
+from pin_cache import ResponseCache, cache_key
+
+
+def _add_pin(expires_at=None):
+    pin = Pin(lat=38.99, lng=141.11, title="ピン", category=1, description="説明", user_id=1, expires_at=expires_at)
+    db.session.add(pin)
+    db.session.commit()
+    return pin.id
+
+
+def test_etag_and_not_modified(client):
+    _add_pin()
+    first = client.get("/api/pins")
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "no-cache"
+
+    second = client.get("/api/pins", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.data == b""
+    assert second.headers["X-Pins-Cursor"] == first.headers["X-Pins-Cursor"]
+
+
+def test_etag_changes_after_a_pin_is_added(client):
+    _add_pin()
+    etag = client.get("/api/pins").headers["ETag"]
+
+    _add_pin()
+    response = client.get("/api/pins", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert len(response.get_json()) == 2
+    assert response.headers["ETag"] != etag
+
+
+def test_cache_key_ignores_parameter_order(app):
+    with app.test_request_context("/api/pins?category=1&sort=title"):
+        first = cache_key(request.args)
+    with app.test_request_context("/api/pins?sort=title&category=1"):
+        assert cache_key(request.args) == first
+
+
+def test_response_cache_versions_and_expiry():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", 1, b"[]")
+    assert cache.get("a", 1).body == b"[]"
+    # 変更履歴IDが変わったら使わない
+    assert cache.get("a", 2) is None
+
+    cache.put("b", 1, b"[]", valid_until=expiry_now() - timedelta(seconds=1))
+    assert cache.get("b", 1) is None
+
+    for key in ("c", "d", "e"):
+        cache.put(key, 1, b"[]")
+    assert cache.get("c", 1) is None
+    assert cache.get("e", 1) is not None
@@ -0,0 +1,134 @@
+import threading
+
+import pytest
+
+import pin_chat
+from SQLAlchemy_models import db, Pin
+from chat_broker import LocalBroker, RedisBroker, get_broker
+from pin_chat import chat_channel, stream_limiter
+
+
+def _add_pin():
+    pin = Pin(lat=38.99, lng=141.11, title="ピン", category=1, description="説明", user_id=1)
+    db.session.add(pin)
+    db.session.commit()
+    return pin.id
+
+
+def _post(client, pin_id, message):
+    response = client.post(f"/api/pins/{pin_id}/chats", json={"message": message})
+    assert response.status_code == 200
+    return response.get_json()["chat"]
+
+
+def test_post_and_read_after(client):
+    pin_id = _add_pin()
+    first = _post(client, pin_id, "こんにちは")
+    second = _post(client, pin_id, "二件目")
+
+    chats = client.get(f"/api/pins/{pin_id}/chats?after={first['id']}").get_json()
+    assert [c["id"] for c in chats] == [second["id"]]
+
+
+def test_post_validation(client):
+    pin_id = _add_pin()
+    assert client.post(f"/api/pins/{pin_id}/chats", json={"message": ""}).status_code == 400
+    assert client.post("/api/pins/9999/chats", json={"message": "x"}).status_code == 404
+
+
+def test_limit_is_clamped(client):
+    pin_id = _add_pin()
+    first = _post(client, pin_id, "一件目")
+    _post(client, pin_id, "二件目")
+
+    for limit in (0, -1):
+        chats = client.get(f"/api/pins/{pin_id}/chats?limit={limit}").get_json()
+        assert [c["id"] for c in chats] == [first["id"]]
+
+
+@pytest.mark.parametrize("query", ["limit=x", "limit=1.5", "after=x", "wait=x", "wait=nan"])
+def test_invalid_query_is_bad_request(client, query):
+    pin_id = _add_pin()
+    assert client.get(f"/api/pins/{pin_id}/chats?{query}").status_code == 400
+
+
+def test_long_poll_receives_published_message(client):
+    pin_id = _add_pin()
+    message = {"id": 100, "message": "新着"}
+    timer = threading.Timer(0.2, get_broker().publish, (chat_channel(pin_id), message))
+    timer.start()
+    chats = client.get(f"/api/pins/{pin_id}/chats?wait=5").get_json()
+    timer.join()
+    assert chats == [message]
+
+
+def test_long_poll_returns_immediately_when_streams_are_full(client):
+    pin_id = _add_pin()
+    stream_limiter.configure(0)
+    assert client.get(f"/api/pins/{pin_id}/chats?wait=25").get_json() == []
+
+
+def test_stream_sends_backlog_and_releases_slot(client, monkeypatch):
+    monkeypatch.setattr(pin_chat, "SSE_HEARTBEAT_SECONDS", 0.05)
+    monkeypatch.setattr(pin_chat, "SSE_MAX_SECONDS", 0.1)
+    pin_id = _add_pin()
+    first = _post(client, pin_id, "一件目")
+    second = _post(client, pin_id, "二件目")
+    stream_limiter.configure(1)
+
+    response = client.get(f"/api/pins/{pin_id}/chats/stream", headers={"Last-Event-ID": str(first["id"])})
+    body = response.get_data(as_text=True)
+    response.close()
+
+    assert response.mimetype == "text/event-stream"
+    assert f"id: {second['id']}\n" in body
+    assert f"id: {first['id']}\n" not in body
+    # 切断後は次の接続を受けられる
+    assert stream_limiter.acquire()
+    stream_limiter.release()
+
+
+def test_stream_refused_when_full(client):
+    pin_id = _add_pin()
+    stream_limiter.configure(0)
+    response = client.get(f"/api/pins/{pin_id}/chats/stream")
+    assert response.status_code == 503
+    assert response.get_json()["fallback"] == "poll"
+
+
+def test_overflowed_subscription_stops_waiting():
+    broker = LocalBroker()
+    sub = broker.subscribe("c")
+    for i in range(sub.queue.maxsize + 1):
+        broker.publish("c", {"id": i})
+
+    assert sub.overflowed
+    received = []
+    while (message := sub.get(timeout=5)) is not None:
+        received.append(message["id"])
+    assert received == list(range(sub.queue.maxsize))
+    # 配信の対象から外れている
+    broker.publish("c", {"id": -1})
+    assert sub.get(timeout=0) is None
+
+
+def test_redis_broker_dispatches_to_local_subscribers(monkeypatch):
+    published = []
+
+    class FakeRedis:
+        def publish(self, channel, data):
+            published.append((channel, data))
+
+    broker = RedisBroker.__new__(RedisBroker)
+    broker.prefix = "test:"
+    broker._redis = FakeRedis()
+    broker._local = LocalBroker()
+    monkeypatch.setattr(broker, "_ensure_listener", lambda: None)
+
+    with broker.subscribe("pin-chat:1") as sub:
+        broker.publish("pin-chat:1", {"id": 1, "message": "あ"})
+        channel, data = published[0]
+        assert channel == "test:pin-chat:1"
+        # 購読スレッドが受け取った形で渡す
+        broker._handle({"channel": channel.encode(), "data": data.encode()})
+        assert sub.get(timeout=0) == {"id": 1, "message": "あ"}
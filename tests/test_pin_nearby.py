@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from SQLAlchemy_models import db, Pin, expiry_now
+from pin_nearby import PinIndex
+from spatial import haversine_m
+
+CENTER = (38.9870, 141.1100)
+
+
+def _add_pin(lat, lng, expires_at=None):
+    pin = Pin(lat=lat, lng=lng, title="ピン", category=1, description="説明", user_id=1, expires_at=expires_at)
+    db.session.add(pin)
+    db.session.commit()
+    return pin.id
+
+
+def test_nearby_matches_brute_force(app):
+    rng = np.random.default_rng(0)
+    points = list(zip(rng.uniform(38.95, 39.02, 200), rng.uniform(141.07, 141.15, 200)))
+    ids = [_add_pin(float(lat), float(lng)) for lat, lng in points]
+    index = PinIndex()
+    index.sync()
+
+    hits = index.nearby(*CENTER, 1500, k=10)
+
+    dist = haversine_m(*CENTER, np.array([p[0] for p in points]), np.array([p[1] for p in points]))
+    expected = [ids[i] for i in np.argsort(dist) if dist[i] <= 1500][:10]
+    assert [i for i, _ in hits] == expected
+    assert all(a[1] <= b[1] for a, b in zip(hits, hits[1:]))
+
+
+def test_index_follows_changes_and_expiry(app):
+    index = PinIndex()
+    first = _add_pin(38.9871, 141.1101)
+    index.sync()
+    assert [i for i, _ in index.nearby(*CENTER, 100)] == [first]
+
+    second = _add_pin(38.9872, 141.1102)
+    db.session.delete(db.session.get(Pin, first))
+    db.session.commit()
+    _add_pin(38.9873, 141.1103, expires_at=expiry_now() - timedelta(minutes=1))
+    index.sync()
+
+    assert [i for i, _ in index.nearby(*CENTER, 100)] == [second]
+    assert len(index) == 1
+
+
+def test_nearby_endpoint(client):
+    near = _add_pin(38.9875, 141.1100)
+    nearer = _add_pin(38.9871, 141.1100)
+    _add_pin(38.9990, 141.1100)
+
+    body = client.get(f"/api/pins/nearby?lat={CENTER[0]}&lng={CENTER[1]}&radius=500&fields=id").get_json()
+    assert [p["id"] for p in body] == [nearer, near]
+    assert body[0]["distance_m"] == pytest.approx(11.1, abs=0.2)
+
+    body = client.get(f"/api/pins/nearby?pin_id={nearer}&radius=500&k=1").get_json()
+    assert [p["id"] for p in body] == [near]
+
+
+@pytest.mark.parametrize(
+    "query", ["lat=38.98", "lat=x&lng=141.1", "lat=100&lng=141.1", "lat=38.98&lng=141.1&radius=0",
+              "lat=38.98&lng=141.1&radius=nan", "lat=38.98&lng=141.1&k=0"],
+)
+def test_nearby_rejects_invalid_parameters(client, query):
+    assert client.get(f"/api/pins/nearby?{query}").status_code == 400
+
+
+def test_nearby_unknown_pin_is_404(client):
+    assert client.get("/api/pins/nearby?pin_id=9999").status_code == 404
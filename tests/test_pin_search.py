@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+import pytest
+
+from SQLAlchemy_models import db, Pin, expiry_now
+
+
+def _add_pin(title, description="説明", category=1, expires_at=None):
+    pin = Pin(lat=38.99, lng=141.11, title=title, category=category, description=description, user_id=1,
+              expires_at=expires_at)
+    db.session.add(pin)
+    db.session.commit()
+    return pin.id
+
+
+def _search(client, query):
+    response = client.get(f"/api/pins/search?{query}&fields=id")
+    assert response.status_code == 200
+    return [p["id"] for p in response.get_json()]
+
+
+def _drop_fts():
+    for name in ("pins_fts_ai", "pins_fts_ad", "pins_fts_au"):
+        db.session.execute(db.text(f"DROP TRIGGER IF EXISTS {name}"))
+    db.session.execute(db.text("DROP TABLE pins_fts"))
+    db.session.commit()
+
+
+@pytest.fixture(params=["fts", "like"])
+def search_backend(request, app):
+    """pins_fts がある場合と、ない(LIKE だけで検索する)場合の両方で試す"""
+    if request.param == "like":
+        _drop_fts()
+    return request.param
+
+
+def test_title_matches_rank_first(client, search_backend):
+    in_description = _add_pin("休憩所", description="中尊寺金色堂の近くにあります")
+    in_title = _add_pin("中尊寺金色堂の駐車場")
+
+    assert _search(client, "q=中尊寺金色堂") == [in_title, in_description]
+
+
+def test_all_terms_must_match(client, search_backend):
+    both = _add_pin("毛越寺 庭園", description="浄土庭園の池")
+    _add_pin("毛越寺 駐車場")
+
+    assert _search(client, "q=毛越寺%20浄土庭園") == [both]
+    # 2文字の語は LIKE で絞り込む
+    assert _search(client, "q=毛越寺%20池") == [both]
+
+
+def test_search_skips_expired_and_filters_category(client, search_backend):
+    shown = _add_pin("観自在王院跡", category=2)
+    _add_pin("観自在王院跡の案内", category=3)
+    _add_pin("観自在王院跡 期限切れ", category=2, expires_at=expiry_now() - timedelta(hours=1))
+
+    assert _search(client, "q=観自在王院&category=2") == [shown]
+
+
+def test_search_treats_operators_as_text(client, search_backend):
+    literal = _add_pin('"高館" OR 義経堂')
+
+    assert _search(client, "q=%22高館%22%20OR") == [literal]
+    assert _search(client, "q=100%25") == []
+
+
+def test_fts_follows_updates(client):
+    pin_id = _add_pin("旧称")
+    db.session.get(Pin, pin_id).title = "達谷窟毘沙門堂"
+    db.session.commit()
+
+    assert _search(client, "q=達谷窟") == [pin_id]
+    assert _search(client, "q=旧称") == []
+
+
+@pytest.mark.parametrize("query", ["q=", "q=a&limit=0", "q=a&limit=x", "q=a&fields=secret"])
+def test_search_rejects_invalid_parameters(client, query):
+    assert client.get(f"/api/pins/search?{query}").status_code == 400
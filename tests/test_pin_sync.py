@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone
+
+from SQLAlchemy_models import db, Pin, PinChange, expiry_now
+from maintenance import prune_pin_changes
+from pin_sync import latest_change_id, make_cursor
+
+
+def _add_pin(expires_at=None, lat=38.99, lng=141.11):
+    pin = Pin(lat=lat, lng=lng, title="ピン", category=1, description="説明", user_id=1, expires_at=expires_at)
+    db.session.add(pin)
+    db.session.commit()
+    return pin.id
+
+
+def _sync(client, cursor, query=""):
+    response = client.get(f"/api/pins?since={cursor}{query}")
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_since_returns_added_and_removed_pins(client):
+    kept = _add_pin()
+    deleted = _add_pin()
+    cursor = client.get("/api/pins").headers["X-Pins-Cursor"]
+
+    added = _add_pin()
+    db.session.delete(db.session.get(Pin, deleted))
+    db.session.commit()
+
+    body = _sync(client, cursor)
+    assert [p["id"] for p in body["pins"]] == [added]
+    assert body["removed"] == [deleted]
+
+    # 新しいカーソルからは変更なし
+    again = _sync(client, body["cursor"])
+    assert again["pins"] == [] and again["removed"] == []
+    assert db.session.get(Pin, kept) is not None
+
+
+def test_since_reports_pins_that_expired_in_between(client):
+    cursor = make_cursor(latest_change_id(), expiry_now() - timedelta(hours=2))
+    expired = _add_pin(expires_at=expiry_now() - timedelta(hours=1))
+
+    assert _sync(client, cursor)["removed"] == [expired]
+
+
+def test_since_moves_pins_outside_bbox_to_removed(client):
+    cursor = client.get("/api/pins").headers["X-Pins-Cursor"]
+    inside = _add_pin()
+    outside = _add_pin(lat=38.80, lng=140.98)
+
+    body = _sync(client, cursor, "&bbox=141.05,38.95,141.15,39.02")
+    assert [p["id"] for p in body["pins"]] == [inside]
+    assert body["removed"] == [outside]
+
+
+def test_invalid_cursor_is_bad_request(client):
+    assert client.get("/api/pins?since=abc").status_code == 400
+
+
+def test_prune_keeps_latest_change(app):
+    for _ in range(3):
+        _add_pin()
+    old = datetime.now(timezone.utc) - timedelta(days=30)
+    db.session.execute(db.update(PinChange).values(changed_at=old))
+    db.session.commit()
+    latest = latest_change_id()
+
+    assert prune_pin_changes(7, batch_size=1) == 2
+    assert db.session.execute(db.select(PinChange.id)).scalars().all() == [latest]
+
+
+def test_pruned_cursor_asks_for_reload(client):
+    cursor = client.get("/api/pins").headers["X-Pins-Cursor"]
+    for _ in range(3):
+        _add_pin()
+    db.session.execute(db.update(PinChange).values(changed_at=datetime.now(timezone.utc) - timedelta(days=30)))
+    db.session.commit()
+    prune_pin_changes(7)
+
+    response = client.get(f"/api/pins?since={cursor}")
+
+    assert response.status_code == 410
+    assert response.get_json()["reset"] is True
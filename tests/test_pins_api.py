@@ -0,0 +1,107 @@
+import base64
+import json
+
+import numpy as np
+import pytest
+
+from SQLAlchemy_models import db, Pin
+from spatial import parse_bbox, tile_key_for, tile_keys_for
+
+REGION = (38.75, 39.05, 140.95, 141.30)
+
+
+def _add_pin(lat, lng, **values):
+    values.setdefault("title", "ピン")
+    values.setdefault("description", "説明")
+    pin = Pin(lat=lat, lng=lng, category=values.pop("category", 1), user_id=1, **values)
+    db.session.add(pin)
+    db.session.commit()
+    return pin
+
+
+@pytest.mark.parametrize("value", ["nan,38.9,141.2,39.0", "141.0,38.9,inf,39.0", "141.0,-inf,141.2,39.0"])
+def test_parse_bbox_rejects_non_finite(value):
+    with pytest.raises(ValueError):
+        parse_bbox(value, REGION)
+
+
+def test_parse_bbox_clips_to_region():
+    assert parse_bbox("140.0,38.0,142.0,40.0", REGION) == (140.95, 38.75, 141.30, 39.05)
+    assert parse_bbox("130.0,30.0,131.0,31.0", REGION) is None
+
+
+def test_tile_keys_for_matches_tile_key_for():
+    lat = np.array([38.75, 38.9012, 39.05, 38.99])
+    lng = np.array([140.95, 141.1234, 141.30, 141.11])
+    assert list(tile_keys_for(lat, lng)) == [tile_key_for(a, b) for a, b in zip(lat, lng)]
+
+
+@pytest.mark.parametrize("bbox", ["nan,38.9,141.2,39.0", "141.0,38.9,inf,39.0"])
+@pytest.mark.parametrize("url", ["/api/pins?bbox={}", "/api/pins/clusters?z=12&bbox={}"])
+def test_non_finite_bbox_is_bad_request(client, url, bbox):
+    response = client.get(url.format(bbox))
+
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_bbox_returns_only_pins_inside(client):
+    inside = _add_pin(38.95, 141.10)
+    _add_pin(38.95, 141.25)
+    _add_pin(38.80, 141.10)
+
+    response = client.get("/api/pins?bbox=141.05,38.90,141.15,39.00&fields=id")
+
+    assert response.status_code == 200
+    assert [p["id"] for p in response.get_json()] == [inside.id]
+
+
+def test_bbox_outside_region_is_empty(client):
+    _add_pin(38.95, 141.10)
+
+    response = client.get("/api/pins?bbox=130.0,30.0,131.0,31.0")
+
+    assert response.status_code == 200
+    assert response.get_json() == []
+
+
+def _cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def test_pages_by_title_with_next_cursor(client):
+    for title in ("う", "あ", "い"):
+        _add_pin(38.95, 141.10, title=title)
+
+    first = client.get("/api/pins?sort=title&limit=2&fields=title")
+    assert [p["title"] for p in first.get_json()] == ["あ", "い"]
+
+    second = client.get(f"/api/pins?sort=title&limit=2&fields=title&after={first.headers['X-Next-Cursor']}")
+    assert [p["title"] for p in second.get_json()] == ["う"]
+    assert "X-Next-Cursor" not in second.headers
+
+
+@pytest.mark.parametrize(
+    "sort, key",
+    [("title", [[1], 2]), ("title", ["あ", "2"]), ("title", ["あ"]), ("id", ["1"]), ("id", [True]), ("id", 1)],
+)
+def test_malformed_after_is_bad_request(client, sort, key):
+    _add_pin(38.95, 141.10)
+
+    response = client.get(f"/api/pins?sort={sort}&after={_cursor(key)}")
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("query", ["sort=created_at", "fields=id,secret", "limit=0", "z=x", "category=x"])
+def test_invalid_pin_query_is_bad_request(client, query):
+    assert client.get(f"/api/pins?{query}").status_code == 400
+
+
+def test_category_and_fields(client):
+    pin = _add_pin(38.95, 141.10, category=2)
+    _add_pin(38.95, 141.10, category=3)
+
+    response = client.get("/api/pins?category=2&fields=title")
+
+    assert response.get_json() == [{"id": pin.id, "title": "ピン"}]
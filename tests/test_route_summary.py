@@ -0,0 +1,49 @@
+import pytest
+
+from SQLAlchemy_models import db, Pin, Route, RoutePin
+from route_summary import summarize_route, thumbnail_url
+
+HASHED_IMAGE = f"http://localhost/static/uploads/{'b' * 64}.jpg"
+
+
+def test_summarize_route():
+    summary = summarize_route([(38.99, 141.11, 1), (38.98, 141.11, 2), (38.98, 141.12, 1)], HASHED_IMAGE)
+
+    assert summary["stop_count"] == 3
+    assert (summary["min_lat"], summary["max_lat"], summary["min_lng"], summary["max_lng"]) == (
+        38.98, 38.99, 141.11, 141.12,
+    )
+    # 緯度0.01度(約1.11km)+ 経度0.01度(約0.87km)
+    assert summary["length_m"] == pytest.approx(1977, abs=5)
+    assert summary["category_counts"] == {"1": 2, "2": 1}
+    assert summary["thumbnail_url"] == thumbnail_url(HASHED_IMAGE)
+    assert summary["thumbnail_url"].endswith(f"/variants/{'b' * 64}_list.webp")
+
+
+def test_summarize_route_without_stops_or_hashed_image():
+    summary = summarize_route([], "http://localhost/static/uploads/old.png")
+
+    assert summary["stop_count"] == 0
+    assert summary["length_m"] == 0.0
+    assert summary["min_lat"] is None
+    assert summary["thumbnail_url"] is None
+
+
+def test_rebuild_command_fills_summaries_and_list(app, client):
+    pins = [Pin(lat=38.99 - i * 0.01, lng=141.11, title="ピン", category=1, description="説明", user_id=1)
+            for i in range(2)]
+    routes = [Route(name=f"旅路{i}", description="説明", image_url=HASHED_IMAGE, user_id=1) for i in range(3)]
+    db.session.add_all([*pins, *routes])
+    db.session.flush()
+    db.session.add_all(RoutePin(route_id=r.id, pin_id=p.id, order=i) for r in routes for i, p in enumerate(pins))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["pins", "rebuild-route-summaries", "--batch-size", "2"])
+
+    assert result.exit_code == 0, result.output
+    assert "3 件の旅路の要約を再構築しました" in result.output
+    listed = client.get("/api/routes").get_json()
+    assert [r["stop_count"] for r in listed] == [2, 2, 2]
+    assert listed[0]["bbox"] == pytest.approx([141.11, 38.98, 141.11, 38.99])
+    assert listed[0]["categories"] == {"1": 2}
+    assert listed[0]["thumbnail_url"].endswith("_list.webp")
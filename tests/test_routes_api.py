@@ -0,0 +1,153 @@
+import base64
+import io
+import json
+
+import pytest
+from PIL import Image
+from sqlalchemy import event
+
+from SQLAlchemy_models import db, Pin, Route, RoutePin
+
+
+def _add_pins(*points):
+    pins = [
+        Pin(lat=lat, lng=lng, title=f"ピン{i}", description="説明", category=category, user_id=1)
+        for i, (lat, lng, category) in enumerate(points)
+    ]
+    db.session.add_all(pins)
+    db.session.commit()
+    return [p.id for p in pins]
+
+
+def _png():
+    buffer = io.BytesIO()
+    Image.new("RGB", (16, 16), (40, 120, 200)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _post_route(client, route_pins, name="旅路"):
+    return client.post(
+        "/api/routes",
+        data={
+            "name": name,
+            "description": "説明",
+            "route_pins": json.dumps(route_pins),
+            "image": (io.BytesIO(_png()), "route.png"),
+        },
+        content_type="multipart/form-data",
+    )
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._count)
+
+
+def test_add_route_rejects_unknown_pin(client):
+    pin = Pin(lat=38.9, lng=141.1, title="ピン", description="説明", category=1, user_id=1)
+    db.session.add(pin)
+    db.session.commit()
+
+    response = client.post(
+        "/api/routes",
+        data={
+            "name": "旅路",
+            "description": "説明",
+            "route_pins": json.dumps([{"pin_id": pin.id, "order": 0}, {"pin_id": 9999, "order": 1}]),
+            "image": (io.BytesIO(b"dummy"), "route.png"),
+        },
+        content_type="multipart/form-data",
+    )
+
+    assert response.status_code == 400
+    assert "9999" in response.get_json()["error"]
+    assert db.session.execute(db.select(db.func.count()).select_from(Route)).scalar() == 0
+
+
+@pytest.mark.usefixtures("upload_folders")
+def test_add_route_stores_stops_and_summary(client):
+    first, second, third = _add_pins((38.99, 141.11, 1), (38.98, 141.12, 2), (38.97, 141.13, 1))
+
+    response = _post_route(
+        client, [{"pin_id": third, "order": 2}, {"pin_id": first, "order": 0}, {"pin_id": second, "order": 1}]
+    )
+
+    assert response.status_code == 200
+    route = db.session.get(Route, response.get_json()["route_id"])
+    assert route.stop_count == 3
+    assert route.category_counts == {"1": 2, "2": 1}
+    assert (route.min_lat, route.max_lat) == (38.97, 38.99)
+    assert 2500 < route.length_m < 3000
+    assert route.thumbnail_url.endswith("_list.webp")
+    stops = db.session.execute(
+        db.select(RoutePin.pin_id).where(RoutePin.route_id == route.id).order_by(RoutePin.order)
+    ).scalars().all()
+    assert stops == [first, second, third]
+
+
+@pytest.mark.parametrize("route_pins", [[], [{"pin_id": "x", "order": 0}], [{"order": 0}]])
+@pytest.mark.usefixtures("upload_folders")
+def test_add_route_rejects_malformed_stops(client, route_pins):
+    assert _post_route(client, route_pins).status_code == 400
+
+
+@pytest.mark.usefixtures("upload_folders")
+def test_route_pins_in_order_with_one_query(app, client):
+    ids = _add_pins(*[(38.99 - i * 0.001, 141.11, 1) for i in range(5)])
+    route_id = _post_route(client, [{"pin_id": pin_id, "order": 4 - i} for i, pin_id in enumerate(ids)]).get_json()[
+        "route_id"
+    ]
+
+    with QueryCounter(db.engine) as queries:
+        response = client.get(f"/api/routes/{route_id}/pins")
+
+    assert [p["id"] for p in response.get_json()] == ids[::-1]
+    assert [p["order"] for p in response.get_json()] == [0, 1, 2, 3, 4]
+    # 経由ピンは JOIN 1回で読む(ログイン中のユーザーはキャッシュから読む)
+    assert queries.count == 1
+
+
+def test_route_pins_of_unknown_route_is_404(client):
+    assert client.get("/api/routes/9999/pins").status_code == 404
+
+
+def _cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def _add_routes(*names):
+    for name in names:
+        db.session.add(Route(name=name, description="説明", image_url="/static/uploads/route.png", user_id=1))
+    db.session.commit()
+
+
+def test_get_routes_pages_by_name(client):
+    _add_routes("う", "あ", "い")
+
+    first = client.get("/api/routes?limit=2")
+    assert [r["name"] for r in first.get_json()] == ["あ", "い"]
+    cursor = first.headers["X-Next-Cursor"]
+
+    second = client.get(f"/api/routes?limit=2&after={cursor}")
+    assert [r["name"] for r in second.get_json()] == ["う"]
+    assert "X-Next-Cursor" not in second.headers
+
+
+@pytest.mark.parametrize("key", [[[1], 2], ["あ", "2"], ["あ", True], ["あ"], {"name": "あ"}, "あ"])
+def test_get_routes_rejects_malformed_cursor(client, key):
+    _add_routes("あ")
+
+    response = client.get(f"/api/routes?after={_cursor(key)}")
+
+    assert response.status_code == 400
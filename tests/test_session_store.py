@@ -0,0 +1,80 @@
+import sqlite3
+import time
+from datetime import timedelta
+
+import pytest
+
+from session_store import MemorySessionInterface, SQLiteSessionInterface
+
+BACKENDS = [
+    ({"SESSION_TYPE": "sqlite"}, SQLiteSessionInterface),
+    ({"SESSION_TYPE": "memory"}, MemorySessionInterface),
+]
+
+
+@pytest.mark.parametrize("config_overrides, interface", BACKENDS)
+def test_session_round_trip(app, config_overrides, interface):
+    assert isinstance(app.session_interface, interface)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["visited"] = ["中尊寺", "毛越寺"]
+
+    with client.session_transaction() as session:
+        assert session["visited"] == ["中尊寺", "毛越寺"]
+    # クッキーのない別のクライアントからは見えない
+    with app.test_client().session_transaction() as session:
+        assert "visited" not in session
+
+
+@pytest.mark.parametrize("config_overrides, interface", BACKENDS)
+def test_logged_in_session_is_loaded_from_store(client, config_overrides, interface):
+    response = client.get("/map")
+
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("config_overrides, interface", BACKENDS)
+def test_expired_session_is_not_loaded(app, config_overrides, interface, monkeypatch):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["visited"] = ["中尊寺"]
+
+    later = time.time() + app.config["PERMANENT_SESSION_LIFETIME"].total_seconds() + 1
+    monkeypatch.setattr(time, "time", lambda: later)
+
+    store_id = app.session_interface.key_prefix + next(iter(_session_ids(app)))
+    assert app.session_interface._retrieve_session_data(store_id) is None
+
+
+@pytest.mark.parametrize("config_overrides", [{"SESSION_TYPE": "sqlite"}])
+def test_sqlite_cleanup_deletes_only_expired(app, monkeypatch):
+    interface = app.session_interface
+    monkeypatch.setattr("session_store.CLEANUP_BATCH_SIZE", 2)
+    for i in range(5):
+        interface._upsert_session(timedelta(seconds=-1), {"i": i}, f"old{i}")
+    interface._upsert_session(timedelta(days=1), {"i": "new"}, "new")
+
+    interface._delete_expired_sessions()
+
+    with sqlite3.connect(app.config["SESSION_SQLITE_PATH"]) as conn:
+        assert [r[0] for r in conn.execute("SELECT id FROM sessions")] == ["new"]
+
+
+def test_memory_store_evicts_least_recently_used(app):
+    interface = MemorySessionInterface(app, max_entries=2)
+    for name in ("a", "b"):
+        interface._upsert_session(timedelta(days=1), {"name": name}, name)
+    interface._retrieve_session_data("a")
+    interface._upsert_session(timedelta(days=1), {"name": "c"}, "c")
+
+    assert interface._retrieve_session_data("b") is None
+    assert interface._retrieve_session_data("a") == {"name": "a"}
+
+
+def _session_ids(app):
+    interface = app.session_interface
+    prefix = interface.key_prefix
+    if isinstance(interface, MemorySessionInterface):
+        return [k[len(prefix):] for k in interface._entries]
+    with sqlite3.connect(app.config["SESSION_SQLITE_PATH"]) as conn:
+        return [r[0][len(prefix):] for r in conn.execute("SELECT id FROM sessions")]
@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+from SQLAlchemy_models import db, Pin, Route
+from streaming import iter_json_array
+
+
+@pytest.mark.parametrize("rows", [[], [1], list(range(500))])
+def test_iter_json_array_is_valid_json_in_chunks(rows):
+    chunks = list(iter_json_array(rows, lambda i: {"id": i, "title": "ピン" * 5}, chunk_bytes=256))
+
+    assert json.loads(b"".join(chunks)) == [{"id": i, "title": "ピン" * 5} for i in rows]
+    if len(rows) > 100:
+        assert len(chunks) > 1
+        assert all(len(c) < 512 for c in chunks)
+
+
+def test_stream_pins_matches_buffered_response(client):
+    db.session.add_all(
+        Pin(lat=38.99, lng=141.11, title=f"ピン{i}", category=1, description="説明", user_id=1) for i in range(30)
+    )
+    db.session.commit()
+
+    buffered = client.get("/api/pins?fields=id,title")
+    streamed = client.get("/api/pins?fields=id,title&stream=1")
+
+    assert streamed.is_streamed
+    assert streamed.headers["Cache-Control"] == "no-cache"
+    assert streamed.headers["X-Pins-Cursor"] == buffered.headers["X-Pins-Cursor"]
+    assert streamed.get_json() == buffered.get_json()
+
+
+def test_stream_routes_returns_all_rows(client):
+    db.session.add_all(
+        Route(name=f"旅路{i:03}", description="説明", image_url="http://localhost/static/uploads/a.png", user_id=1)
+        for i in range(120)
+    )
+    db.session.commit()
+
+    streamed = client.get("/api/routes?stream=1")
+
+    assert streamed.is_streamed
+    assert [r["name"] for r in streamed.get_json()] == [f"旅路{i:03}" for i in range(120)]
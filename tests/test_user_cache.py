@@ -0,0 +1,60 @@
+import time
+
+from sqlalchemy import event
+
+from SQLAlchemy_models import db, User
+from user_cache import CachedUser, UserCache, load_cached_user, user_cache
+
+
+def _count_queries(fn):
+    count = 0
+
+    def before(*args):
+        nonlocal count
+        count += 1
+
+    event.listen(db.engine, "before_cursor_execute", before)
+    try:
+        fn()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before)
+    return count
+
+
+def test_logged_in_requests_load_the_user_once(app, client):
+    assert _count_queries(lambda: client.get("/map")) == 1
+    assert _count_queries(lambda: client.get("/map")) == 0
+
+
+def test_cached_user_is_detached_copy(app):
+    user = load_cached_user("1")
+
+    assert isinstance(user, CachedUser)
+    assert (user.id, user.name, user.is_authenticated) == (1, "テストユーザー", True)
+    assert load_cached_user("1") is user
+    assert load_cached_user("x") is None
+    assert load_cached_user("9999") is None
+
+
+def test_invalidate_reloads_changed_user(app):
+    load_cached_user("1")
+    db.session.get(User, 1).name = "新しい名前"
+    db.session.commit()
+
+    assert load_cached_user("1").name == "テストユーザー"
+    user_cache.invalidate(1)
+    assert load_cached_user("1").name == "新しい名前"
+
+
+def test_entries_expire_and_are_evicted(monkeypatch):
+    cache = UserCache(max_entries=2, ttl=60)
+    for i in (1, 2):
+        cache.put(CachedUser(i, f"sub{i}", None, f"user{i}", None))
+    cache.get(1)
+    cache.put(CachedUser(3, "sub3", None, "user3", None))
+    assert cache.get(2) is None
+    assert cache.get(1).name == "user1"
+
+    later = time.monotonic() + 61
+    monkeypatch.setattr(time, "monotonic", lambda: later)
+    assert cache.get(1) is None
@@ -0,0 +1,74 @@
+import networkx as nx
+import pytest
+
+from SQLAlchemy_models import db, Pin, Route, RoutePin
+from walking import WalkGraph
+
+
+def _grid_graph():
+    """平泉駅前の東西に伸びる3ノードの道と、南に外れた道につながらないノード"""
+    graph = nx.MultiDiGraph()
+    nodes = {1: (38.9870, 141.1100), 2: (38.9870, 141.1120), 3: (38.9870, 141.1140), 9: (38.9800, 141.1100)}
+    for n, (lat, lng) in nodes.items():
+        graph.add_node(n, y=lat, x=lng)
+    graph.add_edge(1, 2, length=173.0)
+    graph.add_edge(2, 3, length=175.0)
+    # 一方通行の逆向きと、平行する遠回りの道
+    graph.add_edge(3, 2, length=400.0)
+    return graph
+
+
+@pytest.fixture
+def walk_graph():
+    return WalkGraph(_grid_graph(), speed_kmh=3.6)
+
+
+def test_leg_follows_the_network(walk_graph):
+    leg = walk_graph.leg((38.9870, 141.1100), (38.9870, 141.1140))
+
+    assert leg["on_network"] is True
+    assert leg["distance_m"] == pytest.approx(348.0, abs=0.5)
+    assert leg["duration_s"] == round(leg["distance_m"])
+    assert leg["path"][1:-1] == [[38.987, 141.11], [38.987, 141.112], [38.987, 141.114]]
+
+
+def test_reverse_leg_uses_the_shorter_parallel_edge(walk_graph):
+    leg = walk_graph.leg((38.9870, 141.1140), (38.9870, 141.1100))
+
+    assert leg["distance_m"] == pytest.approx(348.0, abs=0.5)
+    assert leg["path"][1:-1] == [[38.987, 141.114], [38.987, 141.112], [38.987, 141.11]]
+
+
+def test_disconnected_or_far_stops_fall_back_to_straight_lines(walk_graph):
+    assert walk_graph.leg((38.9870, 141.1100), (38.9800, 141.1100))["on_network"] is False
+    far = walk_graph.leg((38.9870, 141.1100), (38.9000, 141.1100))
+    assert far["on_network"] is False
+    assert far["path"] == [[38.987, 141.11], [38.9, 141.11]]
+
+
+def test_route_sums_legs(walk_graph):
+    result = walk_graph.route([(38.9870, 141.1100), (38.9870, 141.1120), (38.9870, 141.1140)])
+
+    assert len(result["legs"]) == 2
+    assert result["distance_m"] == pytest.approx(sum(leg["distance_m"] for leg in result["legs"]))
+
+
+def test_route_path_endpoint(client, walk_graph, monkeypatch):
+    pins = [
+        Pin(lat=38.9870, lng=lng, title="ピン", description="説明", category=1, user_id=1)
+        for lng in (141.1100, 141.1140)
+    ]
+    route = Route(name="旅路", description="説明", image_url="http://localhost/static/uploads/a.png", user_id=1)
+    db.session.add_all([*pins, route])
+    db.session.flush()
+    db.session.add_all([RoutePin(route_id=route.id, pin_id=p.id, order=i) for i, p in enumerate(pins)])
+    db.session.commit()
+
+    monkeypatch.setattr("routes.get_walk_graph", lambda: None)
+    assert client.get(f"/api/routes/{route.id}/path").status_code == 503
+
+    monkeypatch.setattr("routes.get_walk_graph", lambda: walk_graph)
+    body = client.get(f"/api/routes/{route.id}/path").get_json()
+    assert body["route_id"] == route.id
+    assert (body["legs"][0]["from_pin_id"], body["legs"][0]["to_pin_id"]) == (pins[0].id, pins[1].id)
+    assert client.get("/api/routes/9999/path").status_code == 404
@@ -0,0 +1,88 @@
+# ログインユーザー読み込み(Flask-Login の user_loader)のキャッシュ用ファイルです。
+# ピン一覧・掲示板のポーリングなど、ログイン中のリクエストのたびに users テーブルを読まないよう、
+# ユーザーの表示用の値だけを持つ小さなオブジェクトをプロセス内に TTL 付きの LRU で保存します。
+# Google ログインでメールアドレス・名前・アイコンが変わったら invalidate で消します
+# (別ワーカーのキャッシュは TTL が切れるまで古い表示のままになります)。
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+from SQLAlchemy_models import db, User
+
+
+class CachedUser(UserMixin):
+    """DB セッションから切り離したユーザー情報(current_user として使う)"""
+
+    __slots__ = ("id", "sub", "email", "name", "picture")
+
+    def __init__(self, id, sub, email, name, picture):
+        self.id = id
+        self.sub = sub
+        self.email = email
+        self.name = name
+        self.picture = picture
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.sub, user.email, user.name, user.picture)
+
+
+class UserCache:
+    """ユーザーID → CachedUser の TTL 付き LRU キャッシュ"""
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def put(self, user):
+        with self._lock:
+            self._entries[user.id] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        """ユーザー情報を変更したら呼ぶ"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def configure(self, max_entries, ttl):
+        with self._lock:
+            self.max_entries = max_entries
+            self.ttl = ttl
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+def load_cached_user(user_id):
+    """Flask-Login の user_loader。キャッシュになければ DB から読んで保存する"""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    return user_cache.put(CachedUser.from_user(user))
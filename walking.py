@@ -0,0 +1,196 @@
+# 旅路の経由ピン間の徒歩経路(道なり)計算用ファイルです。
+# 一関・平泉周辺の歩行者用道路網(osmnx で保存した GraphML)を起動時に1回だけ読み込み、
+# ピンを最寄りの交差点(ノード)に寄せて、区間ごとの経路・距離・所要時間を求めます。
+# 計算結果はノードの組ごとに LRU キャッシュするので、同じ区間は2回目から計算しません。
+# 地図データは flask walk download-graph で事前に取得しておきます(リクエスト中は通信しません)。
+
+import os
+import threading
+from collections import OrderedDict
+
+import networkx as nx
+import numpy as np
+from config import INSTANCE_DIR
+from spatial import haversine_m
+
+DEFAULT_GRAPH_PATH = os.path.join(INSTANCE_DIR, "walk_graph.graphml")
+
+# 歩く速さ(時速 km)の既定値
+DEFAULT_WALK_SPEED_KMH = 4.8
+
+# 最寄りノードがこれより遠いピンは道路網の外として直線で結ぶ
+MAX_SNAP_METERS = 500
+
+
+class LRUCache:
+    """キー→値の LRU キャッシュ(スレッドセーフ)"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class WalkGraph:
+    """徒歩経路の計算(読み込み済みの道路網とキャッシュを持つ)"""
+
+    def __init__(self, graph, speed_kmh=DEFAULT_WALK_SPEED_KMH, cache_size=4096):
+        # 歩行者は一方通行に従わないので無向グラフにし、平行する道は短い方だけ残す
+        self.graph = nx.Graph()
+        for u, v, data in graph.edges(data=True):
+            length = float(data.get("length", 0))
+            current = self.graph.get_edge_data(u, v)
+            if current is None or length < current["length"]:
+                self.graph.add_edge(u, v, length=length, geometry=_edge_coords(graph, u, v, data))
+        for n, node in self.graph.nodes(data=True):
+            node["lat"], node["lng"] = float(graph.nodes[n]["y"]), float(graph.nodes[n]["x"])
+
+        # 最寄りノード探索用の座標配列
+        self.node_ids = np.array(list(self.graph.nodes))
+        self.node_lat = np.array([self.graph.nodes[n]["lat"] for n in self.node_ids])
+        self.node_lng = np.array([self.graph.nodes[n]["lng"] for n in self.node_ids])
+
+        self.speed_mps = speed_kmh * 1000 / 3600
+        self._legs = LRUCache(cache_size)
+        self._snaps = LRUCache(cache_size)
+
+    def nearest_node(self, lat, lng):
+        """(ノードID, ノードまでの距離 m) を返す"""
+        key = (lat, lng)
+        cached = self._snaps.get(key)
+        if cached is not None:
+            return cached
+        # 経度方向は緯度で縮めた平面距離で候補を絞り、最も近いノードだけ正確に測る
+        scale = np.cos(np.radians(lat))
+        d2 = (self.node_lat - lat) ** 2 + ((self.node_lng - lng) * scale) ** 2
+        i = int(np.argmin(d2))
+        node = self.node_ids[i].item()
+        return self._snaps.put(key, (node, float(haversine_m(lat, lng, self.node_lat[i], self.node_lng[i]))))
+
+    def node_latlng(self, node):
+        data = self.graph.nodes[node]
+        return data["lat"], data["lng"]
+
+    def leg(self, start, end):
+        """ピン start → end((lat, lng))の経路。{"distance_m", "duration_s", "path", "on_network"} を返す"""
+        (u, u_off), (v, v_off) = self.nearest_node(*start), self.nearest_node(*end)
+        if u_off > MAX_SNAP_METERS or v_off > MAX_SNAP_METERS:
+            return self._straight(start, end)
+
+        path = self._node_path(u, v)
+        if path is None:
+            return self._straight(start, end)
+
+        coords, length = path
+        # ピンから最寄りノードまでの区間は直線で補う
+        distance = length + u_off + v_off
+        return {
+            "distance_m": round(distance, 1),
+            "duration_s": round(distance / self.speed_mps),
+            "path": [list(start), *coords, list(end)],
+            "on_network": True,
+        }
+
+    def _node_path(self, u, v):
+        """ノード u → v の (座標列, 長さ m)。つながっていなければ None"""
+        key = (u, v)
+        cached = self._legs.get(key)
+        if cached is not None:
+            return cached or None
+        try:
+            nodes = nx.shortest_path(self.graph, u, v, weight="length")
+        except nx.NetworkXNoPath:
+            self._legs.put(key, ())
+            return None
+
+        coords = [self.node_latlng(u)]
+        length = 0.0
+        for a, b in zip(nodes, nodes[1:]):
+            edge = self.graph.edges[a, b]
+            length += edge["length"]
+            geometry = edge["geometry"]
+            # 辺の形状は保存時の向きなので、逆向きに通るときは反転する
+            if geometry and geometry[0] != self.node_latlng(a):
+                geometry = geometry[::-1]
+            coords.extend(geometry[1:-1])
+            coords.append(self.node_latlng(b))
+        result = ([list(c) for c in coords], length)
+        self._legs.put(key, result)
+        # 歩行者用の無向グラフなので逆向きも同じ経路
+        self._legs.put((v, u), (result[0][::-1], length))
+        return result
+
+    def _straight(self, start, end):
+        distance = float(haversine_m(*start, *end))
+        return {
+            "distance_m": round(distance, 1),
+            "duration_s": round(distance / self.speed_mps),
+            "path": [list(start), list(end)],
+            "on_network": False,
+        }
+
+    def route(self, stops):
+        """経由地 [(lat, lng), ...] を順に結ぶ区間ごとの経路と合計を返す"""
+        legs = [self.leg(a, b) for a, b in zip(stops, stops[1:])]
+        return {
+            "distance_m": round(sum(leg["distance_m"] for leg in legs), 1),
+            "duration_s": sum(leg["duration_s"] for leg in legs),
+            "legs": legs,
+        }
+
+
+def _edge_coords(graph, u, v, data):
+    """辺の形状を (lat, lng) の並びにする。形状がなければ両端のノードだけ"""
+    geometry = data.get("geometry")
+    if geometry is not None:
+        return [(lat, lng) for lng, lat in geometry.coords]
+    return [(float(graph.nodes[n]["y"]), float(graph.nodes[n]["x"])) for n in (u, v)]
+
+
+def load_graph(path):
+    """osmnx の GraphML を読み込む(osmnx の読み込みは重いので使うときだけ import する)"""
+    import osmnx
+
+    return osmnx.load_graphml(path)
+
+
+walk_graph = None
+
+
+def init_walk_graph(app):
+    """WALK_GRAPH_PATH の地図データを読み込む。ファイルがなければ徒歩経路は使えない(503)"""
+    global walk_graph
+    path = app.config.get("WALK_GRAPH_PATH") or DEFAULT_GRAPH_PATH
+    if not os.path.exists(path):
+        app.logger.warning(f"徒歩経路の地図データがありません: {path}(flask walk download-graph で取得できます)")
+        return None
+    graph = load_graph(path)
+    walk_graph = WalkGraph(
+        graph,
+        speed_kmh=app.config.get("WALK_SPEED_KMH", DEFAULT_WALK_SPEED_KMH),
+        cache_size=app.config.get("WALK_PATH_CACHE_SIZE", 4096),
+    )
+    app.logger.info(f"徒歩経路の地図データを読み込みました(ノード {len(walk_graph.node_ids)} 件)")
+    return walk_graph
+
+
+def get_walk_graph():
+    return walk_graph